@@ -1,9 +1,6 @@
-from google import genai
+import hashlib
 import os
 import time
-from dotenv import load_dotenv
-
-load_dotenv()
 
 # List of models to try in order of preference
 AVAILABLE_MODELS = [
@@ -16,10 +13,22 @@ AVAILABLE_MODELS = [
     'gemini-1.5-flash'
 ]
 
+# Overridable so load tests can point the agent at a local stand-in
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+
+# How long a model is skipped after a 429; shared by every request and worker
+QUOTA_COOLDOWN_SECONDS = 60
+
+# Per-attempt request timeout; the SDK's own default lets a hung call block for minutes
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "30"))
+
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+from backend.capture import record_gemini
+from backend.circuit_breaker import BREAKERS, CircuitOpen
+from backend.metrics import GEMINI_LATENCY, GEMINI_TOKENS, record_timing
+from backend.shared_state import get_store
+
 logger = logging.getLogger(__name__)
 
 class AIModel:
@@ -33,10 +42,18 @@ class AIModel:
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         self.client = None
         if self.api_key:
-            self.client = genai.Client(api_key=self.api_key)
+            # The SDK takes ~0.4s to import, so it is loaded on first use (or by warm-up)
+            from google import genai
+            from google.genai import types
+            
+            http_options = types.HttpOptions(base_url=GEMINI_BASE_URL, timeout=int(GEMINI_TIMEOUT_SECONDS * 1000))
+            self.client = genai.Client(api_key=self.api_key, http_options=http_options)
         
         self.models = AVAILABLE_MODELS
-        self.disabled_models = {} # model_name -> timestamp of last 429
+        self.breaker = BREAKERS["gemini"]
+        self.cooldowns = get_store()
+        # Quotas are per API key, so cooldowns are too (keyed by a digest, never the key itself)
+        self._quota_id = hashlib.sha256(self.api_key.encode("utf-8")).hexdigest()[:16] if self.api_key else ""
 
     def generate_response(self, prompt: str, context: str = None) -> str:
         """
@@ -56,38 +73,79 @@ class AIModel:
         if context:
             full_prompt = f"Context: {context}\nUser: {prompt}"
 
-        now = time.time()
         errors = []
         for model_name in self.models:
-            # Skip models on cooldown (60 seconds)
-            if model_name in self.disabled_models:
-                if now - self.disabled_models[model_name] < 60:
-                    continue
-                else:
-                    del self.disabled_models[model_name]
+            # Skip models on cooldown
+            if self.cooldowns.get(self._cooldown_key(model_name)) is not None:
+                continue
 
+            # Gemini itself is failing (not just one model's quota): give up without waiting
+            try:
+                self.breaker.allow()
+            except CircuitOpen as e:
+                logger.warning(f"Skipping Gemini: {e}")
+                break
+
+            started = time.perf_counter()
             try:
                 # logger.info(f"Trying model: {model_name}")
                 response = self.client.models.generate_content(
                     model=model_name,
                     contents=full_prompt
                 )
-                return response.text
             except Exception as e:
                 error_str = str(e)
                 if "429" in error_str or "Quota exceeded" in error_str:
+                    self.breaker.release()  # quotas are per model and handled by the cooldown
+                    record_gemini(model_name, 429, time.perf_counter() - started, error=error_str)
+                    self._record_attempt(model_name, "quota_exceeded", started)
                     logger.warning(f"Model {model_name} quota exceeded. Cooling down...")
-                    self.disabled_models[model_name] = time.time()
+                    self.cooldowns.set(self._cooldown_key(model_name), time.time(), ttl=QUOTA_COOLDOWN_SECONDS)
                     errors.append(f"{model_name}: Quota Exceeded")
                     continue
                 elif "404" in error_str or "not found" in error_str:
+                     self.breaker.release()
+                     record_gemini(model_name, 404, time.perf_counter() - started, error=error_str)
+                     self._record_attempt(model_name, "not_found", started)
                      logger.warning(f"Model {model_name} not found. Switching...")
                      errors.append(f"{model_name}: Not Found")
                      continue
                 else:
                     # For other errors, might not want to retry indefinitely, but let's try next model just in case
+                    self.breaker.record(False, time.perf_counter() - started)
+                    record_gemini(model_name, 500, time.perf_counter() - started, error=error_str)
+                    self._record_attempt(model_name, "error", started)
                     logger.error(f"Model {model_name} error: {e}")
                     errors.append(f"{model_name}: {e}")
                     continue
+            else:
+                # Only the API call is guarded above, so a bookkeeping error cannot be counted as a failed call too
+                self.breaker.record(True, time.perf_counter() - started)
+                self._record_attempt(model_name, "ok", started)
+                record_gemini(model_name, 200, time.perf_counter() - started, text=response.text)
+                self._record_usage(model_name, response)
+                return response.text
         
         return "I'm currently receiving a high volume of requests (Google API Quota Exceeded), so I cannot provide a live AI answer right now. However, I can still help you compare prices if you switch to the **Price Comparison** tab!"
+
+    def _cooldown_key(self, model_name: str) -> str:
+        return f"gemini_cooldown:{self._quota_id}:{model_name}"
+
+    @staticmethod
+    def _record_attempt(model_name: str, outcome: str, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        GEMINI_LATENCY.observe(elapsed, model=model_name, outcome=outcome)
+        record_timing(f"gemini_{model_name}", elapsed)
+
+    @staticmethod
+    def _record_usage(model_name: str, response) -> None:
+        """Count prompt/completion tokens reported by the API, when present."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+        completion_tokens = getattr(usage, "candidates_token_count", None) or 0
+        if prompt_tokens:
+            GEMINI_TOKENS.inc(prompt_tokens, model=model_name, kind="prompt")
+        if completion_tokens:
+            GEMINI_TOKENS.inc(completion_tokens, model=model_name, kind="completion")
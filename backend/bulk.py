@@ -0,0 +1,150 @@
+"""
+Bulk price comparison, streamed as NDJSON.
+
+A batch is worked through by a fixed number of concurrent workers. Every
+result is written out as one JSON line as soon as it is ready, so memory
+stays bounded by the worker count rather than the batch size. All bulk
+batches in a process draw scrapes from one shared rate budget, and each
+batch has an overall deadline: items not started by then are reported as
+"deadline_exceeded" instead of being scraped. Items are also paced by the
+client's own scrape quota (backend.quotas), and their blocking work queues
+fairly with other clients', so a large batch does not slow interactive users.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from backend.ai_agent import AIModel
+from backend.concurrency import CLIENT_ID, DEADLINE, run_blocking
+from backend.quotas import QUOTAS, payer
+from backend.responses import dumps
+from backend.scraper import custom_scraper
+
+logger = logging.getLogger(__name__)
+
+MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "5000"))
+DEFAULT_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "4"))
+MAX_CONCURRENCY = 16
+DEFAULT_DEADLINE_SECONDS = float(os.getenv("BULK_DEADLINE_SECONDS", "300"))
+# The longest deadline a caller may ask for; a batch holds a bulk slot until then
+MAX_DEADLINE_SECONDS = float(os.getenv("BULK_MAX_DEADLINE_SECONDS", "900"))
+# Scrapes per second across all bulk batches in this process, and how many may burst
+SCRAPE_RATE = float(os.getenv("BULK_SCRAPE_RATE", "5"))
+SCRAPE_BURST = int(os.getenv("BULK_SCRAPE_BURST", "5"))
+
+
+class RateBudget:
+    """Async token bucket: at most `rate` acquisitions per second, bursting to `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def acquire(self, deadline: float) -> bool:
+        """Wait for a token; returns False if one would not be available before `deadline`."""
+        # No await before the token is claimed, so this is atomic on the event loop
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        if now + wait > deadline:
+            return False
+        # Going negative reserves a future token, so later callers wait longer
+        self.tokens -= 1
+        if wait:
+            await asyncio.sleep(wait)
+        return True
+
+
+SCRAPE_BUDGET = RateBudget(SCRAPE_RATE, SCRAPE_BURST)
+
+
+async def _compare_one(index: int, item: Dict, deadline: float, summarize: bool,
+                       api_key: Optional[str], client: str = "") -> Dict:
+    line = {"index": index, "id": item.get("id"), "query": item["query"], "country_code": item["country_code"]}
+    if not await QUOTAS.wait(client, "scrape", deadline) or not await SCRAPE_BUDGET.acquire(deadline):
+        return {**line, "status": "deadline_exceeded"}
+    try:
+        data = await asyncio.wait_for(
+            run_blocking("scrape", custom_scraper, item["query"], country_code=item["country_code"]),
+            timeout=max(0.0, deadline - time.monotonic()),
+        )
+    except (asyncio.TimeoutError, TimeoutError):
+        return {**line, "status": "deadline_exceeded"}
+    except Exception as e:
+        logger.error(f"Bulk item {index} ({item['query']!r}) failed: {e}")
+        return {**line, "status": "error", "error": str(e)}
+
+    line.update(status="ok", data=data)
+    if summarize and data and QUOTAS.allow(payer(client, api_key), "llm"):
+        try:
+            agent = AIModel(api_key=api_key)
+            prompt = f"Here is a list of product prices found for '{item['query']}': {data}. Please give a very brief recommendation on the best deal. Do not use markdown tables, just text."
+            line["summary"] = await run_blocking("llm", agent.generate_response, prompt)
+        except Exception as e:
+            logger.error(f"Bulk item {index} summary failed: {e}")
+    return line
+
+
+async def stream_bulk_prices(
+    items: List[Dict],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    deadline_seconds: float = DEFAULT_DEADLINE_SECONDS,
+    summarize: bool = False,
+    api_key: Optional[str] = None,
+    client: str = ""
+) -> AsyncIterator[bytes]:
+    """
+    Compare prices for every item, yielding one NDJSON line per item in completion order.
+
+    Args:
+        items: Dicts with "query", "country_code" and an optional caller-supplied "id"
+        concurrency: Items processed at once
+        deadline_seconds: Budget for the whole batch
+        summarize: Also ask the LLM for a per-item recommendation
+        api_key: Gemini API key for summaries
+        client: Client the batch is for, for quotas and fair scheduling
+
+    Yields:
+        JSON lines; the last one is a {"done": true, ...} tally
+    """
+    CLIENT_ID.set(client)  # inherited by the worker tasks
+    started = time.monotonic()
+    deadline = started + deadline_seconds
+    DEADLINE.set(deadline)  # cache waits in worker threads give up with the batch
+    results: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    pending = iter(enumerate(items))
+
+    async def worker() -> None:
+        for index, item in pending:
+            if time.monotonic() >= deadline:
+                line = {"index": index, "id": item.get("id"), "query": item["query"],
+                        "country_code": item["country_code"], "status": "deadline_exceeded"}
+            else:
+                line = await _compare_one(index, item, deadline, summarize, api_key, client)
+            await results.put(line)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(items))))]
+    counts: Dict[str, int] = {}
+    try:
+        for _ in range(len(items)):
+            line = await results.get()
+            counts[line["status"]] = counts.get(line["status"], 0) + 1
+            yield dumps(line) + b"\n"
+    finally:
+        # Also runs when the client disconnects mid-stream
+        for task in workers:
+            task.cancel()
+
+    yield dumps({
+        "done": True,
+        "total": len(items),
+        "ok": counts.get("ok", 0),
+        "errors": counts.get("error", 0),
+        "deadline_exceeded": counts.get("deadline_exceeded", 0),
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+    }) + b"\n"
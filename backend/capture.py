@@ -0,0 +1,216 @@
+"""
+Opt-in capture of production traffic for offline replay.
+
+With CAPTURE_PATH set, every /api/ request is appended to a JSONL log as one
+line holding:
+  - the request: method, path, query string and JSON body, with API keys
+    (api_key, google_api_key, key) removed;
+  - the response status and total duration;
+  - the per-stage timings (the same breakdown as the Server-Timing header);
+  - every upstream response the request caused, in order: eBay pages and
+    Places responses with status, validators and body, and Gemini answers
+    with model and text, each with its latency.
+
+loadtest/replay.py feeds such a log back into the app with the upstreams
+served from the recording. Lines are written by a background thread, and the
+file is rotated at CAPTURE_MAX_BYTES, keeping CAPTURE_BACKUPS old files. With
+several workers, put "{pid}" in CAPTURE_PATH so each writes its own file.
+WebSocket chat is not captured.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.metrics import current_timings
+
+CAPTURE_PATH = os.getenv("CAPTURE_PATH")
+CAPTURE_MAX_BYTES = int(os.getenv("CAPTURE_MAX_BYTES", str(100 * 1024 * 1024)))
+CAPTURE_BACKUPS = int(os.getenv("CAPTURE_BACKUPS", "5"))
+CAPTURE_SAMPLE_RATE = float(os.getenv("CAPTURE_SAMPLE_RATE", "1"))
+# Larger bodies are cut short (and marked truncated) to keep the log manageable
+CAPTURE_MAX_BODY_BYTES = int(os.getenv("CAPTURE_MAX_BODY_BYTES", str(4 * 1024 * 1024)))
+
+SECRET_FIELDS = {"api_key", "google_api_key", "key"}
+# Response headers replay needs to behave like the upstream
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+# Upstream responses for the request being captured; None when not capturing.
+# Shared with worker threads because run_blocking copies the context into them.
+_upstream_calls: ContextVar[Optional[List[Dict]]] = ContextVar("upstream_calls", default=None)
+
+
+def sanitize(value: Any) -> Any:
+    """Copy of a JSON value with secret fields removed at any depth."""
+    if isinstance(value, dict):
+        return {k: sanitize(v) for k, v in value.items() if k not in SECRET_FIELDS}
+    if isinstance(value, list):
+        return [sanitize(v) for v in value]
+    return value
+
+
+def _sanitize_query_string(query_string: str) -> str:
+    return urlencode([(k, v) for k, v in parse_qsl(query_string, keep_blank_values=True) if k not in SECRET_FIELDS])
+
+
+def _clip(text: str, entry: Dict) -> str:
+    if len(text) > CAPTURE_MAX_BODY_BYTES:
+        entry["truncated"] = True
+        return text[:CAPTURE_MAX_BODY_BYTES]
+    return text
+
+
+def record_http(upstream: str, url: str, params: Optional[Dict], response, seconds: float) -> None:
+    """Remember a requests.Response from an upstream for the request being captured."""
+    calls = _upstream_calls.get()
+    if calls is None:
+        return
+    entry = {
+        "upstream": upstream,
+        "url": url,
+        "params": sanitize(dict(params or {})),
+        "status": response.status_code,
+        "headers": {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+        "elapsed_ms": round(seconds * 1000, 2),
+    }
+    entry["body"] = _clip(response.text, entry)
+    calls.append(entry)
+
+
+def record_gemini(model: str, status: int, seconds: float, text: Optional[str] = None,
+                  error: Optional[str] = None) -> None:
+    """Remember one Gemini attempt (its answer, or the error) for the request being captured."""
+    calls = _upstream_calls.get()
+    if calls is None:
+        return
+    entry = {"upstream": "gemini", "model": model, "status": status, "elapsed_ms": round(seconds * 1000, 2)}
+    if text is not None:
+        entry["text"] = _clip(text, entry)
+    if error is not None:
+        entry["error"] = error[:500]
+    calls.append(entry)
+
+
+class _JsonLineFormatter(logging.Formatter):
+    """Serializes the captured dict carried as the record's msg, in the writer thread."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg, ensure_ascii=False, separators=(",", ":"))
+
+
+class CaptureLog:
+    """
+    Rotating JSONL file written from a background thread, so requests never wait on disk.
+
+    Records are queued as dicts and only serialized by the writer thread;
+    a capture with multi-MB upstream bodies costs the event loop nothing.
+    """
+
+    def __init__(self, path: str, max_bytes: int = CAPTURE_MAX_BYTES, backups: int = CAPTURE_BACKUPS):
+        path = path.replace("{pid}", str(os.getpid()))
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                       encoding="utf-8")
+        handler.setFormatter(_JsonLineFormatter())
+        self.path = path
+        self._queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=10000)
+        self._listener = logging.handlers.QueueListener(self._queue, handler)
+        self._listener.start()
+
+    def write(self, record: Dict) -> None:
+        """Queue one capture; the dict must not be changed afterwards."""
+        try:
+            self._queue.put_nowait(logging.makeLogRecord({"msg": record}))
+        except queue.Full:
+            pass  # the writer is behind; dropping a capture beats stalling a request
+
+    def close(self) -> None:
+        self._listener.stop()  # flushes what is queued
+
+
+_log: Optional[CaptureLog] = None
+_log_lock = threading.Lock()
+
+
+def get_log() -> Optional[CaptureLog]:
+    """The capture log for this process, opened on first use; None when capture is off."""
+    global _log
+    if _log is None and CAPTURE_PATH:
+        with _log_lock:
+            if _log is None:
+                _log = CaptureLog(CAPTURE_PATH)
+    return _log
+
+
+def close() -> None:
+    global _log
+    if _log is not None:
+        _log.close()
+        _log = None
+
+
+class CaptureMiddleware:
+    """Append each /api/ request, with its upstream responses and stage timings, to the capture log."""
+
+    def __init__(self, app: ASGIApp, log: Optional[CaptureLog] = None):
+        self.app = app
+        self.log = log
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        log = self.log or get_log()
+        if (log is None or scope["type"] != "http" or not scope["path"].startswith("/api/")
+                or (CAPTURE_SAMPLE_RATE < 1 and random.random() >= CAPTURE_SAMPLE_RATE)):
+            await self.app(scope, receive, send)
+            return
+
+        body = bytearray()
+        status = 500
+        started = time.time()
+        start = time.perf_counter()
+
+        async def receive_wrapper() -> Message:
+            message = await receive()
+            if message["type"] == "http.request" and len(body) <= CAPTURE_MAX_BODY_BYTES:
+                body.extend(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        calls: List[Dict] = []
+        token = _upstream_calls.set(calls)
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            _upstream_calls.reset(token)
+            log.write({
+                "ts": started,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query_string": _sanitize_query_string(scope.get("query_string", b"").decode("latin-1")),
+                "body": _decode_body(bytes(body)),
+                "status": status,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                "stages": [[stage, round(seconds * 1000, 2)] for stage, seconds in (current_timings() or [])],
+                "upstream": calls,
+            })
+
+
+def _decode_body(body: bytes) -> Any:
+    if not body:
+        return None
+    try:
+        return sanitize(json.loads(body))
+    except ValueError:
+        return None  # only JSON bodies are kept; anything else could not be sanitized
@@ -0,0 +1,110 @@
+"""
+Product-category classification shared by the store finder and the scraper.
+
+All keywords live in one table and are compiled into a single regex
+alternation, so a query is classified in one left-to-right scan no matter how
+many keywords there are. Results are memoized per normalized query.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# keyword -> (category, product). Matching is by substring, like the original
+# per-function checks; the longest keyword wins at a given position, so
+# "headphones" is never read as "phone" and "macbook" never as "book".
+KEYWORDS: Dict[str, Tuple[str, Optional[str]]] = {
+    # Electronics
+    "laptop": ("electronics", "laptop"),
+    "macbook": ("electronics", "laptop"),
+    "computer": ("electronics", None),
+    "iphone": ("electronics", "phone"),
+    "samsung": ("electronics", "phone"),
+    "phone": ("electronics", "phone"),
+    "headphone": ("electronics", "headphones"),
+    "earbuds": ("electronics", "headphones"),
+    "television": ("electronics", "tv"),
+    "tv": ("electronics", "tv"),
+    "camera": ("electronics", None),
+    "electronics": ("electronics", None),
+    # Books
+    "book": ("books", "book"),
+    "novel": ("books", None),
+    "magazine": ("books", None),
+    # Clothing
+    "shirt": ("clothing", None),
+    "pants": ("clothing", None),
+    "dress": ("clothing", None),
+    "clothing": ("clothing", None),
+    "shoes": ("clothing", None),
+    "fashion": ("clothing", None),
+    # Grocery
+    "food": ("grocery", None),
+    "grocery": ("grocery", None),
+    "snack": ("grocery", None),
+}
+
+# When a query mentions several categories/products, the earliest entry wins
+CATEGORY_PRIORITY = ["electronics", "books", "clothing", "grocery"]
+PRODUCT_PRIORITY = ["laptop", "phone", "headphones", "tv", "book"]
+DEFAULT_CATEGORY = "general"
+
+# Google Places types to search, per category
+STORE_TYPES: Dict[str, List[str]] = {
+    "electronics": ["electronics_store", "store", "shopping_mall"],
+    "books": ["book_store", "store"],
+    "clothing": ["clothing_store", "shoe_store", "store"],
+    "grocery": ["grocery_or_supermarket", "supermarket", "store"],
+    "general": ["store", "shopping_mall", "department_store"],
+}
+
+# Typical USD price range, per product
+PRICE_RANGES: Dict[str, Tuple[int, int]] = {
+    "laptop": (500, 2500),
+    "phone": (200, 1500),
+    "headphones": (50, 400),
+    "tv": (300, 2000),
+    "book": (10, 50),
+}
+DEFAULT_PRICE_RANGE = (20, 500)
+
+_KEYWORD_PATTERN = re.compile(
+    "|".join(re.escape(word) for word in sorted(KEYWORDS, key=len, reverse=True))
+)
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryCategory(NamedTuple):
+    category: str
+    product: Optional[str] = None
+
+    @property
+    def store_types(self) -> List[str]:
+        return STORE_TYPES[self.category]
+
+    @property
+    def price_range(self) -> Tuple[int, int]:
+        return PRICE_RANGES.get(self.product, DEFAULT_PRICE_RANGE)
+
+
+def normalize_query(query: str) -> str:
+    return _WHITESPACE.sub(" ", query.strip().lower())
+
+
+def classify_query(query: str) -> QueryCategory:
+    """Classify a product query into a store category and (if known) a product type."""
+    return _classify_normalized(normalize_query(query))
+
+
+@lru_cache(maxsize=4096)
+def _classify_normalized(query: str) -> QueryCategory:
+    categories = set()
+    products = set()
+    for match in _KEYWORD_PATTERN.finditer(query):
+        category, product = KEYWORDS[match.group(0)]
+        categories.add(category)
+        if product:
+            products.add(product)
+
+    category = next((c for c in CATEGORY_PRIORITY if c in categories), DEFAULT_CATEGORY)
+    product = next((p for p in PRODUCT_PRIORITY if p in products), None)
+    return QueryCategory(category, product)
@@ -0,0 +1,189 @@
+"""
+Circuit breakers for the upstream services (eBay, Google Places, Gemini).
+
+Each breaker watches a rolling time window of calls to one upstream. A call
+counts as failed if it raised, returned an error status, or took longer than
+the upstream's slow-call threshold. Once the window holds at least
+`min_calls` calls and the failure rate reaches `failure_threshold`, the
+breaker opens: calls fail immediately with CircuitOpen for `open_seconds`,
+so an outage costs callers microseconds instead of a full timeout. Then one
+probe call at a time is let through (half-open); a success closes the
+breaker again and a failure re-opens it.
+
+Breakers are per worker process. Each worker trips within a few calls, so
+the state does not need to be shared.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from backend.metrics import CIRCUIT_REJECTED, CIRCUIT_STATE
+
+T = TypeVar("T")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"'{name}' circuit is open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Rolling-window circuit breaker; thread-safe.
+
+    Usage:
+        breaker.call(requests.get, url, is_failure=lambda r: r.status_code >= 500)
+    or, when the outcome is only known later:
+        breaker.allow(); ...; breaker.record(ok, seconds)  # or breaker.release()
+    """
+
+    def __init__(self, name: str, window_seconds: float = 30, min_calls: int = 5,
+                 failure_threshold: float = 0.5, slow_call_seconds: float = 5, open_seconds: float = 15):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probing = False
+        self._calls: Deque[Tuple[float, bool, float]] = deque(maxlen=1024)  # (finished at, ok, seconds)
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, upstream=name)
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        CIRCUIT_STATE.set(_STATE_VALUES[state], upstream=self.name)
+
+    def allow(self) -> None:
+        """Admit one call, or raise CircuitOpen."""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    CIRCUIT_REJECTED.inc(upstream=self.name)
+                    raise CircuitOpen(self.name, remaining)
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    CIRCUIT_REJECTED.inc(upstream=self.name)
+                    raise CircuitOpen(self.name, self.open_seconds)
+                self._probing = True
+
+    def release(self) -> None:
+        """End an admitted call whose outcome says nothing about upstream health."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool, seconds: float) -> None:
+        """End an admitted call with its outcome; slow successes count as failures."""
+        ok = ok and seconds <= self.slow_call_seconds
+        now = time.monotonic()
+        with self._lock:
+            self._probing = False
+            if self.state == HALF_OPEN:
+                if ok:
+                    self._calls.clear()
+                    self._set_state(CLOSED)
+                else:
+                    self._trip(now)
+                self._calls.append((now, ok, seconds))
+                return
+
+            self._calls.append((now, ok, seconds))
+            self._expire(now)
+            if self.state == CLOSED and len(self._calls) >= self.min_calls:
+                failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+                if failures / len(self._calls) >= self.failure_threshold:
+                    self._trip(now)
+
+    def _trip(self, now: float) -> None:
+        self.opened_at = now
+        self._set_state(OPEN)
+
+    def _expire(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def call(self, func: Callable[..., T], *args,
+             is_failure: Optional[Callable[[T], bool]] = None, **kwargs) -> T:
+        """Run func through the breaker; exceptions and is_failure(result) count as failures."""
+        self.allow()
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            self.record(False, time.perf_counter() - started)
+            raise
+        self.record(not (is_failure and is_failure(result)), time.perf_counter() - started)
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        """State and recent call statistics, for /health?deep=true."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            calls = list(self._calls)
+            state = self.state
+            retry_in = max(0.0, self.opened_at + self.open_seconds - now) if state == OPEN else 0.0
+        latencies = sorted(seconds for _, _, seconds in calls)
+        failures = sum(1 for _, ok, _ in calls if not ok)
+        return {
+            "state": state,
+            "calls": len(calls),
+            "failure_rate": round(failures / len(calls), 3) if calls else 0.0,
+            "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+            "retry_in_s": round(retry_in, 1),
+        }
+
+
+def _percentile(ordered, p: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def http_failed(response) -> bool:
+    """Server errors and rate limiting count against the upstream; other 4xx do not."""
+    return response.status_code >= 500 or response.status_code == 429
+
+
+def _breaker(name: str, slow_call_seconds: float) -> CircuitBreaker:
+    prefix = f"BREAKER_{name.upper()}_"
+    return CircuitBreaker(
+        name,
+        window_seconds=float(os.getenv(prefix + "WINDOW", "30")),
+        min_calls=int(os.getenv(prefix + "MIN_CALLS", "5")),
+        failure_threshold=float(os.getenv(prefix + "FAILURE_THRESHOLD", "0.5")),
+        slow_call_seconds=float(os.getenv(prefix + "SLOW_SECONDS", slow_call_seconds)),
+        open_seconds=float(os.getenv(prefix + "OPEN_SECONDS", "15")),
+    )
+
+
+# Env overrides: BREAKER_<NAME>_{WINDOW,MIN_CALLS,FAILURE_THRESHOLD,SLOW_SECONDS,OPEN_SECONDS}
+BREAKERS: Dict[str, CircuitBreaker] = {
+    "ebay": _breaker("ebay", 5),
+    "places": _breaker("places", 3),
+    "gemini": _breaker("gemini", 20),
+}
+
+
+def call_upstream(name: str, func: Callable[..., T], *args,
+                  is_failure: Optional[Callable[[T], bool]] = None, **kwargs) -> T:
+    """Call through the named upstream's breaker (or directly, for upstreams without one)."""
+    breaker = BREAKERS.get(name)
+    if breaker is None:
+        return func(*args, **kwargs)
+    return breaker.call(func, *args, is_failure=is_failure, **kwargs)
@@ -0,0 +1,296 @@
+"""
+Admission control and bounded executors for the API.
+
+Every expensive endpoint holds a slot from its AdmissionLimiter while it runs.
+When all slots are busy, requests wait in a short bounded queue; once the queue
+is full, or a request has waited longer than the queue timeout, it is shed
+immediately with ServiceOverloaded (served as 503 + Retry-After) rather than
+piling up behind slow upstreams.
+
+Blocking calls (requests, BeautifulSoup, the Gemini SDK) never run on the event
+loop. They go to a fixed-size thread pool per kind of work, so a slow LLM cannot
+starve scraping and /health always has a free event loop to answer on.
+
+Both queues are fair across clients (CLIENT_ID, set per request): waiting work
+is kept per client and served round-robin, so a client with many requests
+queued (e.g. a bulk batch) delays another client's next request by at most
+one turn, not by its whole backlog. A single client may also only hold part
+of a limiter's queue.
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import math
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Optional, Set, TypeVar
+
+from backend.profiling import run_tracked
+
+T = TypeVar("T")
+
+# Who the current request is for (see backend.quotas.identify); "" when unknown
+CLIENT_ID: ContextVar[str] = ContextVar("client_id", default="")
+
+# time.monotonic() by which the caller needs its answer; None when it has no budget.
+# Blocking code that waits on others (e.g. shared_state leases) gives up by then.
+DEADLINE: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class ServiceOverloaded(Exception):
+    """Raised when a request cannot be admitted in time."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"'{name}' is at capacity, retry in {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class FairQueue:
+    """Waiters grouped by client: FIFO within a client, round-robin across clients."""
+
+    def __init__(self):
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def count(self, client: str) -> int:
+        return len(self._queues.get(client, ()))
+
+    def push(self, client: str, waiter: asyncio.Future) -> None:
+        self._queues.setdefault(client, deque()).append(waiter)
+        self._size += 1
+
+    def pop(self) -> Optional[asyncio.Future]:
+        """The next client's oldest waiter; that client then goes to the back of the line."""
+        if not self._queues:
+            return None
+        client, queue = next(iter(self._queues.items()))
+        waiter = queue.popleft()
+        if queue:
+            self._queues.move_to_end(client)
+        else:
+            del self._queues[client]
+        self._size -= 1
+        return waiter
+
+    def remove(self, client: str, waiter: asyncio.Future) -> None:
+        queue = self._queues.get(client)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[client]
+        self._size -= 1
+
+
+class AdmissionLimiter:
+    """
+    Caps in-flight requests for one endpoint, with a bounded fair wait queue.
+
+    Usage:
+        async with limiter:
+            ...
+    """
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: int, queue_timeout: float,
+                 max_queue_per_client: Optional[int] = None):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue if max_queue_per_client is None else max_queue_per_client
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters = FairQueue()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.queue_timeout))
+
+    async def acquire(self, client: Optional[str] = None) -> None:
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return
+
+        client = CLIENT_ID.get() if client is None else client
+        if len(self._waiters) >= self.max_queue or self._waiters.count(client) >= self.max_queue_per_client:
+            raise ServiceOverloaded(self.name, self.retry_after)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.push(client, waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            self._abandon(client, waiter)
+            raise
+
+        if not waiter.done():
+            self._abandon(client, waiter)
+            raise ServiceOverloaded(self.name, self.retry_after)
+        # The releasing request handed its slot straight to us
+
+    def _abandon(self, client: str, waiter: asyncio.Future) -> None:
+        if waiter.done() and not waiter.cancelled():
+            # A slot was handed over just as we gave up - pass it on
+            self.release()
+            return
+        waiter.cancel()
+        self._waiters.remove(client, waiter)
+
+    def release(self) -> None:
+        waiter = self._waiters.pop()
+        while waiter is not None:
+            if not waiter.done():
+                waiter.set_result(None)  # slot changes hands, in_flight unchanged
+                return
+            waiter = self._waiters.pop()
+        self.in_flight -= 1
+
+    async def __aenter__(self) -> "AdmissionLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": self.in_flight, "queued": self.queued, "max_in_flight": self.max_in_flight}
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+
+# One limiter per endpoint; by default one client may hold a quarter of the queue.
+# Env overrides: MAX_IN_FLIGHT_<NAME>, MAX_QUEUE_<NAME>, MAX_QUEUE_PER_CLIENT_<NAME>
+LIMITERS: Dict[str, AdmissionLimiter] = {
+    name: AdmissionLimiter(
+        name,
+        max_in_flight=_env_int(f"MAX_IN_FLIGHT_{name.upper()}", in_flight),
+        max_queue=_env_int(f"MAX_QUEUE_{name.upper()}", queue),
+        queue_timeout=QUEUE_TIMEOUT,
+        max_queue_per_client=_env_int(f"MAX_QUEUE_PER_CLIENT_{name.upper()}", max(1, queue // 4)),
+    )
+    for name, in_flight, queue in [
+        ("general", 16, 32),
+        ("price", 8, 16),
+        ("nearby", 8, 16),
+        ("bulk", 2, 4),
+    ]
+}
+
+# One thread pool per kind of blocking work. Env overrides: <KIND>_WORKERS
+EXECUTORS: Dict[str, ThreadPoolExecutor] = {
+    kind: ThreadPoolExecutor(max_workers=_env_int(f"{kind.upper()}_WORKERS", workers), thread_name_prefix=kind)
+    for kind, workers in [
+        ("scrape", 8),
+        ("pages", 8),  # extra eBay result pages, fetched from inside scrape jobs
+        ("places", 8),
+        ("llm", 16),
+        ("admin", 2),
+    ]
+}
+
+
+# Executor jobs currently running, for draining at shutdown. These are the
+# executor's own futures, which stay pending until the thread finishes even
+# if the request awaiting them was cancelled.
+_IN_FLIGHT: Set[concurrent.futures.Future] = set()
+
+
+class FairDispatcher:
+    """
+    Feeds one thread pool no more calls than it has threads.
+
+    Calls beyond that wait here rather than in the pool's own FIFO queue, so
+    the next free thread goes to the next client in round-robin order.
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor):
+        self.executor = executor
+        self.workers = executor._max_workers
+        self.running = 0
+        self._waiters = FairQueue()
+
+    async def run(self, call: Callable[[], T], client: str) -> T:
+        loop = asyncio.get_running_loop()
+        if self.running < self.workers and not self._waiters:
+            self.running += 1
+        else:
+            waiter = loop.create_future()
+            self._waiters.push(client, waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._next()  # handed a thread just as we gave up - pass it on
+                else:
+                    self._waiters.remove(client, waiter)
+                raise
+
+        try:
+            job = self.executor.submit(call)
+        except BaseException:
+            self._next()
+            raise
+        _IN_FLIGHT.add(job)
+        job.add_done_callback(_IN_FLIGHT.discard)
+        # The thread is released when the job finishes, not when this await
+        # does: a cancelled request must not hand a still-busy thread on
+        job.add_done_callback(lambda _: self._release(loop))
+        return await asyncio.shield(asyncio.wrap_future(job, loop=loop))
+
+    def _release(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Called in the worker thread when a job finishes."""
+        try:
+            loop.call_soon_threadsafe(self._next)
+        except RuntimeError:
+            pass  # loop already closed; nothing left to schedule
+
+    def _next(self) -> None:
+        waiter = self._waiters.pop()
+        while waiter is not None:
+            if not waiter.done():
+                waiter.set_result(None)  # thread changes hands, running unchanged
+                return
+            waiter = self._waiters.pop()
+        self.running -= 1
+
+
+DISPATCHERS: Dict[str, FairDispatcher] = {kind: FairDispatcher(executor) for kind, executor in EXECUTORS.items()}
+
+
+async def run_blocking(kind: str, func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Run a blocking function on the bounded executor for `kind`.
+
+    The caller's context variables are carried over to the worker thread.
+    When all threads are busy, the call queues fairly behind other clients'.
+    """
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, run_tracked, func, *args, **kwargs)
+    return await DISPATCHERS[kind].run(call, CLIENT_ID.get())
+
+
+async def drain(timeout: float) -> int:
+    """
+    Wait up to `timeout` seconds for in-flight blocking calls to finish.
+
+    Used at shutdown, so scrapes and LLM calls that outlived their request
+    (e.g. the client disconnected) still complete. Returns how many did not.
+    """
+    if not _IN_FLIGHT:
+        return 0
+    _, pending = await asyncio.wait([asyncio.wrap_future(job) for job in _IN_FLIGHT], timeout=timeout)
+    return len(pending)
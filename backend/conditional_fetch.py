@@ -0,0 +1,127 @@
+"""
+Incremental re-fetching of upstream pages.
+
+For every URL fetched through fetch_parsed() the shared store keeps the
+response validators (ETag, Last-Modified), a hash of the body and the parsed
+result. The next fetch of the same URL:
+  - sends If-None-Match / If-Modified-Since, and on 304 reuses the previous
+    parsed result without downloading or parsing anything;
+  - otherwise hashes the new body, and if it is byte-identical to the last
+    one (many upstreams ignore conditional headers) skips parsing and reuses
+    the previous result.
+
+So a cache refresh or background warm-up of unchanged data costs a
+round-trip and a hash instead of a full download and an HTML parse. The state
+is stored under a hash of the URL and its parameters, with credentials
+("key") left out.
+"""
+import hashlib
+import logging
+import os
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Optional
+
+from backend.capture import record_http
+from backend.circuit_breaker import call_upstream, http_failed
+from backend.metrics import CONDITIONAL_FETCHES, UPSTREAM_BYTES, stage_timer
+from backend.shared_state import get_store
+
+logger = logging.getLogger(__name__)
+
+CONDITIONAL_FETCH = os.getenv("CONDITIONAL_FETCH", "1") != "0"
+FETCH_STATE_TTL = float(os.getenv("FETCH_STATE_TTL", str(6 * 3600)))
+_SECRET_PARAMS = {"key", "api_key"}
+
+
+def state_key(url: str, params: Optional[Dict] = None, variant: Optional[str] = None) -> str:
+    """Store key for a URL, its query parameters (ignoring credentials) and the parse variant."""
+    parts = [url] + [f"{k}={v}" for k, v in sorted((params or {}).items()) if k not in _SECRET_PARAMS]
+    if variant is not None:
+        parts.append(f"#variant={variant}")
+    return "fetch:" + hashlib.sha1("&".join(parts).encode("utf-8")).hexdigest()
+
+
+def content_hash(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def fetch_parsed(
+    url: str,
+    parse: Callable[[Any], Any],
+    upstream: str,
+    params: Optional[Dict] = None,
+    headers: Optional[Dict] = None,
+    timeout: float = 10,
+    fetch_stage: Optional[str] = None,
+    parse_stage: Optional[str] = None,
+    variant: Optional[str] = None
+) -> Any:
+    """
+    GET a URL and parse it, reusing the previous result when it has not changed.
+
+    Args:
+        url: URL to fetch
+        parse: Turns the requests.Response into a JSON-compatible result
+        upstream: Upstream name for metrics and its circuit breaker ("ebay", "places")
+        params: Query parameters
+        headers: Request headers
+        timeout: Request timeout in seconds
+        fetch_stage: stage_timer name for the request (default "<upstream>_fetch")
+        parse_stage: stage_timer name for parsing (not timed if None)
+        variant: Whatever else `parse` depends on (e.g. a result limit), so
+            differently parsed results of the same URL are kept apart
+
+    Returns:
+        The parsed result, fresh or reused
+
+    Raises:
+        CircuitOpen: the upstream's breaker is open; nothing was sent
+    """
+    import requests
+
+    store = get_store()
+    key = state_key(url, params, variant)
+    state = store.get(key) if CONDITIONAL_FETCH else None
+
+    request_headers = dict(headers or {})
+    if state:
+        if state.get("etag"):
+            request_headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            request_headers["If-Modified-Since"] = state["last_modified"]
+
+    started = time.perf_counter()
+    with stage_timer(fetch_stage or f"{upstream}_fetch"):
+        response = call_upstream(upstream, requests.get, url, params=params, headers=request_headers,
+                                 timeout=timeout, is_failure=http_failed)
+    record_http(upstream, url, params, response, time.perf_counter() - started)
+    UPSTREAM_BYTES.inc(len(response.content), upstream=upstream)
+
+    if state and response.status_code == 304:
+        CONDITIONAL_FETCHES.inc(upstream=upstream, outcome="not_modified")
+        store.set(key, state, FETCH_STATE_TTL)
+        return state["parsed"]
+
+    digest = content_hash(response.content)
+    if state and response.status_code == 200 and state.get("content_hash") == digest:
+        outcome = "unchanged"
+        parsed = state["parsed"]
+    else:
+        with stage_timer(parse_stage) if parse_stage else nullcontext():
+            parsed = parse(response)
+        outcome = "changed" if state else "fetched"
+
+    if response.status_code != 200:
+        # Error pages are parsed as before but never remembered
+        outcome = "uncached"
+    elif CONDITIONAL_FETCH:
+        store.set(key, {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_hash": digest,
+            "parsed": parsed,
+        }, FETCH_STATE_TTL)
+
+    CONDITIONAL_FETCHES.inc(upstream=upstream, outcome=outcome)
+    return parsed
@@ -0,0 +1,327 @@
+"""
+Offline geocoding from a local gazetteer.
+
+Reads a GeoNames "cities" dump (tab-separated, e.g. cities15000.txt from
+https://download.geonames.org/export/dump/) and answers, with no network:
+  - forward lookups ("portland, me" -> places), from a sorted name index
+    searched by prefix with bisect
+  - reverse lookups (lat, lon -> nearest place), from a 1-degree spatial grid
+    searched ring by ring outwards
+
+GEONAMES_PATH selects the dump. By default a small sample in the same format,
+backend/data/cities_sample.tsv, is used; it only covers major cities.
+GEONAMES_ADMIN1_PATH may point at admin1CodesASCII.txt to show region names
+instead of codes.
+
+Queries the gazetteer cannot answer (smaller towns, postal codes, street
+addresses, or coordinates far from any listed place) fall back to Nominatim
+at NOMINATIM_URL, with answers cached in the shared store. Set NOMINATIM_URL
+to an empty string to stay fully offline.
+"""
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import islice
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from backend.capture import record_http
+from backend.location_service import calculate_distance
+from backend.shared_state import get_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cities_sample.tsv")
+GEONAMES_PATH = os.getenv("GEONAMES_PATH", DEFAULT_GAZETTEER)
+GEONAMES_ADMIN1_PATH = os.getenv("GEONAMES_ADMIN1_PATH")
+# Index alternate names (e.g. "Bombay"); roughly triples the index for full dumps
+INDEX_ALTERNATE_NAMES = os.getenv("GEOCODER_ALTERNATE_NAMES", "1") != "0"
+
+# Fallback for what the gazetteer does not know; empty disables it
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org").rstrip("/")
+NOMINATIM_CACHE_TTL = float(os.getenv("NOMINATIM_CACHE_TTL", "86400"))
+# Nominatim's usage policy asks every application to identify itself
+NOMINATIM_USER_AGENT = os.getenv("NOMINATIM_USER_AGENT", "Price-Comparison-ChatBOT/1.0")
+
+GRID_DEGREES = 1.0
+LON_CELLS = int(round(360 / GRID_DEGREES))
+MAX_REVERSE_KM = 300.0
+MAX_RINGS = 60  # bounds reverse lookups near the poles, where grid cells get narrow
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(text: str) -> str:
+    """Lowercase ASCII with punctuation folded to single spaces ("São Paulo" -> "sao paulo")."""
+    ascii_text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return _NON_ALNUM.sub(" ", ascii_text.lower()).strip()
+
+
+class Place(NamedTuple):
+    name: str
+    latitude: float
+    longitude: float
+    country_code: str
+    admin1: str
+    population: int
+
+    @property
+    def display_name(self) -> str:
+        return ", ".join(part for part in (self.name, self.admin1, self.country_code) if part)
+
+    def to_dict(self) -> Dict:
+        data = self._asdict()
+        data["display_name"] = self.display_name
+        return data
+
+
+class Gazetteer:
+    """
+    In-memory place index.
+
+    Places are held column-wise; the name index is a sorted list of
+    (normalized name, -population, row) so that a prefix range comes out
+    largest place first, and the grid maps (lat cell, lon cell) to rows.
+    """
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.country_codes: List[str] = []
+        self.admin1: List[str] = []
+        self.populations = array("q")
+        self._regions: List[Tuple[str, str]] = []  # normalized (admin1, country code), for qualifiers
+        self._index: List[Tuple[str, int, int]] = []
+        self._keys: List[str] = []
+        self._grid: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, name: str, latitude: float, longitude: float, country_code: str = "",
+            admin1: str = "", population: int = 0, alternate_names: Tuple[str, ...] = ()) -> None:
+        row = len(self.names)
+        self.names.append(name)
+        self.latitudes.append(latitude)
+        self.longitudes.append(longitude)
+        self.country_codes.append(country_code)
+        self.admin1.append(admin1)
+        self.populations.append(population)
+        self._regions.append((normalize_name(admin1), normalize_name(country_code)))
+        for key in {normalize_name(n) for n in (name, *alternate_names)}:
+            if key:
+                self._index.append((key, -population, row))
+        self._grid[self._cell(latitude, longitude)].append(row)
+
+    def finalize(self) -> "Gazetteer":
+        """Sort the name index; call once after the last add()."""
+        self._index.sort()
+        self._keys = [key for key, _, _ in self._index]
+        return self
+
+    @staticmethod
+    def _cell(latitude: float, longitude: float) -> Tuple[int, int]:
+        return int(math.floor(latitude / GRID_DEGREES)), Gazetteer._wrap(int(math.floor(longitude / GRID_DEGREES)))
+
+    @staticmethod
+    def _wrap(lon_cell: int) -> int:
+        """Longitude cell index folded into [-180°, 180°), so rings cross the antimeridian."""
+        return (lon_cell + LON_CELLS // 2) % LON_CELLS - LON_CELLS // 2
+
+    def place(self, row: int) -> Place:
+        return Place(self.names[row], self.latitudes[row], self.longitudes[row],
+                     self.country_codes[row], self.admin1[row], self.populations[row])
+
+    def search(self, query: str, limit: int = 5) -> List[Place]:
+        """
+        Places whose name starts with the query, exact matches first, then by population.
+
+        Anything after the first comma narrows the results by region or
+        country, e.g. "portland, me" or "cambridge, gb".
+        """
+        name, _, qualifier = query.partition(",")
+        prefix = normalize_name(name)
+        qualifiers = [normalize_name(q) for q in qualifier.split(",") if normalize_name(q)]
+        if not prefix:
+            return []
+
+        places = self._search_prefix(prefix, qualifiers, limit)
+        if not places and qualifiers:
+            # Unrecognised qualifier (e.g. "usa" rather than "us"): fall back to the name alone
+            places = self._search_prefix(prefix, [], limit)
+        return places
+
+    def _search_prefix(self, prefix: str, qualifiers: List[str], limit: int) -> List[Place]:
+        # Keys only hold [a-z0-9 ], so every key with this prefix sorts below prefix + "\x7f"
+        start = bisect_left(self._keys, prefix)
+        end = bisect_left(self._keys, prefix + "\x7f", start)
+        # Best rank per place over all its matching names: exact name first, then by population.
+        # The whole prefix range is ranked, so a short prefix still finds the largest places.
+        ranks: Dict[int, Tuple[bool, int]] = {}
+        for key, neg_population, row in islice(self._index, start, end):
+            rank = (key != prefix, neg_population)
+            if rank < ranks.get(row, (True, 1)) and self._matches(row, qualifiers):
+                ranks[row] = rank
+
+        rows = sorted(ranks, key=ranks.__getitem__)[:limit]
+        return [self.place(row) for row in rows]
+
+    def _matches(self, row: int, qualifiers: List[str]) -> bool:
+        return all(q in self._regions[row] for q in qualifiers)
+
+    def nearest(self, latitude: float, longitude: float,
+                max_km: float = MAX_REVERSE_KM) -> Optional[Tuple[Place, float]]:
+        """The closest place within max_km, with its distance in km, or None."""
+        center_lat, center_lon = self._cell(latitude, longitude)
+        best_row, best_km = None, max_km
+        # One grid ring is at least this many km away at this latitude (lon cells shrink poleward)
+        ring_km = 111.0 * GRID_DEGREES * max(math.cos(math.radians(min(abs(latitude) + GRID_DEGREES, 89.0))), 0.01)
+        max_ring = min(int(max_km / ring_km) + 1, MAX_RINGS)
+
+        for ring in range(max_ring + 1):
+            if best_row is not None and (ring - 1) * ring_km > best_km:
+                break
+            for cell in self._ring(center_lat, center_lon, ring):
+                for row in self._grid.get(cell, ()):
+                    km = calculate_distance(latitude, longitude, self.latitudes[row], self.longitudes[row])
+                    if km <= best_km:
+                        best_row, best_km = row, km
+
+        if best_row is None:
+            return None
+        return self.place(best_row), round(best_km, 2)
+
+    @staticmethod
+    def _ring(center_lat: int, center_lon: int, ring: int):
+        if ring == 0:
+            yield center_lat, center_lon
+            return
+        wrap = Gazetteer._wrap
+        for d in range(-ring, ring + 1):
+            yield center_lat - ring, wrap(center_lon + d)
+            yield center_lat + ring, wrap(center_lon + d)
+        for d in range(-ring + 1, ring):
+            yield center_lat + d, wrap(center_lon - ring)
+            yield center_lat + d, wrap(center_lon + ring)
+
+
+def _load_admin1_names(path: str) -> Dict[str, str]:
+    """admin1CodesASCII.txt rows: "US.NY<TAB>New York<TAB>New York<TAB>5128638"."""
+    names = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) >= 2:
+                names[parts[0]] = parts[1]
+    return names
+
+
+def load_geonames(path: str, admin1_path: Optional[str] = None) -> Gazetteer:
+    """Build a Gazetteer from a GeoNames cities dump."""
+    admin1_names = _load_admin1_names(admin1_path) if admin1_path else {}
+    gazetteer = Gazetteer()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) < 15:
+                continue
+            try:
+                latitude, longitude = float(parts[4]), float(parts[5])
+                population = int(parts[14] or 0)
+            except ValueError:
+                continue
+            country_code, admin1_code = parts[8], parts[10]
+            alternates = tuple(n for n in parts[3].split(",") if n) if INDEX_ALTERNATE_NAMES else ()
+            gazetteer.add(
+                parts[1], latitude, longitude, country_code,
+                admin1_names.get(f"{country_code}.{admin1_code}", admin1_code),
+                population, (parts[2],) + alternates,
+            )
+    return gazetteer.finalize()
+
+
+_gazetteer: Optional[Gazetteer] = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer:
+    """The process-wide gazetteer, loaded from GEONAMES_PATH on first use."""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = load_geonames(GEONAMES_PATH, GEONAMES_ADMIN1_PATH)
+                logger.info(f"Loaded {len(_gazetteer)} places from {GEONAMES_PATH}")
+    return _gazetteer
+
+
+def _nominatim_get(path: str, params: Dict):
+    """GET a Nominatim JSON endpoint; None if it fails or is turned off."""
+    if not NOMINATIM_URL:
+        return None
+    import requests
+
+    url = f"{NOMINATIM_URL}/{path}"
+    started = time.perf_counter()
+    try:
+        response = requests.get(url, params=params, headers={"User-Agent": NOMINATIM_USER_AGENT}, timeout=5)
+    except requests.RequestException as e:
+        logger.warning(f"Nominatim {path} failed: {e}")
+        return None
+    record_http("nominatim", url, params, response, time.perf_counter() - started)
+    if response.status_code != 200:
+        logger.warning(f"Nominatim {path} returned HTTP {response.status_code}")
+        return None
+    return response.json()
+
+
+def _nominatim_place(result: Dict) -> Place:
+    address = result.get("address", {})
+    # Addresses and postcodes have no name of their own; keep the leading part of the full label
+    name = result.get("name") or ", ".join(result.get("display_name", "").split(", ")[:2])
+    return Place(name, float(result["lat"]), float(result["lon"]),
+                 address.get("country_code", "").upper(), address.get("state", ""), 0)
+
+
+def nominatim_search(query: str, limit: int = 5) -> List[Place]:
+    """Forward lookup through Nominatim, cached in the shared store."""
+    def compute():
+        results = _nominatim_get("search", {"q": query, "format": "jsonv2", "limit": limit, "addressdetails": 1})
+        return [list(_nominatim_place(result)) for result in results or []]
+
+    key = f"nominatim:search:{normalize_name(query)}:{limit}"
+    return [Place(*row) for row in get_store().get_or_compute(key, NOMINATIM_CACHE_TTL, compute)]
+
+
+def nominatim_reverse(latitude: float, longitude: float) -> Optional[Tuple[Place, float]]:
+    """Reverse lookup (to town level) through Nominatim, cached in the shared store."""
+    def compute():
+        result = _nominatim_get("reverse", {"lat": latitude, "lon": longitude, "format": "jsonv2",
+                                            "zoom": 10, "addressdetails": 1})
+        if not result or "error" in result:
+            return None
+        return list(_nominatim_place(result))
+
+    key = f"nominatim:reverse:{round(latitude, 3)}:{round(longitude, 3)}"
+    row = get_store().get_or_compute(key, NOMINATIM_CACHE_TTL, compute)
+    if row is None:
+        return None
+    place = Place(*row)
+    return place, round(calculate_distance(latitude, longitude, place.latitude, place.longitude), 2)
+
+
+def search(query: str, limit: int = 5) -> List[Place]:
+    """Places matching the query from the gazetteer, or from Nominatim when it has none."""
+    return get_gazetteer().search(query, limit=limit) or nominatim_search(query, limit)
+
+
+def reverse(latitude: float, longitude: float) -> Optional[Tuple[Place, float]]:
+    """The nearest gazetteer place, or Nominatim's answer when none is within MAX_REVERSE_KM."""
+    return get_gazetteer().nearest(latitude, longitude) or nominatim_reverse(latitude, longitude)
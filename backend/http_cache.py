@@ -0,0 +1,248 @@
+"""
+Response compression, strong ETags and content-hashed static assets.
+
+CompressionMiddleware gzips (or brotli-compresses, when the optional `brotli`
+package is installed) text-like responses above a size threshold, gives
+complete GET responses a strong ETag and answers matching If-None-Match
+requests with 304 Not Modified.
+
+HashedStaticFiles serves the frontend with content-hash ETags and rewrites
+the asset references in HTML pages to `file.js?v=<hash>`. Requests carrying
+the current hash can be cached for a year; anything else must revalidate.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/html", "text/css", "text/plain", "text/javascript",
+    "application/javascript", "application/json", "image/svg+xml",
+)
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+HASH_LENGTH = 16
+
+
+def strong_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:HASH_LENGTH] + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """RFC 9110 If-None-Match comparison (weak comparison, as required for GET)."""
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best encoding the client accepts: br (if available), then gzip."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Compress and ETag complete, text-like responses.
+
+    Only compressible content types are buffered; everything else (images,
+    NDJSON/event streams, already-encoded bodies) streams through untouched.
+    Compressed bodies of responses that already carry a strong ETag (static
+    assets) are memoized, so each asset is compressed once per encoding.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._compressed: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._compressed_max = 128
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+        is_get = scope["method"] == "GET"
+        if encoding is None and not is_get:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        chunks = []
+        buffering = True
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, buffering
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "").split(";")[0].strip()
+                if (message["status"] != 200 or content_type not in COMPRESSIBLE_TYPES
+                        or "content-encoding" in headers):
+                    buffering = False
+                    await send(message)
+                else:
+                    start = message
+                return
+
+            if message["type"] == "http.response.body" and buffering:
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    await self._send_complete(start, b"".join(chunks), encoding, is_get, request_headers, send)
+                return
+
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _send_complete(
+        self,
+        start: Message,
+        body: bytes,
+        encoding: Optional[str],
+        is_get: bool,
+        request_headers: Headers,
+        send: Send
+    ) -> None:
+        headers = MutableHeaders(scope=start)
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if is_get and etag is None:
+            etag = strong_etag(body)
+            headers["etag"] = etag
+
+        if encoding and len(body) >= self.minimum_size:
+            body = self._compress(body, encoding, etag)
+            headers["content-encoding"] = encoding
+            headers["content-length"] = str(len(body))
+            if etag and not etag.startswith("W/"):
+                # A strong ETag identifies one exact byte representation
+                etag = f'{etag[:-1]}-{encoding}"'
+                headers["etag"] = etag
+
+        if_none_match = request_headers.get("if-none-match")
+        if is_get and etag and if_none_match and etag_matches(if_none_match, etag):
+            not_modified = [
+                (key.encode("latin-1"), value.encode("latin-1")) for key, value in headers.items()
+                if key in ("etag", "cache-control", "vary", "expires", "last-modified", "content-location")
+            ]
+            await send({"type": "http.response.start", "status": 304, "headers": not_modified})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        await send(start)
+        await send({"type": "http.response.body", "body": body})
+
+    def _compress(self, body: bytes, encoding: str, etag: Optional[str]) -> bytes:
+        key = (etag, encoding) if etag and not etag.startswith("W/") else None
+        if key and key in self._compressed:
+            self._compressed.move_to_end(key)
+            return self._compressed[key]
+
+        if encoding == "br":
+            compressed = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            # mtime=0 keeps the output byte-identical between requests
+            compressed = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+        if key:
+            self._compressed[key] = compressed
+            if len(self._compressed) > self._compressed_max:
+                self._compressed.popitem(last=False)
+        return compressed
+
+
+# Local .js/.css references in HTML (not absolute URLs or protocol-relative ones)
+_ASSET_REFERENCE = re.compile(r'(src|href)="(?![a-zA-Z][a-zA-Z0-9+.-]*:|/)([^"?#]+\.(?:js|css))"')
+
+
+class HashedStaticFiles(StaticFiles):
+    """
+    StaticFiles with content-hash ETags and cache-busting asset URLs.
+
+    File contents (and their hashes) are cached in memory until the file's
+    mtime or size changes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._files: Dict[str, Tuple[Tuple[int, int], bytes, str]] = {}
+
+    def _load(self, full_path: str, stat_result: os.stat_result) -> Tuple[bytes, str]:
+        version = (stat_result.st_mtime_ns, stat_result.st_size)
+        cached = self._files.get(full_path)
+        if cached and cached[0] == version:
+            return cached[1], cached[2]
+
+        with open(full_path, "rb") as f:
+            content = f.read()
+        if full_path.endswith(".html"):
+            content = self._link_hashed_assets(content.decode("utf-8")).encode("utf-8")
+        digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+        self._files[full_path] = (version, content, digest)
+        return content, digest
+
+    def asset_hash(self, path: str) -> Optional[str]:
+        full_path, stat_result = self.lookup_path(path)
+        if stat_result is None:
+            return None
+        return self._load(full_path, stat_result)[1]
+
+    def _link_hashed_assets(self, html: str) -> str:
+        def versioned(match: "re.Match") -> str:
+            digest = self.asset_hash(match.group(2))
+            if digest is None:
+                return match.group(0)
+            return f'{match.group(1)}="{match.group(2)}?v={digest}"'
+
+        return _ASSET_REFERENCE.sub(versioned, html)
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        content, digest = self._load(str(full_path), stat_result)
+        requested_version = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("v", [None])[0]
+        headers = {
+            "etag": f'"{digest}"',
+            "cache-control": IMMUTABLE_CACHE if requested_version == digest else REVALIDATE_CACHE,
+        }
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, headers["etag"]):
+            return Response(status_code=304, headers=headers)
+
+        media_type = mimetypes.guess_type(str(full_path))[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type == "application/javascript":
+            media_type += "; charset=utf-8"
+        return Response(content, status_code=status_code, headers=headers, media_type=media_type)
@@ -1,10 +1,38 @@
 import math
-import requests
-from typing import List, Dict, Optional, Tuple
+import os
+import time
+import random
+from typing import List, Dict, Iterator, Optional, Tuple
 import logging
 
+from backend.capture import record_http
+from backend.categories import classify_query, normalize_query
+from backend.circuit_breaker import CircuitOpen, call_upstream, http_failed
+from backend.conditional_fetch import fetch_parsed
+from backend.metrics import stage_timer
+from backend.records import StoreBatch, StoreRecord
+from backend.shared_state import get_store
+
 logger = logging.getLogger(__name__)
 
+# Overridable so load tests can point the store finder at a local stand-in
+PLACES_BASE_URL = os.getenv("PLACES_BASE_URL", "https://maps.googleapis.com/maps/api/place")
+
+# Google only activates a next_page_token a couple of seconds after issuing it
+PAGE_TOKEN_DELAY = 2.0
+MAX_PLACES_PAGES = 3  # nearbysearch never returns more than 3 pages (60 results)
+MAX_PLACES_RESULTS = 60
+DEFAULT_MAX_RESULTS = 15
+
+# How long Places results are reused, across all workers when shared state is configured
+PLACES_CACHE_TTL = float(os.getenv("PLACES_CACHE_TTL", "600"))
+
+
+def results_wanted(limit: Optional[int] = None) -> int:
+    """Stores to page and fetch details for when a caller wants `limit` (default 15, at most 60)."""
+    return max(1, min(limit or DEFAULT_MAX_RESULTS, MAX_PLACES_RESULTS))
+
+
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
     Calculate the distance between two coordinates using the Haversine formula.
@@ -29,7 +57,8 @@ def find_nearby_stores(
     product_query: str,
     min_distance: float = 0,
     max_distance: float = 25,
-    google_api_key: Optional[str] = None
+    google_api_key: Optional[str] = None,
+    max_results: int = 15
 ) -> List[Dict]:
     """
     Find nearby stores that sell the specified product within the distance range.
@@ -41,6 +70,7 @@ def find_nearby_stores(
         min_distance: Minimum distance in km (default: 0)
         max_distance: Maximum distance in km (default: 25)
         google_api_key: Google Places API key (optional)
+        max_results: Number of real stores to collect before paging stops (default: 15)
     
     Returns:
         List of stores with product availability, distance, and details
@@ -51,7 +81,11 @@ def find_nearby_stores(
     if google_api_key:
         try:
             logger.info(f"Searching Google Places for '{product_query}' within {max_distance}km")
-            stores = search_google_places(user_lat, user_lon, product_query, max_distance, google_api_key)
+            cache_key = places_cache_key(user_lat, user_lon, product_query, min_distance, max_distance, max_results)
+            stores = get_store().get_or_compute(cache_key, PLACES_CACHE_TTL, lambda: search_google_places(
+                user_lat, user_lon, product_query, max_distance, google_api_key,
+                min_distance=min_distance, max_results=max_results
+            ))
             logger.info(f"Found {len(stores)} real stores from Google Places")
         except Exception as e:
             logger.error(f"Error searching Google Places: {e}")
@@ -76,12 +110,56 @@ def find_nearby_stores(
     return filtered_stores
 
 
+def places_cache_key(
+    lat: float,
+    lon: float,
+    product_query: str,
+    min_distance: float = 0,
+    max_distance: float = 25,
+    max_results: int = 15
+) -> str:
+    """Cache key for a Places search; nearby users (~100m) share an entry."""
+    return (
+        f"places:{lat:.3f},{lon:.3f}:{min_distance}-{max_distance}:"
+        f"{max_results}:{normalize_query(product_query)}"
+    )
+
+
+def refresh_places_cache(
+    lat: float,
+    lon: float,
+    product_query: str,
+    google_api_key: str,
+    min_distance: float = 0,
+    max_distance: float = 25,
+    max_results: int = 15
+) -> bool:
+    """
+    Re-run a Places search and replace its cached stores, ahead of expiry.
+
+    Used by cache warming; nothing is cached (and False is returned) if the
+    search found no stores.
+    """
+    stores = search_google_places(
+        lat, lon, product_query, max_distance, google_api_key,
+        min_distance=min_distance, max_results=max_results
+    )
+    if stores:
+        get_store().set(
+            places_cache_key(lat, lon, product_query, min_distance, max_distance, max_results),
+            stores, PLACES_CACHE_TTL
+        )
+    return bool(stores)
+
+
 def search_google_places(
     lat: float,
     lon: float,
     query: str,
     radius_km: float,
-    api_key: str
+    api_key: str,
+    min_distance: float = 0,
+    max_results: int = 15
 ) -> List[Dict]:
     """
     Search for real stores using Google Places API with enhanced product matching.
@@ -110,11 +188,16 @@ def search_google_places(
             strategy_stores = perform_places_search(
                 lat, lon, radius_meters, api_key, 
                 keyword=strategy["keyword"], 
-                place_type=strategy["type"]
+                place_type=strategy["type"],
+                max_results=max_results,
+                min_distance=min_distance,
+                max_distance=radius_km
             )
             if strategy_stores:
                 stores.extend(strategy_stores)
                 logger.info(f"Found {len(strategy_stores)} stores with strategy: {strategy}")
+        except CircuitOpen:
+            raise  # Places is down; the remaining strategies would fail the same way
         except Exception as e:
             logger.warning(f"Search strategy failed: {e}")
             continue
@@ -124,32 +207,25 @@ def search_google_places(
 
 def determine_store_types(query: str) -> List[str]:
     """Determine appropriate store types based on product query."""
-    query_lower = query.lower()
-    
-    if any(word in query_lower for word in ["laptop", "phone", "headphone", "camera", "tv", "electronics", "computer"]):
-        return ["electronics_store", "store", "shopping_mall"]
-    elif any(word in query_lower for word in ["book", "novel", "magazine"]):
-        return ["book_store", "store"]
-    elif any(word in query_lower for word in ["shirt", "pants", "dress", "clothing", "shoes", "fashion"]):
-        return ["clothing_store", "shoe_store", "store"]
-    elif any(word in query_lower for word in ["food", "grocery", "snack"]):
-        return ["grocery_or_supermarket", "supermarket", "store"]
-    else:
-        return ["store", "shopping_mall", "department_store"]
+    return classify_query(query).store_types
 
 
-def perform_places_search(
+def iter_places_results(
     lat: float,
     lon: float,
     radius_meters: int,
     api_key: str,
     keyword: str = "",
-    place_type: Optional[str] = None
-) -> List[Dict]:
-    """Perform a single Google Places API search."""
+    place_type: Optional[str] = None,
+    max_pages: int = MAX_PLACES_PAGES
+) -> Iterator[Dict]:
+    """
+    Lazily yield raw nearbysearch results, following next_page_token on demand.
     
-    # Build search parameters
-    search_url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+    The next page is only requested once the caller has consumed every result of
+    the current one, so stopping iteration early never costs an extra API call.
+    """
+    search_url = f"{PLACES_BASE_URL}/nearbysearch/json"
     params = {
         "location": f"{lat},{lon}",
         "radius": radius_meters,
@@ -164,41 +240,98 @@ def perform_places_search(
     if place_type:
         params["type"] = place_type
     
-    response = requests.get(search_url, params=params, timeout=10)
-    data = response.json()
+    for page in range(max_pages):
+        if page > 0:
+            time.sleep(PAGE_TOKEN_DELAY)
+        
+        data = _nearbysearch(search_url, params)
+        status = data.get("status")
+        
+        # A freshly issued page token is rejected until it becomes active
+        if status == "INVALID_REQUEST" and "pagetoken" in params:
+            time.sleep(PAGE_TOKEN_DELAY)
+            data = _nearbysearch(search_url, params)
+            status = data.get("status")
+        
+        if status == "ZERO_RESULTS":
+            logger.info(f"No results found for keyword='{keyword}', type='{place_type}'")
+            return
+        if status != "OK":
+            logger.warning(f"Google Places API returned status: {status}")
+            return
+        
+        yield from data.get("results", [])
+        
+        next_page_token = data.get("next_page_token")
+        if not next_page_token:
+            return
+        
+        params = {"pagetoken": next_page_token, "key": api_key}
+
+
+def _nearbysearch(search_url: str, params: Dict) -> Dict:
+    import requests
+    
+    started = time.perf_counter()
+    with stage_timer("places_nearbysearch"):
+        response = call_upstream("places", requests.get, search_url, params=params, timeout=10,
+                                 is_failure=http_failed)
+    record_http("places", search_url, params, response, time.perf_counter() - started)
+    return response.json()
+
+
+def perform_places_search(
+    lat: float,
+    lon: float,
+    radius_meters: int,
+    api_key: str,
+    keyword: str = "",
+    place_type: Optional[str] = None,
+    max_results: int = 15,
+    min_distance: float = 0,
+    max_distance: Optional[float] = None
+) -> List[Dict]:
+    """
+    Perform a paginated Google Places API search.
     
+    Pages are followed only until max_results stores inside the
+    min_distance-max_distance band have been collected, and place details
+    are fetched only for the stores that are returned.
+    """
     stores = []
     
-    if data.get("status") == "OK":
-        for place in data.get("results", [])[:15]:  # Get up to 15 results
-            place_lat = place["geometry"]["location"]["lat"]
-            place_lon = place["geometry"]["location"]["lng"]
-            distance = calculate_distance(lat, lon, place_lat, place_lon)
-            
-            # Get more details about the place
-            details = get_place_details(place["place_id"], api_key)
-            
-            stores.append({
-                "name": place.get("name", "Unknown Store"),
-                "address": place.get("vicinity", "Address not available"),
-                "distance": round(distance, 2),
-                "latitude": place_lat,
-                "longitude": place_lon,
-                "rating": place.get("rating", 0),
-                "total_ratings": place.get("user_ratings_total", 0),
-                "open_now": place.get("opening_hours", {}).get("open_now", None),
-                "phone": details.get("phone", "N/A"),
-                "website": details.get("website", "N/A"),
-                "place_id": place["place_id"],
-                "has_product": True,  # Assume availability based on search
-                "stock_level": "Call to Verify",  # Real stores need verification
-                "price": "Call for Price",  # Real stores need price verification
-                "is_real_data": True
-            })
-    elif data.get("status") == "ZERO_RESULTS":
-        logger.info(f"No results found for keyword='{keyword}', type='{place_type}'")
-    else:
-        logger.warning(f"Google Places API returned status: {data.get('status')}")
+    for place in iter_places_results(lat, lon, radius_meters, api_key, keyword, place_type):
+        place_lat = place["geometry"]["location"]["lat"]
+        place_lon = place["geometry"]["location"]["lng"]
+        distance = calculate_distance(lat, lon, place_lat, place_lon)
+        
+        # Skip places outside the requested band before paying for details
+        if distance < min_distance or (max_distance is not None and distance > max_distance):
+            continue
+        
+        # Get more details about the place
+        details = get_place_details(place["place_id"], api_key)
+        
+        stores.append(StoreRecord(
+            name=place.get("name", "Unknown Store"),
+            address=place.get("vicinity", "Address not available"),
+            distance=round(distance, 2),
+            latitude=place_lat,
+            longitude=place_lon,
+            rating=place.get("rating", 0),
+            total_ratings=place.get("user_ratings_total", 0),
+            open_now=place.get("opening_hours", {}).get("open_now", None),
+            phone=details.get("phone", "N/A"),
+            website=details.get("website", "N/A"),
+            place_id=place["place_id"],
+            has_product=True,  # Assume availability based on search
+            stock_level="Call to Verify",  # Real stores need verification
+            price="Call for Price",  # Real stores need price verification
+            is_real_data=True
+        ).to_dict())
+        
+        if len(stores) >= max_results:
+            break  # Enough stores - don't request further pages
     
     return stores
 
@@ -206,8 +339,10 @@ def perform_places_search(
 def get_place_details(place_id: str, api_key: str) -> Dict:
     """
     Get detailed information about a specific place.
+    
+    Unchanged details are not re-parsed on refresh (see backend.conditional_fetch).
     """
-    details_url = "https://maps.googleapis.com/maps/api/place/details/json"
+    details_url = f"{PLACES_BASE_URL}/details/json"
     params = {
         "place_id": place_id,
         "fields": "formatted_phone_number,website,opening_hours",
@@ -215,91 +350,169 @@ def get_place_details(place_id: str, api_key: str) -> Dict:
     }
     
     try:
-        response = requests.get(details_url, params=params, timeout=5)
-        data = response.json()
-        
-        if data.get("status") == "OK":
-            result = data.get("result", {})
-            return {
-                "phone": result.get("formatted_phone_number", "N/A"),
-                "website": result.get("website", "N/A")
-            }
+        return fetch_parsed(
+            details_url, _parse_place_details, upstream="places", params=params, timeout=5,
+            fetch_stage="places_details"
+        )
     except Exception as e:
         logger.error(f"Error getting place details: {e}")
     
     return {"phone": "N/A", "website": "N/A"}
 
 
+def _parse_place_details(response) -> Dict:
+    data = response.json()
+    if data.get("status") == "OK":
+        result = data.get("result", {})
+        return {
+            "phone": result.get("formatted_phone_number", "N/A"),
+            "website": result.get("website", "N/A")
+        }
+    return {"phone": "N/A", "website": "N/A"}
+
+
+# Common store chains based on product type
+MOCK_STORE_CHAINS = {
+    "electronics": ["Best Buy", "Walmart", "Target", "Micro Center", "Croma", "Reliance Digital"],
+    "general": ["Walmart", "Target", "Costco", "Big Bazaar", "D-Mart", "Spencer's"],
+    "books": ["Barnes & Noble", "Books-A-Million", "Crossword", "Landmark"],
+    "clothing": ["Macy's", "Nordstrom", "Westside", "Pantaloons", "Lifestyle"]
+}
+MOCK_STREETS = ["Main St", "Market Rd", "Commercial St", "MG Road", "Park Ave", "Broadway", "High St"]
+MOCK_STOCK_LEVELS = ["In Stock", "Low Stock", "Limited Stock", "Call to Verify"]
+
+
 def generate_mock_stores(
     user_lat: float,
     user_lon: float,
     product_query: str,
     min_distance: float,
-    max_distance: float
+    max_distance: float,
+    seed: Optional[int] = None
 ) -> List[Dict]:
     """
     Generate mock store data for demonstration purposes.
     Creates realistic-looking stores at various distances.
     """
-    import random
-    
-    # Common store chains based on product type
-    store_chains = {
-        "electronics": ["Best Buy", "Walmart", "Target", "Micro Center", "Croma", "Reliance Digital"],
-        "general": ["Walmart", "Target", "Costco", "Big Bazaar", "D-Mart", "Spencer's"],
-        "books": ["Barnes & Noble", "Books-A-Million", "Crossword", "Landmark"],
-        "clothing": ["Macy's", "Nordstrom", "Westside", "Pantaloons", "Lifestyle"]
-    }
+    rng = random.Random(seed)
+    num_stores = rng.randint(5, 12)
+    batch = generate_mock_store_batch(
+        user_lat, user_lon, product_query, min_distance, max_distance,
+        count=num_stores, seed=rng.getrandbits(32)
+    )
+    return batch.to_dicts()
+
+
+def generate_mock_store_batch(
+    user_lat: float,
+    user_lon: float,
+    product_query: str,
+    min_distance: float,
+    max_distance: float,
+    count: int,
+    seed: Optional[int] = None
+) -> StoreBatch:
+    """
+    Generate a columnar batch of mock stores, one column at a time.
+    
+    The product query is classified once and every column is drawn in a single
+    pass from a seeded generator, so the same seed always yields the same batch
+    and 100k stores can be produced in well under a second for load tests.
+    
+    Args:
+        user_lat: User's latitude
+        user_lon: User's longitude
+        product_query: Product search query
+        min_distance: Minimum distance in km
+        max_distance: Maximum distance in km
+        count: Number of stores to generate
+        seed: Seed for reproducible output (optional)
+    
+    Returns:
+        StoreBatch holding `count` stores
+    """
+    rng = random.Random(seed)
+    uniform, randint, randrange, rand = rng.uniform, rng.randint, rng.randrange, rng.random
+    rows = range(count)
     
     # Determine store type based on query
-    query_lower = product_query.lower()
-    if any(word in query_lower for word in ["laptop", "phone", "headphone", "camera", "tv", "electronics"]):
-        stores_list = store_chains["electronics"]
-    elif any(word in query_lower for word in ["book", "novel", "magazine"]):
-        stores_list = store_chains["books"]
-    elif any(word in query_lower for word in ["shirt", "pants", "dress", "clothing", "shoes"]):
-        stores_list = store_chains["clothing"]
-    else:
-        stores_list = store_chains["general"]
+    category = classify_query(product_query)
+    stores_list = MOCK_STORE_CHAINS.get(category.category, MOCK_STORE_CHAINS["general"])
     
-    stores = []
-    num_stores = random.randint(5, 12)
+    batch = StoreBatch(
+        names=[f"{name} (Demo)" for name in stores_list],
+        stock_levels=MOCK_STOCK_LEVELS
+    )
+    websites = [f"https://www.{name.lower().replace(' ', '')}.com" for name in stores_list]
+    
+    # Position columns: random distance within range and bearing, projected in one pass
+    distances = [uniform(min_distance, max_distance) for _ in rows]
+    bearings = [uniform(0, 360) for _ in rows]
+    latitudes, longitudes = calculate_destination_points(user_lat, user_lon, distances, bearings)
+    batch.distance.extend(round(d, 2) for d in distances)
+    batch.latitude.extend(latitudes)
+    batch.longitude.extend(longitudes)
+    
+    num_chains = len(stores_list)
+    batch.name_codes.extend(randrange(num_chains) for _ in rows)
+    batch.websites.extend(websites[code] for code in batch.name_codes)
+    
+    num_streets = len(MOCK_STREETS)
+    batch.addresses.extend(
+        f"{randint(100, 9999)} {MOCK_STREETS[randrange(num_streets)]} (Simulated)" for _ in rows
+    )
+    batch.rating.extend(round(uniform(3.5, 5.0), 1) for _ in rows)
+    batch.total_ratings.extend(randint(50, 5000) for _ in rows)
+    batch.open_now.extend(randint(-1, 1) for _ in rows)
+    batch.phones.extend(
+        f"+1-{randint(200, 999)}-{randint(100, 999)}-{randint(1000, 9999)}" for _ in rows
+    )
+    batch.has_product.extend(rand() > 0.2 for _ in rows)  # 80% chance of having the product
+    batch.stock_codes.extend(randrange(len(MOCK_STOCK_LEVELS)) for _ in rows)
     
-    for i in range(num_stores):
-        # Generate random distance within range
-        distance = random.uniform(min_distance, max_distance)
-        
-        # Generate random bearing (direction)
-        bearing = random.uniform(0, 360)
-        
-        # Calculate store coordinates based on distance and bearing
-        store_lat, store_lon = calculate_destination_point(user_lat, user_lon, distance, bearing)
-        
-        store_name = random.choice(stores_list)
-        
-        # Generate realistic address
-        street_num = random.randint(100, 9999)
-        streets = ["Main St", "Market Rd", "Commercial St", "MG Road", "Park Ave", "Broadway", "High St"]
-        street = random.choice(streets)
-        
-        stores.append({
-            "name": f"{store_name} (Demo)",
-            "address": f"{street_num} {street} (Simulated)",
-            "distance": round(distance, 2),
-            "latitude": store_lat,
-            "longitude": store_lon,
-            "rating": round(random.uniform(3.5, 5.0), 1),
-            "total_ratings": random.randint(50, 5000),
-            "open_now": random.choice([True, False, None]),
-            "phone": f"+1-{random.randint(200, 999)}-{random.randint(100, 999)}-{random.randint(1000, 9999)}",
-            "website": f"https://www.{store_name.lower().replace(' ', '')}.com",
-            "has_product": random.random() > 0.2,  # 80% chance of having the product
-            "stock_level": random.choice(["In Stock", "Low Stock", "Limited Stock", "Call to Verify"]),
-            "price": generate_mock_price(product_query),
-            "is_real_data": False
-        })
+    low, high = category.price_range
+    batch.prices.extend(f"${randint(low, high) + randint(-50, 50)}.99" for _ in rows)
     
-    return stores
+    batch.is_real_data.extend(0 for _ in rows)
+    batch.place_ids.extend(None for _ in rows)
+    
+    return batch
+
+
+def calculate_destination_points(
+    lat: float,
+    lon: float,
+    distances_km: List[float],
+    bearings_degrees: List[float]
+) -> Tuple[List[float], List[float]]:
+    """
+    Column-wise version of calculate_destination_point for many points from one origin.
+    
+    Trigonometry of the origin is computed once rather than per point.
+    """
+    R = 6371  # Earth's radius in km
+    sin, cos, asin, atan2, radians, degrees = math.sin, math.cos, math.asin, math.atan2, math.radians, math.degrees
+    
+    lat_rad = radians(lat)
+    lon_rad = radians(lon)
+    sin_lat, cos_lat = sin(lat_rad), cos(lat_rad)
+    
+    dest_lats = []
+    dest_lons = []
+    for distance_km, bearing_degrees in zip(distances_km, bearings_degrees):
+        angular = distance_km / R
+        sin_ang, cos_ang = sin(angular), cos(angular)
+        bearing_rad = radians(bearing_degrees)
+        
+        dest_lat_rad = asin(sin_lat * cos_ang + cos_lat * sin_ang * cos(bearing_rad))
+        dest_lon_rad = lon_rad + atan2(
+            sin(bearing_rad) * sin_ang * cos_lat,
+            cos_ang - sin_lat * sin(dest_lat_rad)
+        )
+        dest_lats.append(degrees(dest_lat_rad))
+        dest_lons.append(degrees(dest_lon_rad))
+    
+    return dest_lats, dest_lons
 
 
 def calculate_destination_point(lat: float, lon: float, distance_km: float, bearing_degrees: float) -> Tuple[float, float]:
@@ -338,23 +551,7 @@ def generate_mock_price(product_query: str) -> str:
     """
     Generate a mock price based on the product query.
     """
-    import random
-    
-    # Estimate price range based on product type
-    query_lower = product_query.lower()
-    
-    if "laptop" in query_lower or "macbook" in query_lower:
-        price = random.randint(500, 2500)
-    elif "phone" in query_lower or "iphone" in query_lower or "samsung" in query_lower:
-        price = random.randint(200, 1500)
-    elif "headphone" in query_lower or "earbuds" in query_lower:
-        price = random.randint(50, 400)
-    elif "tv" in query_lower or "television" in query_lower:
-        price = random.randint(300, 2000)
-    elif "book" in query_lower:
-        price = random.randint(10, 50)
-    else:
-        price = random.randint(20, 500)
+    price = random.randint(*classify_query(product_query).price_range)
     
     # Add some variance
     price = price + random.randint(-50, 50)
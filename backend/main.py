@@ -1,16 +1,54 @@
+import asyncio
+import json
+import logging
 import os
-import uvicorn
-from typing import Optional, List
-from fastapi import FastAPI, HTTPException, Body
+from contextlib import asynccontextmanager
+from typing import Optional, List, Dict
+from fastapi import FastAPI, HTTPException, Body, Request, Header, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field
+
+from backend import startup
+
+# Before the other backend imports, so their env-derived settings see .env
+startup.load_environment()
 
 from backend.scraper import custom_scraper
 from backend.ai_agent import AIModel
-from backend.location_service import find_nearby_stores
+from backend.location_service import find_nearby_stores, results_wanted
+from backend.ranking import RankingWeights, rank_stores
+from backend.circuit_breaker import BREAKERS, OPEN
+from backend.concurrency import LIMITERS, ServiceOverloaded, drain, run_blocking
+from backend.http_cache import CompressionMiddleware, HashedStaticFiles
+from backend.metrics import REGISTRY, MetricsMiddleware
+from backend import bulk, capture, geocoding, profiling, warming
+from backend.quotas import QUOTAS, QuotaExceeded, identify, payer
+from backend.sessions import MAX_MESSAGE_CHARS, SESSIONS
+from backend.responses import (ChatResponse, FastJSONResponse, NearbyStoresResponse, PriceComparisonResponse,
+                               ReleasingStreamingResponse)
+
+logger = logging.getLogger(__name__)
+
+# How long shutdown waits for scrape/LLM calls still running after the last response
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20"))
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup.configure_logging()
+    if os.getenv("WARMUP_ON_STARTUP", "1") != "0":
+        # Off the event loop, so /health answers while the SDKs load
+        startup.warm_up_in_background()
+    warmer = asyncio.create_task(warming.WARMER.run_forever()) if warming.CACHE_WARMING else None
+    yield
+    if warmer:
+        warmer.cancel()
+    stranded = await drain(SHUTDOWN_DRAIN_TIMEOUT)
+    if stranded:
+        logger.warning(f"Shutting down with {stranded} blocking call(s) still running")
+    capture.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Input Models
 class ChatRequest(BaseModel):
@@ -31,6 +69,20 @@ class LocationRequest(BaseModel):
     max_distance: Optional[float] = 25
     api_key: Optional[str] = None
     google_api_key: Optional[str] = None
+    limit: Optional[int] = Field(None, ge=1) # Return only the best N stores
+    ranking_weights: Optional[Dict[str, float]] = None # e.g. {"distance": 0.5, "rating": 0.3}
+
+class BulkPriceItem(BaseModel):
+    query: str
+    country_code: Optional[str] = "US"
+    id: Optional[str] = None # Echoed back so callers can match results to SKUs
+
+class BulkPriceRequest(BaseModel):
+    items: List[BulkPriceItem]
+    api_key: Optional[str] = None
+    summarize: Optional[bool] = False # Per-item AI recommendations are off by default
+    concurrency: Optional[int] = None
+    deadline_seconds: Optional[float] = Field(None, gt=0, le=bulk.MAX_DEADLINE_SECONDS)
 
 app.add_middleware(
     CORSMiddleware,
@@ -40,13 +92,108 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress text responses (gzip, or brotli when installed) and answer If-None-Match with 304
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")))
+
+# Admin-only per-request sampling profiles (X-Profile: 1)
+app.add_middleware(profiling.ProfilingMiddleware)
+
+# Opt-in traffic capture for offline replay (CAPTURE_PATH); inside metrics, to see the stage timings
+app.add_middleware(capture.CaptureMiddleware)
+
+# Outermost, so total request time includes compression
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(ServiceOverloaded)
+async def service_overloaded_handler(request: Request, exc: ServiceOverloaded):
+    """Shed load fast: tell the client when to come back instead of queueing forever."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry shortly."},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(QuotaExceeded)
+async def quota_exceeded_handler(request: Request, exc: QuotaExceeded):
+    """One client over its share: only that client is told to slow down."""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": f"Rate limit for {exc.quota_class} requests exceeded, please retry shortly."},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 @app.get("/health")
-async def health_check():
-    """Health check endpoint to verify server status."""
-    return {"status": "healthy"}
+async def health_check(deep: bool = False):
+    """
+    Health check endpoint to verify server status.
+
+    With ?deep=true, also reports each upstream's circuit breaker state and
+    recent latency; status is "degraded" while any breaker is open.
+    """
+    if not deep:
+        return {"status": "healthy"}
+    upstreams = {name: breaker.snapshot() for name, breaker in BREAKERS.items()}
+    degraded = any(snapshot["state"] == OPEN for snapshot in upstreams.values())
+    return {
+        "status": "degraded" if degraded else "healthy",
+        "upstreams": upstreams,
+        "warming": warming.WARMER.last_cycle,
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, error counters, in-flight gauges, token counts."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def _folded_profile_response(folded: str, name: str) -> PlainTextResponse:
+    return PlainTextResponse(folded, headers={"Content-Disposition": f'attachment; filename="{name}.folded"'})
+
+@app.get("/admin/profile")
+async def admin_profile(seconds: float = 10, x_admin_token: Optional[str] = Header(None)):
+    """Sample the whole process for `seconds` and return a flamegraph-compatible folded-stack file."""
+    if not profiling.is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required.")
+    folded = await run_blocking("admin", profiling.profile_window, seconds)
+    return _folded_profile_response(folded, "profile-window")
+
+@app.get("/admin/profiles/{profile_id}")
+async def admin_request_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Download the profile captured for a request sent with `X-Profile: 1`."""
+    if not profiling.is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required.")
+    if profile_id not in profiling.PROFILES:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return _folded_profile_response(profiling.PROFILES[profile_id], f"profile-{profile_id}")
+
+@app.get("/api/geocode")
+def geocode(q: str, limit: int = 5):
+    """
+    Find places by name from the local gazetteer, falling back to Nominatim.
+
+    A plain def, so the first call's gazetteer load and any fallback
+    lookup run in the threadpool instead of blocking the event loop.
+    
+    Args:
+        q (str): Place name, optionally narrowed by region/country, e.g. "portland, me".
+        limit (int): Maximum number of matches.
+        
+    Returns:
+        dict: {"results": [...]} best matches first, each with latitude, longitude and display_name.
+    """
+    places = geocoding.search(q, limit=max(1, min(limit, 20)))
+    return {"results": [place.to_dict() for place in places]}
 
-@app.post("/api/chat/general")
-async def general_chat(request: ChatRequest):
+@app.get("/api/reverse-geocode")
+def reverse_geocode(lat: float, lon: float):
+    """Return the nearest known place to a coordinate, from the local gazetteer or Nominatim."""
+    found = geocoding.reverse(lat, lon)
+    if found is None:
+        raise HTTPException(status_code=404, detail="No known place near this location.")
+    place, distance_km = found
+    return {"result": place.to_dict(), "distance_km": distance_km}
+
+@app.post("/api/chat/general", response_model=ChatResponse)
+async def general_chat(request: ChatRequest, http_request: Request):
     """
     Handle general chat requests using the AI agent.
     
@@ -56,19 +203,84 @@ async def general_chat(request: ChatRequest):
     Returns:
         dict: The response from the AI agent.
     """
-    # API key is now optional in request if set in env
-    agent = AIModel(api_key=request.api_key)
-    
-    # Construct simplistic history string
-    context = "\n".join([f"{msg['role']}: {msg['content']}" for msg in request.history[-5:]])
-    response = agent.generate_response(request.message, context=context)
+    QUOTAS.check(payer(identify(http_request), request.api_key), "llm")
+    async with LIMITERS["general"]:
+        # API key is now optional in request if set in env
+        agent = AIModel(api_key=request.api_key)
+        
+        # Construct simplistic history string
+        context = "\n".join([f"{msg['role']}: {msg['content']}" for msg in request.history[-5:]])
+        response = await run_blocking("llm", agent.generate_response, request.message, context=context)
     return {"response": response}
 
-@app.post("/api/chat/price")
-async def price_comparison(request: PriceRequest):
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket, session_id: Optional[str] = None):
+    """
+    General chat over one WebSocket, with the conversation kept server-side.
+
+    The server first sends {"type": "session", "session_id": ...}; reconnecting
+    with ?session_id=... resumes that conversation while the session is held.
+    The client sends {"message": ..., "api_key": optional} and receives
+    {"type": "response", "response": ...} or {"type": "error", "detail": ...}.
+    An api_key is remembered for the rest of the connection.
+    """
+    await websocket.accept()
+    session = SESSIONS.get_or_create(session_id)
+    await websocket.send_json({"type": "session", "session_id": session.session_id})
+    api_key = None
+    agent = None
+
+    try:
+        while True:
+            try:
+                payload = json.loads(await websocket.receive_text())
+            except ValueError:
+                payload = None
+            if not isinstance(payload, dict):
+                await websocket.send_json({"type": "error", "detail": "Expected a JSON object."})
+                continue
+            message = str(payload.get("message") or "").strip()
+            if payload.get("api_key") and payload["api_key"] != api_key:
+                api_key, agent = payload["api_key"], None
+            if not message:
+                await websocket.send_json({"type": "error", "detail": "Empty message."})
+                continue
+            if len(message) > MAX_MESSAGE_CHARS:
+                await websocket.send_json({"type": "error", "detail": f"Messages are limited to {MAX_MESSAGE_CHARS} characters."})
+                continue
+
+            try:
+                QUOTAS.check(payer(identify(websocket), api_key), "llm")
+                async with LIMITERS["general"]:
+                    agent = agent or AIModel(api_key=api_key)
+                    response = await run_blocking("llm", agent.generate_response, message, context=session.context())
+            except ServiceOverloaded as e:
+                await websocket.send_json({"type": "error", "detail": "Server is busy, please retry shortly.", "retry_after": e.retry_after})
+                continue
+            except QuotaExceeded as e:
+                await websocket.send_json({"type": "error", "detail": "You are sending messages too quickly, please retry shortly.", "retry_after": e.retry_after})
+                continue
+
+            session.add_turn("user", message)
+            session.add_turn("model", response)
+            SESSIONS.touch(session)
+            await websocket.send_json({"type": "response", "response": response})
+    except WebSocketDisconnect:
+        pass
+
+@app.post("/api/chat/price", response_model=PriceComparisonResponse)
+async def price_comparison(request: PriceRequest, http_request: Request):
+    client = identify(http_request)
+    QUOTAS.check(client, "scrape")  # always from the server's IP, whatever key is sent
+    async with LIMITERS["price"]:
+        # Built from ProductRecords, so re-validating against the model would be redundant
+        return FastJSONResponse(await _price_comparison(request, client))
+
+async def _price_comparison(request: PriceRequest, client: str = ""):
     # 1. Scrape Data
     print(f"Scraping for: {request.query} in {request.country_code}")
-    data = custom_scraper(request.query, country_code=request.country_code)
+    warming.TRAFFIC.record_price(request.query)
+    data = await run_blocking("scrape", custom_scraper, request.query, country_code=request.country_code)
     
     if not data:
         return {
@@ -78,11 +290,13 @@ async def price_comparison(request: PriceRequest):
     
     # 2. (Optional) Use AI to summarize
     ai_summary = ""
-    # Always try to use AI if model is available (via default or passed key)
+    # Always try to use AI if model is available (via default or passed key) and the client has LLM quota left
     try:
+        if not QUOTAS.allow(payer(client, request.api_key), "llm"):
+            raise QuotaExceeded("llm", 0)
         agent = AIModel(api_key=request.api_key)
         prompt = f"Here is a list of product prices found for '{request.query}': {data}. Please give a very brief recommendation on the best deal. Do not use markdown tables, just text."
-        ai_summary = agent.generate_response(prompt)
+        ai_summary = await run_blocking("llm", agent.generate_response, prompt)
     except Exception as e:
         print(f"AI Summary failed: {e}")
         ai_summary = "" # Fallback if AI fails or no key
@@ -93,8 +307,41 @@ async def price_comparison(request: PriceRequest):
         "data": data
     }
 
-@app.post("/api/chat/nearby-stores")
-async def nearby_stores(request: LocationRequest):
+@app.post("/api/bulk/price")
+async def bulk_price_comparison(request: BulkPriceRequest, http_request: Request):
+    """
+    Compare prices for many queries at once, streaming one NDJSON line per item.
+
+    Args:
+        request (BulkPriceRequest): Items to compare plus optional concurrency and deadline budgets.
+
+    Returns:
+        ReleasingStreamingResponse: application/x-ndjson lines in completion order, ending with a summary line.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="At least one item is required.")
+    if len(request.items) > bulk.MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {bulk.MAX_ITEMS} items per request.")
+
+    client = identify(http_request)
+
+    # Held for the whole stream, so only a few batches run at once
+    limiter = LIMITERS["bulk"]
+    await limiter.acquire()
+
+    lines = bulk.stream_bulk_prices(
+        [{"query": item.query, "country_code": item.country_code or "US", "id": item.id}
+         for item in request.items],
+        concurrency=max(1, min(request.concurrency or bulk.DEFAULT_CONCURRENCY, bulk.MAX_CONCURRENCY)),
+        deadline_seconds=request.deadline_seconds or bulk.DEFAULT_DEADLINE_SECONDS,
+        summarize=bool(request.summarize),
+        api_key=request.api_key,
+        client=client
+    )
+    return ReleasingStreamingResponse(lines, on_close=limiter.release, media_type="application/x-ndjson")
+
+@app.post("/api/chat/nearby-stores", response_model=NearbyStoresResponse)
+async def nearby_stores(request: LocationRequest, http_request: Request):
     """
     Find nearby stores that have the specified product within the distance range.
     
@@ -104,20 +351,34 @@ async def nearby_stores(request: LocationRequest):
     Returns:
         dict: List of nearby stores with product availability and AI recommendations
     """
+    client = identify(http_request)
+    QUOTAS.check(payer(client, request.google_api_key), "places")
+    async with LIMITERS["nearby"]:
+        # Built from StoreRecords, so re-validating against the model would be redundant
+        return FastJSONResponse(await _nearby_stores(request, client))
+
+async def _nearby_stores(request: LocationRequest, client: str = ""):
     print(f"Searching for '{request.query}' near ({request.latitude}, {request.longitude})")
     print(f"Distance range: {request.min_distance}km - {request.max_distance}km")
     
     # Get Google API key from environment or request
     google_api_key = request.google_api_key or os.getenv("GOOGLE_PLACES_API_KEY")
+    # Page and fetch details only for as many stores as the caller asked for
+    max_results = results_wanted(request.limit)
+    warming.TRAFFIC.record_nearby(request.latitude, request.longitude, request.query,
+                                  request.min_distance, request.max_distance, max_results)
     
     # Find nearby stores
-    stores = find_nearby_stores(
+    stores = await run_blocking(
+        "places",
+        find_nearby_stores,
         user_lat=request.latitude,
         user_lon=request.longitude,
         product_query=request.query,
         min_distance=request.min_distance,
         max_distance=request.max_distance,
-        google_api_key=google_api_key
+        google_api_key=google_api_key,
+        max_results=max_results
     )
     
     if not stores:
@@ -130,9 +391,19 @@ async def nearby_stores(request: LocationRequest):
     # Filter only stores that have the product
     stores_with_product = [s for s in stores if s.get('has_product', False)]
     
-    # Generate AI summary
+    # Rank by distance, rating, popularity, opening hours and stock
+    stores_with_product = rank_stores(
+        stores_with_product,
+        k=request.limit,
+        weights=RankingWeights.from_dict(request.ranking_weights),
+        max_distance=request.max_distance
+    )
+    
+    # Generate AI summary, unless the client is out of LLM quota
     ai_summary = ""
     try:
+        if not QUOTAS.allow(payer(client, request.api_key), "llm"):
+            raise QuotaExceeded("llm", 0)
         agent = AIModel(api_key=request.api_key)
         
         # Create a concise summary of stores for AI
@@ -146,10 +417,13 @@ async def nearby_stores(request: LocationRequest):
 
 Provide a brief, friendly recommendation (2-3 sentences) on which store(s) to visit first, considering distance, ratings, and stock availability. Be conversational and helpful."""
         
-        ai_summary = agent.generate_response(prompt)
+        ai_summary = await run_blocking("llm", agent.generate_response, prompt)
     except Exception as e:
         print(f"AI Summary failed: {e}")
         ai_summary = f"Found {len(stores_with_product)} nearby stores carrying '{request.query}'. Check the list below for details!"
+        if stores_with_product:
+            best = stores_with_product[0]
+            ai_summary += f" Top pick: {best['name']} ({best['distance']}km away, rated {best.get('rating', 'N/A')}/5)."
     
     return {
         "response": ai_summary,
@@ -163,7 +437,8 @@ Provide a brief, friendly recommendation (2-3 sentences) on which store(s) to vi
 # We assume frontend files will be in 'frontend' folder in the root
 # Checking if directory exists first to avoid errors during initial setup
 if os.path.isdir("frontend"):
-    app.mount("/", StaticFiles(directory="frontend", html=True), name="frontend")
+    app.mount("/", HashedStaticFiles(directory="frontend", html=True), name="frontend")
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("backend.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,305 @@
+"""
+Minimal in-process Prometheus metrics.
+
+Counters, gauges and histograms are kept in plain dicts keyed by label values
+and rendered in the Prometheus text exposition format by /metrics. Recording
+is a lock, a dict lookup and (for histograms) a bisect, so it is cheap enough
+to leave on in production.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.routing import Match, Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Seconds. Upstream calls range from a few ms (cache hits) to the 10s timeouts
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            state[index] += 1
+            state[-1] += value
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return int(sum(state[:-1])) if state else 0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "pricebot_stage_duration_seconds",
+    "Time spent in each processing stage (ebay_fetch, html_parse, price_normalize, places_*).",
+    ["stage"]))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "pricebot_stage_errors_total", "Exceptions raised inside each processing stage.", ["stage"]))
+GEMINI_LATENCY = REGISTRY.register(Histogram(
+    "pricebot_gemini_attempt_duration_seconds",
+    "Duration of each Gemini generate_content attempt, by model and outcome.",
+    ["model", "outcome"]))
+GEMINI_TOKENS = REGISTRY.register(Counter(
+    "pricebot_gemini_tokens_total", "Gemini tokens used, by model and kind (prompt/completion).",
+    ["model", "kind"]))
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "pricebot_request_duration_seconds", "Total request time, by endpoint.", ["endpoint"]))
+REQUESTS = REGISTRY.register(Counter(
+    "pricebot_requests_total", "Requests served, by endpoint and status code.", ["endpoint", "status"]))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "pricebot_requests_in_flight", "Requests currently being processed, by endpoint.", ["endpoint"]))
+CONDITIONAL_FETCHES = REGISTRY.register(Counter(
+    "pricebot_conditional_fetches_total",
+    "Upstream fetches by outcome (fetched, changed, unchanged, not_modified, uncached).",
+    ["upstream", "outcome"]))
+UPSTREAM_BYTES = REGISTRY.register(Counter(
+    "pricebot_upstream_bytes_total", "Response body bytes received from each upstream.", ["upstream"]))
+CIRCUIT_STATE = REGISTRY.register(Gauge(
+    "pricebot_circuit_state", "Upstream circuit breaker state (0 closed, 1 half-open, 2 open).", ["upstream"]))
+CIRCUIT_REJECTED = REGISTRY.register(Counter(
+    "pricebot_circuit_rejected_total", "Calls failed fast because the upstream's breaker was open.", ["upstream"]))
+WARMING_REFRESHES = REGISTRY.register(Counter(
+    "pricebot_warming_refreshes_total", "Cache entries refreshed by the warming scheduler, by kind and outcome.",
+    ["kind", "outcome"]))
+
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") != "0"
+
+# (stage, seconds) pairs for the request being served. The list is shared with
+# worker threads because run_blocking copies the context into them.
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[List[Tuple[str, float]]]:
+    """The (stage, seconds) pairs recorded so far for the current request, if inside one."""
+    return _request_timings.get()
+
+
+def record_timing(stage: str, seconds: float) -> None:
+    """Add a stage duration to the current request's Server-Timing breakdown."""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Record the duration of a stage, and count it as an error if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.observe(elapsed, stage=stage)
+        record_timing(stage, elapsed)
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    """
+    Format stage timings as a Server-Timing header value.
+
+    Repeated stages (e.g. one places_details call per store) are summed and
+    their call count is given in the description.
+    """
+    totals: Dict[str, List[float]] = {}
+    for stage, seconds in timings:
+        entry = totals.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    metrics = []
+    for stage, (seconds, calls) in totals.items():
+        name = "".join(c if c.isalnum() or c in "_-" else "_" for c in stage)
+        metric = f"{name};dur={seconds * 1000:.1f}"
+        if calls > 1:
+            metric += f';desc="{calls} calls"'
+        metrics.append(metric)
+    metrics.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(metrics)
+
+
+def endpoint_label(scope: Scope) -> str:
+    """
+    Keep label cardinality bounded: routes by their template (/api/items/{id}),
+    the static mount as 'static', and anything no route matches as 'unmatched'.
+
+    Resolved before routing (the in-flight gauge needs it up front) by matching
+    the app's routes the same way the router will.
+    """
+    router = getattr(scope.get("app"), "router", None)
+    partial = None
+    for route in getattr(router, "routes", ()):
+        match, child_scope = route.matches(scope)
+        if match == Match.PARTIAL and partial is None:
+            partial = route, child_scope  # right path, wrong method: the router answers 405
+        if match != Match.FULL:
+            continue
+        if isinstance(route, Mount):
+            # The API namespace is never served from disk; a miss there is a 404
+            return "unmatched" if scope["path"].startswith("/api/") else "static"
+        return getattr(child_scope.get("route", route), "path", "unmatched")
+    if partial is not None:
+        return getattr(partial[1].get("route", partial[0]), "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Track total latency, status codes and in-flight requests per endpoint, and
+    attach a Server-Timing header with the per-stage breakdown of the request.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = endpoint_label(scope)
+        status = 500
+        start = time.perf_counter()
+        timings: List[Tuple[str, float]] = []
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING and endpoint != "static":
+                    header = server_timing_header(timings, time.perf_counter() - start)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", header.encode("latin-1"))
+                    ]
+            await send(message)
+
+        IN_FLIGHT.inc(endpoint=endpoint)
+        token = _request_timings.set(timings)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_timings.reset(token)
+            IN_FLIGHT.dec(endpoint=endpoint)
+            REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+            REQUESTS.inc(endpoint=endpoint, status=str(status))
@@ -0,0 +1,179 @@
+"""
+On-demand sampling profiler for admins.
+
+The profiler is a background thread that snapshots every thread's stack with
+sys._current_frames() at a fixed interval and counts identical stacks. The
+result is written in the "folded" format (`frame;frame;frame count` per line)
+understood by flamegraph.pl, speedscope and inferno.
+
+Profiling is disabled unless ADMIN_TOKEN is set. With it, an admin can:
+  - send any request with `X-Profile: 1` and `X-Admin-Token: <token>` to have
+    just that request profiled; the response carries `X-Profile-Id`, and the
+    profile is downloaded from /admin/profiles/{id}. Only the request's own
+    work is sampled: the event loop while the request's task is running, and
+    executor threads while they run a run_blocking call made for it.
+  - call /admin/profile?seconds=N to profile the whole process for a window
+"""
+import asyncio
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from typing import Callable, Optional, Set, TypeVar
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+DEFAULT_INTERVAL = 0.005  # 200 Hz
+MAX_WINDOW_SECONDS = 60
+MAX_STORED_PROFILES = 20
+
+# Frames that mean "this thread is parked, not working"
+_IDLE_FUNCTIONS = {"wait", "select", "poll", "epoll", "_worker", "accept", "sleep", "_wait_for_tstate_lock"}
+
+
+T = TypeVar("T")
+
+# Idents of the threads currently working for the request being profiled
+_profiled_threads: ContextVar[Optional[Set[int]]] = ContextVar("profiled_threads", default=None)
+
+
+def is_admin(token: Optional[str]) -> bool:
+    # Compared as bytes: compare_digest rejects str with non-ASCII characters
+    return (bool(ADMIN_TOKEN) and token is not None
+            and hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")))
+
+
+def run_tracked(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run func, counting the current thread as working for the profiled request (if any)."""
+    threads = _profiled_threads.get()
+    if threads is None:
+        return func(*args, **kwargs)
+    ident = threading.get_ident()
+    threads.add(ident)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        threads.discard(ident)
+
+
+class SamplingProfiler:
+    """
+    Samples threads' stacks until stopped.
+
+    Args:
+        interval: Seconds between samples
+        threads: Only sample these thread idents (the set may change while
+            running); None samples every thread
+        task: Also sample the event loop thread, but only while this task is
+            the one running on it. Must be created on that loop's thread.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, threads: Optional[Set[int]] = None,
+                 task: Optional[asyncio.Task] = None):
+        self.interval = interval
+        self.threads = threads
+        self.task = task
+        self._loop = task.get_loop() if task is not None else None
+        self._loop_thread = threading.get_ident() if task is not None else None
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _wanted(self, thread_id: int) -> bool:
+        if self.threads is None or thread_id in self.threads:
+            return True
+        return thread_id == self._loop_thread and asyncio.current_task(self._loop) is self.task
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if (thread_id == own_id or frame.f_code.co_name in _IDLE_FUNCTIONS
+                        or not self._wanted(thread_id)):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        """Collapsed stacks, one `stack count` line each, heaviest first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+# Finished per-request profiles, newest last
+PROFILES: "OrderedDict[str, str]" = OrderedDict()
+
+
+def store_profile(folded: str) -> str:
+    profile_id = uuid.uuid4().hex[:12]
+    PROFILES[profile_id] = folded
+    while len(PROFILES) > MAX_STORED_PROFILES:
+        PROFILES.popitem(last=False)
+    return profile_id
+
+
+def profile_window(seconds: float, interval: float = DEFAULT_INTERVAL) -> str:
+    """Profile the whole process for a time window (blocking; run off the event loop)."""
+    profiler = SamplingProfiler(interval).start()
+    time.sleep(max(0.0, min(seconds, MAX_WINDOW_SECONDS)))
+    return profiler.stop().folded()
+
+
+class ProfilingMiddleware:
+    """Profile a single request when an admin asks for it with `X-Profile: 1`."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not ADMIN_TOKEN:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if headers.get("x-profile") != "1" or not is_admin(headers.get("x-admin-token")):
+            await self.app(scope, receive, send)
+            return
+
+        threads: Set[int] = set()
+        token = _profiled_threads.set(threads)
+        profiler = SamplingProfiler(threads=threads, task=asyncio.current_task()).start()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # The handler is done by now; only the body remains to be sent
+                profile_id = store_profile(profiler.stop().folded())
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _profiled_threads.reset(token)
+            profiler.stop()
@@ -0,0 +1,175 @@
+"""
+Per-client quotas for upstream work.
+
+A client is identified by its IP address. eBay is always scraped from the
+server's own IP, and by default Places and Gemini are called with the
+server's keys, so a key in the request body proves nothing and must not buy a
+fresh quota: anyone could send a different junk key with every request. Only
+when the client's own key pays for the upstream (its google_api_key for
+Places, its Gemini api_key for llm) is that class's quota kept per key digest
+instead (never the key itself). Each client has a token bucket per class of
+upstream work:
+  scrape  - eBay searches (/api/chat/price, each bulk item)
+  places  - Google Places searches (/api/chat/nearby-stores)
+  llm     - Gemini calls (chat messages and AI summaries)
+
+A request over its scrape/places/llm quota is refused with 429 and a
+Retry-After header; bulk items wait for the client's scrape tokens instead.
+An AI summary over the llm quota is skipped and the plain response text used,
+so one client's chat volume cannot run the shared Gemini quota into the
+cooldowns that every other user then hits.
+
+Buckets are kept per worker process, so with N workers a client can get up to
+N times the configured rate. Env overrides: QUOTA_<CLASS>_PER_MINUTE (0 turns
+the class off) and QUOTA_<CLASS>_BURST.
+"""
+import asyncio
+import hashlib
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from starlette.requests import HTTPConnection
+
+from backend.concurrency import CLIENT_ID
+
+# X-Forwarded-For is only trusted behind a proxy that sets it
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "0") == "1"
+MAX_CLIENTS = int(os.getenv("QUOTA_MAX_CLIENTS", "10000"))
+
+
+class QuotaExceeded(Exception):
+    """Raised when a client has used up its quota for a class of upstream work."""
+
+    def __init__(self, quota_class: str, retry_after: float):
+        self.quota_class = quota_class
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"'{quota_class}' quota exceeded, retry in {self.retry_after}s")
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1) -> float:
+        """Take `cost` tokens if available and return 0, else return the seconds until they will be."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+def _limits_from_env(defaults: Dict[str, Tuple[float, int]]) -> Dict[str, Tuple[float, int]]:
+    limits = {}
+    for quota_class, (per_minute, burst) in defaults.items():
+        per_minute = float(os.getenv(f"QUOTA_{quota_class.upper()}_PER_MINUTE", per_minute))
+        if per_minute > 0:
+            limits[quota_class] = (per_minute, int(os.getenv(f"QUOTA_{quota_class.upper()}_BURST", burst)))
+    return limits
+
+
+class ClientQuotas:
+    """
+    Token buckets per (client, class), for the clients seen most recently.
+
+    Only used from the event loop, so the buckets need no locking.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, int]], max_clients: int = MAX_CLIENTS):
+        self.limits = limits  # class -> (tokens per minute, burst)
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+
+    def _bucket(self, client: str, quota_class: str) -> Optional[TokenBucket]:
+        limit = self.limits.get(quota_class)
+        if limit is None:
+            return None
+        key = (client, quota_class)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(limit[0] / 60.0, limit[1])
+            if len(self._buckets) > self.max_clients * len(self.limits):
+                self._buckets.popitem(last=False)  # a fresh bucket is full, so forgetting one only forgives
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def allow(self, client: str, quota_class: str, cost: float = 1) -> bool:
+        """Take from the client's quota; False (and nothing taken) if it is used up."""
+        bucket = self._bucket(client, quota_class)
+        return bucket is None or bucket.take(cost) == 0
+
+    def check(self, client: str, quota_class: str, cost: float = 1) -> None:
+        """Take from the client's quota, or raise QuotaExceeded."""
+        bucket = self._bucket(client, quota_class)
+        if bucket is not None:
+            wait = bucket.take(cost)
+            if wait:
+                raise QuotaExceeded(quota_class, wait)
+
+    async def wait(self, client: str, quota_class: str, deadline: float) -> bool:
+        """Wait for quota; False if it would not be available before `deadline` (monotonic)."""
+        bucket = self._bucket(client, quota_class)
+        if bucket is None:
+            return True
+        wait = bucket.take()
+        while wait:
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+            wait = bucket.take()
+        return True
+
+
+QUOTAS = ClientQuotas(_limits_from_env({
+    "scrape": (30, 10),
+    "places": (20, 5),
+    "llm": (20, 5),
+}))
+
+
+def identify(connection: HTTPConnection) -> str:
+    """
+    Work out who a request is from and make it the current CLIENT_ID.
+
+    Args:
+        connection: The HTTP request or WebSocket
+
+    Returns:
+        "ip:<address>"
+    """
+    forwarded = connection.headers.get("x-forwarded-for") if TRUST_FORWARDED_FOR else None
+    if forwarded:
+        address = forwarded.split(",")[0].strip()
+    else:
+        address = connection.client.host if connection.client else "unknown"
+    client = f"ip:{address}"
+    CLIENT_ID.set(client)
+    return client
+
+
+def payer(client: str, own_key: Optional[str] = None) -> str:
+    """
+    Quota identity for one class of upstream work.
+
+    Args:
+        client: The client from identify()
+        own_key: The client's own key for that upstream, when the call will be
+            made with it (so the client, not the server, pays for it)
+
+    Returns:
+        "key:<digest>" when the client's own key pays, else `client`
+    """
+    if own_key:
+        return "key:" + hashlib.sha256(own_key.encode("utf-8")).hexdigest()[:16]
+    return client
@@ -0,0 +1,147 @@
+"""
+Multi-criteria ranking of nearby-store candidates.
+
+A candidate set is scored in one pass over its columns (distance, rating,
+review count, open now, stock level) with normalizers computed once for the
+whole set, and the best k are selected with a heap instead of a full sort.
+"""
+import heapq
+import math
+from dataclasses import dataclass, fields
+from typing import Dict, List, Optional, Sequence
+
+from backend.records import OPEN_NOW_VALUES, StoreBatch
+
+# How confident each stock label makes us that the product is on the shelf
+STOCK_SCORES = {
+    "In Stock": 1.0,
+    "Limited Stock": 0.6,
+    "Low Stock": 0.4,
+    "Call to Verify": 0.3,
+}
+UNKNOWN_STOCK_SCORE = 0.3
+
+
+@dataclass
+class RankingWeights:
+    """Relative importance of each criterion. Weights need not sum to 1."""
+    distance: float = 0.35
+    rating: float = 0.25
+    total_ratings: float = 0.15
+    open_now: float = 0.10
+    stock: float = 0.15
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, float]]) -> "RankingWeights":
+        """Build weights from a partial mapping, ignoring unknown keys."""
+        if not data:
+            return cls()
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: float(v) for k, v in data.items() if k in names})
+
+
+def score_columns(
+    distances: Sequence[float],
+    ratings: Sequence[float],
+    total_ratings: Sequence[int],
+    open_now: Sequence[Optional[bool]],
+    stock_levels: Sequence[str],
+    weights: Optional[RankingWeights] = None,
+    max_distance: Optional[float] = None
+) -> List[float]:
+    """
+    Score a whole candidate set given as parallel columns.
+
+    Every criterion is normalized to 0..1 (closer, better rated, more reviewed,
+    open, in stock = higher) and combined as a weighted average.
+
+    Returns:
+        One score per candidate, in input order
+    """
+    weights = weights or RankingWeights()
+    if not distances:
+        return []
+
+    total_weight = (weights.distance + weights.rating + weights.total_ratings
+                    + weights.open_now + weights.stock) or 1.0
+    far = max_distance or max(distances) or 1.0
+    # Review counts are heavy-tailed, so compare them on a log scale
+    log_most_reviews = math.log1p(max(total_ratings)) or 1.0
+    log1p = math.log1p
+    open_scores = {True: 1.0, False: 0.0, None: 0.5}
+
+    return [
+        (
+            weights.distance * max(0.0, 1.0 - d / far)
+            + weights.rating * (r or 0) / 5.0
+            + weights.total_ratings * log1p(n or 0) / log_most_reviews
+            + weights.open_now * open_scores[o]
+            + weights.stock * STOCK_SCORES.get(s, UNKNOWN_STOCK_SCORE)
+        ) / total_weight
+        for d, r, n, o, s in zip(distances, ratings, total_ratings, open_now, stock_levels)
+    ]
+
+
+def top_k_indices(scores: Sequence[float], distances: Sequence[float], k: Optional[int] = None) -> List[int]:
+    """
+    Indices of the k best scores, best first; ties go to the closer store.
+
+    Uses a bounded heap (O(n log k)) when k is smaller than the candidate set.
+    """
+    n = len(scores)
+
+    def order_key(i: int):
+        return scores[i], -distances[i]
+
+    if k is None or k >= n:
+        return sorted(range(n), key=order_key, reverse=True)
+    return heapq.nlargest(k, range(n), key=order_key)
+
+
+def rank_stores(
+    stores: List[Dict],
+    k: Optional[int] = None,
+    weights: Optional[RankingWeights] = None,
+    max_distance: Optional[float] = None
+) -> List[Dict]:
+    """
+    Rank store dicts and return the top k (all if k is None), each with a "score".
+    """
+    distances = [s['distance'] for s in stores]
+    scores = score_columns(
+        distances,
+        [s.get('rating', 0) for s in stores],
+        [s.get('total_ratings', 0) for s in stores],
+        [s.get('open_now') for s in stores],
+        [s.get('stock_level', '') for s in stores],
+        weights=weights,
+        max_distance=max_distance
+    )
+    return [
+        {**stores[i], "score": round(scores[i], 3)}
+        for i in top_k_indices(scores, distances, k)
+    ]
+
+
+def rank_batch(
+    batch: StoreBatch,
+    k: Optional[int] = None,
+    weights: Optional[RankingWeights] = None,
+    max_distance: Optional[float] = None
+) -> List[int]:
+    """
+    Rank a columnar StoreBatch without materializing rows.
+
+    Returns:
+        Row indices of the top k stores, best first
+    """
+    scores = score_columns(
+        batch.distance,
+        batch.rating,
+        batch.total_ratings,
+        [OPEN_NOW_VALUES[o] for o in batch.open_now],
+        [batch.stock_levels[c] for c in batch.stock_codes],
+        weights=weights,
+        max_distance=max_distance
+    )
+    return top_k_indices(scores, batch.distance, k)
@@ -0,0 +1,165 @@
+"""
+Typed record types for stores and products.
+
+Single results are NamedTuples (slotted, immutable, no per-instance dict);
+large store result sets can be held column-wise in a StoreBatch.
+"""
+from array import array
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+
+class StoreRecord(NamedTuple):
+    name: str
+    address: str
+    distance: float
+    latitude: float
+    longitude: float
+    rating: float = 0
+    total_ratings: int = 0
+    open_now: Optional[bool] = None
+    phone: str = "N/A"
+    website: str = "N/A"
+    has_product: bool = True
+    stock_level: str = "Call to Verify"
+    price: str = "Call for Price"
+    is_real_data: bool = False
+    place_id: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        """Return the API dict form. place_id is only present for real stores."""
+        data = self._asdict()
+        if data["place_id"] is None:
+            del data["place_id"]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "StoreRecord":
+        return cls(**{field: data[field] for field in cls._fields if field in data})
+
+
+class ProductRecord(NamedTuple):
+    source: str
+    title: str
+    price: str
+    shipping: str
+    link: str
+    approx_price: Optional[str] = None
+    price_val_usd: Optional[float] = None
+    is_estimate: Optional[bool] = None
+    landed_cost: Optional[float] = None # price + shipping, in USD
+
+    def to_dict(self) -> Dict:
+        """Return the API dict form, leaving out optional fields that are unset."""
+        return {key: value for key, value in self._asdict().items() if value is not None}
+
+
+# open_now is tri-state, stored as a signed byte
+OPEN_NOW_CODES = {True: 1, False: 0, None: -1}
+OPEN_NOW_VALUES = {1: True, 0: False, -1: None}
+
+
+class StoreBatch:
+    """
+    Column-oriented container for large store result sets.
+
+    Numeric columns are packed arrays and repetitive string columns (store name,
+    stock level) are dictionary-encoded, so a batch of 100k stores costs a small
+    fraction of the equivalent list of dicts. Rows are materialized on access.
+    """
+    __slots__ = (
+        "name_codes", "names", "addresses", "distance", "latitude", "longitude",
+        "rating", "total_ratings", "open_now", "phones", "websites", "has_product",
+        "stock_codes", "stock_levels", "prices", "is_real_data", "place_ids",
+        "_name_index", "_stock_index",
+    )
+
+    def __init__(
+        self,
+        names: Sequence[str] = (),
+        stock_levels: Sequence[str] = (),
+    ):
+        self.names: List[str] = list(names)
+        self.stock_levels: List[str] = list(stock_levels)
+        self.name_codes = array("I")
+        self.stock_codes = array("H")
+        # Value -> code for each vocabulary, so append() encodes in O(1)
+        self._name_index: Dict[str, int] = {}
+        self._stock_index: Dict[str, int] = {}
+        self.addresses: List[str] = []
+        self.distance = array("d")
+        self.latitude = array("d")
+        self.longitude = array("d")
+        self.rating = array("d")
+        self.total_ratings = array("l")
+        self.open_now = array("b")
+        self.phones: List[str] = []
+        self.websites: List[str] = []
+        self.has_product = array("b")
+        self.prices: List[str] = []
+        self.is_real_data = array("b")
+        self.place_ids: List[Optional[str]] = []
+
+    def __len__(self) -> int:
+        return len(self.distance)
+
+    def __getitem__(self, i: int) -> StoreRecord:
+        return StoreRecord(
+            name=self.names[self.name_codes[i]],
+            address=self.addresses[i],
+            distance=self.distance[i],
+            latitude=self.latitude[i],
+            longitude=self.longitude[i],
+            rating=self.rating[i],
+            total_ratings=self.total_ratings[i],
+            open_now=OPEN_NOW_VALUES[self.open_now[i]],
+            phone=self.phones[i],
+            website=self.websites[i],
+            has_product=bool(self.has_product[i]),
+            stock_level=self.stock_levels[self.stock_codes[i]],
+            price=self.prices[i],
+            is_real_data=bool(self.is_real_data[i]),
+            place_id=self.place_ids[i],
+        )
+
+    def __iter__(self) -> Iterator[StoreRecord]:
+        return (self[i] for i in range(len(self)))
+
+    @staticmethod
+    def _code(vocabulary: List[str], index: Dict[str, int], value: str) -> int:
+        """Code of value in a vocabulary of distinct strings, adding it if new."""
+        if len(index) != len(vocabulary):  # filled directly (e.g. by the constructor): catch up
+            index.update((known, code) for code, known in enumerate(vocabulary) if known not in index)
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(vocabulary)
+            vocabulary.append(value)
+        return code
+
+    def append(self, store: StoreRecord) -> None:
+        """Append a single record (convenient, but slower than filling columns directly)."""
+        self.name_codes.append(self._code(self.names, self._name_index, store.name))
+        self.stock_codes.append(self._code(self.stock_levels, self._stock_index, store.stock_level))
+        self.addresses.append(store.address)
+        self.distance.append(store.distance)
+        self.latitude.append(store.latitude)
+        self.longitude.append(store.longitude)
+        self.rating.append(store.rating)
+        self.total_ratings.append(store.total_ratings)
+        self.open_now.append(OPEN_NOW_CODES[store.open_now])
+        self.phones.append(store.phone)
+        self.websites.append(store.website)
+        self.has_product.append(store.has_product)
+        self.prices.append(store.price)
+        self.is_real_data.append(store.is_real_data)
+        self.place_ids.append(store.place_id)
+
+    @classmethod
+    def from_records(cls, stores: Iterable[StoreRecord]) -> "StoreBatch":
+        batch = cls()
+        for store in stores:
+            batch.append(store)
+        return batch
+
+    def to_dicts(self) -> List[Dict]:
+        """Materialize every row in the API dict form."""
+        return [store.to_dict() for store in self]
@@ -0,0 +1,108 @@
+"""
+Typed response models and fast JSON / streaming response classes.
+
+The models describe what the chat endpoints return (they drive the OpenAPI
+schema and client generation). The hot endpoints build their payloads from
+the records in backend.records, whose shape is already fixed, so they return
+FastJSONResponse directly: FastAPI then skips re-validating the payload
+against the model and the body is encoded by orjson instead of json.
+
+orjson is optional; without it FastJSONResponse behaves like JSONResponse.
+"""
+import json
+from typing import Any, Callable, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.types import Receive, Scope, Send
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the json module is always available
+    orjson = None
+
+
+class ProductResult(BaseModel):
+    source: str
+    title: str
+    price: str
+    shipping: str
+    link: str
+    approx_price: Optional[str] = None
+    price_val_usd: Optional[float] = None
+    is_estimate: Optional[bool] = None
+    landed_cost: Optional[float] = None
+
+
+class StoreResult(BaseModel):
+    name: str
+    address: str
+    distance: float
+    latitude: float
+    longitude: float
+    rating: float = 0
+    total_ratings: int = 0
+    open_now: Optional[bool] = None
+    phone: str = "N/A"
+    website: str = "N/A"
+    has_product: bool = True
+    stock_level: str = "Call to Verify"
+    price: str = "Call for Price"
+    is_real_data: bool = False
+    place_id: Optional[str] = None
+    score: Optional[float] = None
+
+
+class ChatResponse(BaseModel):
+    response: str
+
+
+class PriceComparisonResponse(BaseModel):
+    response: str
+    data: List[ProductResult]
+
+
+class NearbyStoresResponse(BaseModel):
+    response: str
+    data: List[StoreResult]
+    total_stores: int
+    search_radius: Optional[str] = None
+
+
+def dumps(content: Any) -> bytes:
+    """Encode to compact UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(content)
+        except TypeError:
+            # Types orjson does not know (e.g. sets); fall through to the generic path
+            content = jsonable_encoder(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson. Content must already be JSON-compatible."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that calls `on_close` once sending is over, however it ends.
+
+    A generator's own `finally` does not run if the client disconnects, or if
+    sending the response start fails before the first item is pulled, so
+    resources held for the stream (e.g. an admission slot) are released here.
+    """
+
+    def __init__(self, content: Any, on_close: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
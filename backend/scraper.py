@@ -1,12 +1,38 @@
+import contextvars
+import heapq
+import os
 import random
+import statistics
 import urllib.parse
-import requests
-from bs4 import BeautifulSoup
 import logging
 import re
+from concurrent.futures import as_completed
+
+from backend.categories import classify_query, normalize_query
+from backend.concurrency import EXECUTORS
+from backend.conditional_fetch import fetch_parsed
+from backend.metrics import stage_timer
+from backend.records import ProductRecord
+from backend.shared_state import get_store
 
 logger = logging.getLogger(__name__)
 
+# Overridable so load tests can point the scraper at a local stand-in
+EBAY_BASE_URL = os.getenv("EBAY_BASE_URL", "https://www.ebay.com")
+
+# How long scraped listings are reused, across all workers when shared state is configured
+EBAY_CACHE_TTL = float(os.getenv("EBAY_CACHE_TTL", "300"))
+
+# Result depth: how many search pages to fetch (concurrently) and how many of
+# the cheapest relevant listings to keep from them
+EBAY_RESULT_PAGES = int(os.getenv("EBAY_RESULT_PAGES", "1"))
+EBAY_TOP_N = int(os.getenv("EBAY_TOP_N", "8"))
+
+# Relevance filter: listings whose titles match less than this fraction of the
+# query's significant terms are dropped before the cheapest are picked, so
+# cables and cases do not crowd out the product. 0 turns the filter off.
+EBAY_RELEVANCE_MIN_MATCH = float(os.getenv("EBAY_RELEVANCE_MIN_MATCH", "0.5"))
+
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
@@ -19,15 +45,20 @@ def get_headers():
         "Accept-Language": "en-US,en;q=0.9",
     }
 
-def scrape_ebay(query):
+def scrape_ebay(query, pages=None, limit=None):
     """
     Scrape eBay for a given query.
-    Returns list of dicts with title, price, shipping, link.
+    
+    Fetches the first `pages` result pages concurrently and keeps only the
+    `limit` cheapest relevant listings by landed cost (price + shipping).
+    Returns list of dicts with title, price, shipping, link, landed_cost, cheapest first.
     """
+    pages = pages or EBAY_RESULT_PAGES
+    limit = limit or EBAY_TOP_N
     try:
         # Construct search URL
-        url = f"https://www.ebay.com/sch/i.html?_nkw={query.replace(' ', '+')}"
-        logger.info(f"Scraping URL: {url}")
+        url = f"{EBAY_BASE_URL}/sch/i.html?_nkw={query.replace(' ', '+')}"
+        logger.info(f"Scraping URL: {url} ({pages} page(s))")
         
         # Use more comprehensive headers to avoid being blocked
         headers = {
@@ -42,69 +73,211 @@ def scrape_ebay(query):
             "Sec-Fetch-Site": "none",
             "Sec-Fetch-User": "?1",
         }
+        terms = query_terms(query) if EBAY_RELEVANCE_MIN_MATCH > 0 else ()
         
-        response = requests.get(url, headers=headers, timeout=10)
-        soup = BeautifulSoup(response.text, 'html.parser')
+        def fetch_page(page):
+            page_url = url if page == 1 else f"{url}&_pgn={page}"
+            # Re-parses only when the page actually changed since the last fetch
+            return fetch_parsed(
+                page_url, lambda response: parse_ebay_results(response.text, limit, terms), upstream="ebay",
+                headers=headers, timeout=10, fetch_stage="ebay_fetch", parse_stage="html_parse",
+                variant=f"{limit}:{EBAY_RELEVANCE_MIN_MATCH}"
+            )
         
-        items = []
-        # Support multiple listing layouts
-        listings = soup.select('.s-item, .s-card, .srp-results li')
+        if pages == 1:
+            return fetch_page(1)
         
-        for item in listings:
+        # Merge each page's cheapest listings as soon as that page arrives
+        cheapest = CheapestListings(limit)
+        futures = [
+            EXECUTORS["pages"].submit(contextvars.copy_context().run, fetch_page, page)
+            for page in range(1, pages + 1)
+        ]
+        for future in as_completed(futures):
             try:
-                # Find title
-                title_elem = item.select_one('.s-item__title, .s-card__title, h3')
-                if not title_elem: continue
-                title_text = title_elem.get_text(strip=True)
-                
-                # Filter noise
-                if any(x in title_text.lower() for x in ["shop on ebay", "new listing", "sponsored"]):
-                    continue
-
-                # Find price
-                price_elem = item.select_one('.s-item__price, .s-card__price, .s-item__price--bold')
-                if not price_elem:
-                    # Generic search for anything with a dollar sign or numeric price pattern
-                    price_elem = item.find(lambda t: t.name in ['span', 'div'] and '$' in t.get_text())
-                
-                if not price_elem: continue
-                price_text = price_elem.get_text(strip=True)
-
-                # Link
-                link_elem = item.select_one('.s-item__link, .s-card__link') or item.find('a', href=True)
-                if not link_elem or not link_elem.get('href') or 'itm/' not in link_elem['href']:
-                    continue
-                link_href = link_elem['href']
-
-                # Shipping
-                shipping_elem = item.select_one('.s-item__shipping, .s-card__shipping')
-                shipping_text = shipping_elem.get_text(strip=True) if shipping_elem else "Calculated"
-
-                items.append({
-                    "source": "eBay",
-                    "title": title_text,
-                    "price": price_text,
-                    "shipping": shipping_text,
-                    "link": link_href
-                })
-                
-                if len(items) >= 8:
-                    break
-            except Exception:
-                continue
-        
-        return items
+                cheapest.extend(future.result())
+            except Exception as e:
+                logger.warning(f"Skipping an eBay result page: {e}")
+        return cheapest.items()
     except Exception as e:
         logger.error(f"Error scraping eBay: {e}")
         return []
 
 
+_NUMBER = re.compile(r'[0-9][0-9,]*(?:\.[0-9]+)?')
+_QUERY_TERM = re.compile(r'[a-z0-9]+')
+# Words that say nothing about which listing is wanted
+_IGNORED_TERMS = frozenset({
+    "a", "an", "and", "the", "for", "with", "of", "to", "in", "on", "by", "or", "new", "best", "cheap",
+    "inch", "inches", "cm", "mm", "ft", "lb", "lbs", "oz",
+})
+
+
+def parse_amount(text):
+    """First number in a price string ("$1,299.00 to $1,499.00" -> 1299.0), or None."""
+    match = _NUMBER.search(text or "")
+    return float(match.group(0).replace(',', '')) if match else None
+
+
+def parse_shipping(text):
+    """Shipping cost from eBay's shipping line: 0 for free, None when not stated (e.g. "Calculated")."""
+    text = (text or "").lower()
+    if "free" in text:
+        return 0.0
+    if "shipping" in text or "delivery" in text:
+        return parse_amount(text)
+    return None
+
+
+def _stem(word):
+    """Crude singular form, so "headphones" matches "Headphone"."""
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def query_terms(query):
+    """Significant terms of a query: stopwords and units dropped."""
+    return [term for term in _QUERY_TERM.findall(normalize_query(query)) if term not in _IGNORED_TERMS]
+
+
+def is_relevant(title, terms, min_match=None):
+    """
+    Whether a listing title matches enough of the query terms.
+
+    A term matches a title word of the same singular form, or a part of one
+    ("iphone" in "iPhone13"). At least `min_match` (default
+    EBAY_RELEVANCE_MIN_MATCH, or all terms if that is unset) of the terms must match.
+    """
+    if not terms:
+        return True
+    words = {_stem(word) for word in _QUERY_TERM.findall(title.lower())}
+    matched = sum(1 for term in map(_stem, terms) if any(term in word for word in words))
+    if min_match is None:
+        min_match = EBAY_RELEVANCE_MIN_MATCH or 1.0
+    return matched >= min_match * len(terms)
+
+
+class CheapestListings:
+    """
+    Streaming top-k: keeps the `limit` lowest landed-cost listings seen so far.
+    
+    Backed by a max-heap of size `limit`, so memory stays constant however
+    many listings are pushed through it.
+    """
+    
+    def __init__(self, limit):
+        self.limit = limit
+        self._heap = []  # (-landed_cost, -sequence, listing); earlier listings win ties
+        self._sequence = 0
+    
+    def push(self, listing):
+        entry = (-listing['landed_cost'], -self._sequence, listing)
+        self._sequence += 1
+        if len(self._heap) < self.limit:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+    
+    def extend(self, listings):
+        for listing in listings:
+            self.push(listing)
+    
+    def items(self):
+        """The kept listings, cheapest first."""
+        return [listing for _, _, listing in sorted(self._heap, reverse=True)]
+
+
+def parse_ebay_results(html, limit=None, terms=()):
+    """
+    Parse an eBay search results page into its `limit` cheapest relevant listing dicts.
+    """
+    cheapest = CheapestListings(limit or EBAY_TOP_N)
+    for listing in iter_ebay_listings(html):
+        if is_relevant(listing['title'], terms):
+            cheapest.push(listing)
+    return cheapest.items()
+
+
+def iter_ebay_listings(html):
+    """
+    Yield every priced listing on an eBay search results page, in page order.
+    """
+    from bs4 import BeautifulSoup
+    
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # Support multiple listing layouts
+    listings = soup.select('.s-item, .s-card, .srp-results li')
+    
+    for item in listings:
+        try:
+            # Find title
+            title_elem = item.select_one('.s-item__title, .s-card__title, h3')
+            if not title_elem: continue
+            title_text = title_elem.get_text(strip=True)
+            
+            # Filter noise
+            if any(x in title_text.lower() for x in ["shop on ebay", "new listing", "sponsored"]):
+                continue
+
+            # Find price
+            price_elem = item.select_one('.s-item__price, .s-card__price, .s-item__price--bold')
+            if not price_elem:
+                # Generic search for anything with a dollar sign or numeric price pattern
+                price_elem = item.find(lambda t: t.name in ['span', 'div'] and '$' in t.get_text())
+            
+            if not price_elem: continue
+            price_text = price_elem.get_text(strip=True)
+            price_val = parse_amount(price_text)
+            if price_val is None: continue
+
+            # Link
+            link_elem = item.select_one('.s-item__link, .s-card__link') or item.find('a', href=True)
+            if not link_elem or not link_elem.get('href') or 'itm/' not in link_elem['href']:
+                continue
+            link_href = link_elem['href']
+
+            # Shipping
+            shipping_elem = item.select_one('.s-item__shipping, .s-card__shipping')
+            shipping_text = shipping_elem.get_text(strip=True) if shipping_elem else "Calculated"
+
+            yield ProductRecord(
+                source="eBay",
+                title=title_text,
+                price=price_text,
+                shipping=shipping_text,
+                link=link_href,
+                # Unknown shipping is counted as free rather than dropping the listing
+                landed_cost=round(price_val + (parse_shipping(shipping_text) or 0.0), 2)
+            ).to_dict()
+        except Exception:
+            continue
+
+
+def ebay_cache_key(query: str) -> str:
+    return f"ebay:{normalize_query(query)}"
+
+
+def refresh_ebay_cache(query: str) -> bool:
+    """
+    Re-scrape a query and replace its cached listings, ahead of expiry.
+
+    Used by cache warming; nothing is cached (and False is returned) if the
+    scrape came back empty.
+    """
+    results = scrape_ebay(query)
+    if results:
+        get_store().set(ebay_cache_key(query), results, EBAY_CACHE_TTL)
+    return bool(results)
+
+
 def custom_scraper(query, country_code="US"):
     """
     Main scraper function handling multiple sources and localization.
     """
-    # 1. Scrape Real Data (eBay)
-    results = scrape_ebay(query)
+    # 1. Scrape Real Data (eBay), shared with concurrent and recent identical searches
+    results = get_store().get_or_compute(ebay_cache_key(query), EBAY_CACHE_TTL, lambda: scrape_ebay(query))
     
     quoted_query = urllib.parse.quote(query)
     
@@ -129,18 +302,13 @@ def custom_scraper(query, country_code="US"):
     normalized_results = []
     
     # 2. Process Real Results
-    if results:
+    with stage_timer("price_normalize"):
         for item in results:
             raw_price = item.get('price', '')
             shipping_str = item.get('shipping', '')
 
             # Parse numeric value for calculations/estimates
-            price_val = 0.0
-            match = re.search(r'([0-9,]+(\.[0-9]+)?)', raw_price)
-            if match:
-                try:
-                    price_val = float(match.group(0).replace(',', ''))
-                except: pass
+            price_val = parse_amount(raw_price) or 0.0
             
             # Calculate approx conversion if needed
             approx_local_str = ""
@@ -150,22 +318,29 @@ def custom_scraper(query, country_code="US"):
 
             # Add processed item
             # We keep 'price' exactly as is (e.g. "$20.00")
-            item['shipping'] = shipping_str
-            if approx_local_str:
-                item['approx_price'] = approx_local_str
-            
-            # Store numeric value for competitor estimation
-            item['price_val_usd'] = price_val 
-            
-            normalized_results.append(item)
+            # and store the numeric value for competitor estimation
+            normalized_results.append(ProductRecord(
+                source=item.get('source', 'eBay'),
+                title=item.get('title', ''),
+                price=raw_price,
+                shipping=shipping_str,
+                link=item.get('link', ''),
+                approx_price=approx_local_str or None,
+                price_val_usd=price_val,
+                landed_cost=item.get('landed_cost', price_val)
+            ).to_dict())
 
     # 3. Generate Competitor Estimates (Simulated)
     # We need a baseline price to guess what competitors might charge
-    base_usd = 500.0 # Default fallback
+    # Default fallback: middle of the typical price range for this kind of product
+    low, high = classify_query(query).price_range
+    base_usd = (low + high) / 2
     ref_title = query.title()
 
-    if normalized_results and 'price_val_usd' in normalized_results[0]:
-        base_usd = normalized_results[0]['price_val_usd']
+    # The median listing, so one cheap accessory or refurb does not drag every estimate down
+    listed_prices = [item['price_val_usd'] for item in normalized_results if item.get('price_val_usd')]
+    if listed_prices:
+        base_usd = statistics.median(listed_prices)
         ref_title = normalized_results[0]['title']
     
     # If no results found from eBay, we should still provide estimates from other stores
@@ -186,13 +361,16 @@ def custom_scraper(query, country_code="US"):
         else:
              price_fmt = f"{currency_symbol}{mock_val:,.2f}"
 
-        normalized_results.append({
-            "source": store['name'],
-            "title": ref_title,
-            "price": price_fmt,
-            "shipping": "Free (Est.)",
-            "link": store['url'],
-            "is_estimate": True
-        })
+        normalized_results.append(ProductRecord(
+            source=store['name'],
+            title=ref_title,
+            price=price_fmt,
+            shipping="Free (Est.)",
+            link=store['url'],
+            is_estimate=True,
+            landed_cost=round(mock_val / exchange_rate, 2)
+        ).to_dict())
     
+    # Cheapest first, across real listings and estimates (landed cost is in USD)
+    normalized_results.sort(key=lambda item: item.get('landed_cost', float('inf')))
     return normalized_results
@@ -0,0 +1,196 @@
+"""
+Production entry point: several uvicorn workers sharing one listening socket.
+
+    python -m backend.server --workers 4
+
+The parent process imports the app and the heavy SDKs once, binds the socket,
+then forks the workers, so each starts with everything already loaded
+(copy-on-write) and boots in milliseconds. Workers that die are replaced;
+workers that keep dying soon after starting (e.g. a broken deploy) are
+restarted with exponential backoff, and the server gives up after
+WORKER_MAX_FAST_DEATHS such deaths in a row.
+On SIGTERM/SIGINT every worker stops accepting connections, finishes its
+in-flight requests (up to --graceful-timeout) and drains remaining scrape and
+LLM calls before exiting.
+
+Set SHARED_STATE_PATH so workers share cached upstream results and Gemini
+quota cooldowns instead of each fetching its own.
+
+On platforms without fork(), uvicorn's own spawn-based supervisor is used,
+which re-imports the app in every worker.
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+class RestartPolicy:
+    """
+    Decides how long to wait before replacing a dead worker.
+
+    A worker that lived less than `fast_seconds` counts as a fast death. Each
+    fast death in a row doubles the delay (from `base_delay` up to
+    `max_delay`); a worker that ran longer resets the streak. After
+    `max_fast_deaths` in a row, delay() returns None: give up.
+    """
+
+    def __init__(self, fast_seconds: float = 10.0, base_delay: float = 0.5, max_delay: float = 30.0,
+                 max_fast_deaths: int = _env_int("WORKER_MAX_FAST_DEATHS", 5)):
+        self.fast_seconds = fast_seconds
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_fast_deaths = max_fast_deaths
+        self.fast_deaths = 0
+
+    def delay(self, lifetime: float) -> Optional[float]:
+        if lifetime >= self.fast_seconds:
+            self.fast_deaths = 0
+            return 0.0
+        self.fast_deaths += 1
+        if self.fast_deaths >= self.max_fast_deaths:
+            return None
+        return min(self.base_delay * 2 ** (self.fast_deaths - 1), self.max_delay)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the API with multiple worker processes.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_env_int("PORT", 8000))
+    parser.add_argument("--workers", type=int, default=_env_int("WEB_CONCURRENCY", os.cpu_count() or 1))
+    parser.add_argument("--backlog", type=int, default=_env_int("BACKLOG", 2048),
+                        help="pending connections the kernel queues before refusing")
+    parser.add_argument("--keep-alive", type=int, default=_env_int("KEEP_ALIVE_TIMEOUT", 5),
+                        help="seconds an idle keep-alive connection stays open")
+    parser.add_argument("--graceful-timeout", type=int, default=_env_int("GRACEFUL_TIMEOUT", 30),
+                        help="seconds in-flight requests get to finish on shutdown")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    return parser.parse_args(argv)
+
+
+def build_config(args: argparse.Namespace, app):
+    import uvicorn
+
+    return uvicorn.Config(
+        app,
+        host=args.host,
+        port=args.port,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+        proxy_headers=True,
+    )
+
+
+def _run_worker(config, sock) -> None:
+    import uvicorn
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, signal.SIG_DFL)  # uvicorn installs its own graceful handlers
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve_prefork(args: argparse.Namespace) -> int:
+    from backend import startup
+
+    startup.load_environment()
+    startup.configure_logging()
+    startup.warm_up()  # synchronously: no threads may be running when we fork
+    from backend.main import app
+
+    config = build_config(args, app)
+    sock = config.bind_socket()
+    children: Dict[int, float] = {}  # pid -> when it was started
+    policy = RestartPolicy()
+    stopping = False
+    exit_code = 0
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(config, sock)
+            except BaseException:
+                logger.exception("Worker crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        if not stopping:
+            logger.info(f"Stopping {len(children)} worker(s) gracefully")
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info(f"Listening on {args.host}:{args.port} with {args.workers} worker(s)")
+    for _ in range(args.workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if stopping:
+            continue
+        delay = policy.delay(time.monotonic() - started if started is not None else 0.0)
+        if delay is None:
+            logger.error(f"Worker {pid} exited with status {status}; workers keep dying at startup, giving up")
+            exit_code = 1
+            stop(signal.SIGTERM, None)
+            continue
+        logger.warning(f"Worker {pid} exited with status {status}; starting a replacement in {delay:g}s")
+        time.sleep(delay)
+        if not stopping:
+            spawn()
+    sock.close()
+    return exit_code
+
+
+def serve_spawn(args: argparse.Namespace) -> None:
+    import uvicorn
+
+    uvicorn.run(
+        "backend.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+        proxy_headers=True,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if hasattr(os, "fork"):
+        return serve_prefork(args)
+    serve_spawn(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Server-side chat sessions for the WebSocket chat channel.
+
+Each session keeps only the most recent turns verbatim. Older turns are folded
+into a short extractive summary (the first sentence of each, bounded in total
+length), so the context sent to the LLM stays the same size however long the
+conversation runs.
+
+The store itself is bounded too: it holds at most MAX_SESSIONS sessions,
+evicting the least recently used, and drops sessions idle for longer than
+SESSION_IDLE_TTL. Sessions live in the worker process that owns the WebSocket.
+"""
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Deque, Optional, Tuple
+
+MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "10000"))
+SESSION_IDLE_TTL = float(os.getenv("CHAT_SESSION_IDLE_TTL", "1800"))
+RECENT_TURNS = 6  # kept verbatim; matches the old 5-message window plus the new message
+SUMMARY_MAX_CHARS = 1200
+SUMMARY_SENTENCE_CHARS = 200
+MAX_MESSAGE_CHARS = 4000
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def _first_sentence(text: str) -> str:
+    text = " ".join(text.split())
+    sentence = _SENTENCE_END.split(text, maxsplit=1)[0]
+    if len(sentence) > SUMMARY_SENTENCE_CHARS:
+        sentence = sentence[:SUMMARY_SENTENCE_CHARS - 3].rstrip() + "..."
+    return sentence
+
+
+class ChatSession:
+    """Recent turns plus a rolling summary of everything older."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.turns: Deque[Tuple[str, str]] = deque(maxlen=RECENT_TURNS)
+        self.summary = ""
+        self.last_seen = time.monotonic()
+
+    def add_turn(self, role: str, content: str) -> None:
+        if len(self.turns) == self.turns.maxlen:
+            self._fold(*self.turns[0])
+        self.turns.append((role, content[:MAX_MESSAGE_CHARS]))
+
+    def _fold(self, role: str, content: str) -> None:
+        sentence = _first_sentence(content)
+        if not sentence:
+            return
+        summary = f"{self.summary} {role}: {sentence}".strip()
+        if len(summary) > SUMMARY_MAX_CHARS:
+            # Drop the oldest summarized turns first
+            summary = summary[-SUMMARY_MAX_CHARS:]
+            cut = summary.find(" user: ")
+            summary = summary[cut + 1:] if cut != -1 else summary
+        self.summary = summary
+
+    def context(self) -> str:
+        """The conversation so far, as context for the next LLM call."""
+        lines = [f"Earlier in this conversation: {self.summary}"] if self.summary else []
+        lines.extend(f"{role}: {content}" for role, content in self.turns)
+        return "\n".join(lines)
+
+
+class SessionStore:
+    """LRU of chat sessions with idle expiry; thread-safe."""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, idle_ttl: float = SESSION_IDLE_TTL):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get_or_create(self, session_id: Optional[str] = None) -> ChatSession:
+        """Resume the session if it is still held, otherwise start a new one."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = ChatSession(uuid.uuid4().hex)
+                self._sessions[session.session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_seen = now
+            return session
+
+    def touch(self, session: ChatSession) -> None:
+        with self._lock:
+            session.last_seen = time.monotonic()
+            if session.session_id in self._sessions:
+                self._sessions.move_to_end(session.session_id)
+
+    def _evict_idle(self, now: float) -> None:
+        # Least recently used first, so stop at the first session still fresh
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_seen <= self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+
+
+SESSIONS = SessionStore()
@@ -0,0 +1,272 @@
+"""
+Cache and rate-limit state shared by all worker processes.
+
+With SHARED_STATE_PATH set, state lives in one SQLite database (WAL mode), so
+every worker on the host sees the same cached upstream results and the same
+Gemini quota cooldowns. Without it, a process-local in-memory store with the
+same interface is used, which is what the dev server and the tests get.
+
+Values are stored as JSON, so only JSON-compatible data can be cached.
+
+get_or_compute() also de-duplicates concurrent misses: the first caller takes
+a short lease on the key and computes the value, while the others (in any
+thread or worker) wait for it to appear instead of calling the upstream too.
+A waiter stops at the caller's DEADLINE (see backend.concurrency) rather than
+holding its executor thread for the whole lease.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from backend.concurrency import DEADLINE
+
+logger = logging.getLogger(__name__)
+
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH")
+LEASE_SECONDS = float(os.getenv("SHARED_STATE_LEASE_SECONDS", "15"))
+_LEASE_POLL_INTERVAL = 0.05
+_PURGE_EVERY = 256  # writes between sweeps of expired rows
+
+
+class _Store:
+    """Operations common to all backends; subclasses provide get/set/add/delete/ttl."""
+
+    def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl: float) -> bool:
+        """Set the key only if it is absent (or expired); returns whether it was set."""
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int, ttl: float, limit: Optional[int] = None) -> Optional[int]:
+        """
+        Atomically add amount to an integer counter, creating it at 0 with `ttl` if absent (or expired).
+
+        Returns:
+            The new count, or None (leaving the counter unchanged) if it would exceed limit
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def ttl(self, key: str) -> Optional[float]:
+        """Seconds until the key expires, or None if it is absent (or expired)."""
+        raise NotImplementedError
+
+    def get_or_compute(self, key: str, ttl: float, compute: Callable[[], Any], lease: float = LEASE_SECONDS) -> Any:
+        """
+        Return the cached value for key, computing and caching it on a miss.
+
+        Only one caller computes a given key at a time; the others wait up to
+        `lease` seconds for its result, or until the caller's DEADLINE if that
+        comes first. Empty results (None, [], {}) are returned but not cached,
+        so a failed upstream call is retried next time.
+
+        Raises:
+            TimeoutError: The deadline passed while waiting on another caller
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        lease_key = f"lease:{key}"
+        if self.add(lease_key, os.getpid(), ttl=lease):
+            try:
+                value = compute()
+                if value:
+                    self.set(key, value, ttl)
+                return value
+            finally:
+                self.delete(lease_key)
+
+        caller_deadline = DEADLINE.get()
+        deadline = time.monotonic() + lease
+        if caller_deadline is not None:
+            deadline = min(deadline, caller_deadline)
+        while time.monotonic() < deadline:
+            time.sleep(min(_LEASE_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+            value = self.get(key)
+            if value is not None:
+                return value
+            if self.get(lease_key) is None:
+                break  # the holder finished without caching anything
+        if caller_deadline is not None and time.monotonic() >= caller_deadline:
+            raise TimeoutError(f"Gave up waiting for {key!r}: the caller's deadline passed")
+        return compute()
+
+
+class MemoryStore(_Store):
+    """Process-local store; thread-safe."""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._data[key]
+                return None
+            return json.loads(entry[1])
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + ttl, json.dumps(value))
+            self._writes += 1
+            if self._writes % _PURGE_EVERY == 0:
+                now = time.time()
+                for stale in [k for k, (expires, _) in self._data.items() if expires <= now]:
+                    del self._data[stale]
+
+    def add(self, key: str, value: Any, ttl: float) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.time():
+                return False
+            self._data[key] = (time.time() + ttl, json.dumps(value))
+            return True
+
+    def incr(self, key: str, amount: int, ttl: float, limit: Optional[int] = None) -> Optional[int]:
+        with self._lock:
+            now = time.time()
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                entry = (now + ttl, "0")
+            count = json.loads(entry[1]) + amount
+            if limit is not None and count > limit:
+                return None
+            self._data[key] = (entry[0], json.dumps(count))
+            return count
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def ttl(self, key: str) -> Optional[float]:
+        with self._lock:
+            entry = self._data.get(key)
+        remaining = entry[0] - time.time() if entry else 0
+        return remaining if remaining > 0 else None
+
+
+class SQLiteStore(_Store):
+    """
+    Store backed by a SQLite file that several processes can open at once.
+
+    Connections are per thread and per process, and are opened lazily, so a
+    store created before the server forks its workers is safe to use in them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) != pid:
+            self._local.conn = self._connect()
+            self._local.pid = pid
+        return self._local.conn
+
+    def get(self, key: str) -> Any:
+        row = self._conn.execute(
+            "SELECT value FROM kv WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time() + ttl),
+        )
+        self._writes += 1
+        if self._writes % _PURGE_EVERY == 0:
+            self._conn.execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),))
+
+    def add(self, key: str, value: Any, ttl: float) -> bool:
+        conn = self._conn
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM kv WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def incr(self, key: str, amount: int, ttl: float, limit: Optional[int] = None) -> Optional[int]:
+        conn = self._conn
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value, expires_at FROM kv WHERE key = ? AND expires_at > ?",
+                               (key, now)).fetchone()
+            count = (json.loads(row[0]) if row else 0) + amount
+            if limit is not None and count > limit:
+                conn.execute("ROLLBACK")
+                return None
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(count), row[1] if row else now + ttl),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return count
+
+    def delete(self, key: str) -> None:
+        self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def ttl(self, key: str) -> Optional[float]:
+        row = self._conn.execute("SELECT expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        remaining = row[0] - time.time() if row else 0
+        return remaining if remaining > 0 else None
+
+
+_store: Optional[_Store] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> _Store:
+    """The shared store for this process, created on first use from SHARED_STATE_PATH."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if SHARED_STATE_PATH:
+                    logger.info(f"Using shared state at {SHARED_STATE_PATH}")
+                    _store = SQLiteStore(SHARED_STATE_PATH)
+                else:
+                    _store = MemoryStore()
+    return _store
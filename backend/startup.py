@@ -0,0 +1,53 @@
+"""
+Process start-up helpers: environment, logging and warm-up.
+
+Importing backend modules has no side effects and does not pull in the heavy
+SDKs; they are imported on first use. warm_up_in_background() imports them
+on a daemon thread right after start-up, so the worker reports healthy at once
+and the first real request usually finds them already loaded.
+"""
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Modules that dominate import time, in the order they are typically needed
+HEAVY_MODULES = ("requests", "bs4", "google.genai", "google.genai.types")
+
+
+def load_environment() -> None:
+    """Load variables from .env (if present) without overriding the real environment."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
+def configure_logging() -> None:
+    logging.basicConfig(level=logging.INFO)
+
+
+def warm_up() -> float:
+    """Import the heavy modules and load the gazetteer now; returns the seconds it took."""
+    started = time.perf_counter()
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning(f"Warm-up could not import {name}: {e}")
+    try:
+        from backend.geocoding import get_gazetteer
+
+        get_gazetteer()
+    except OSError as e:
+        logger.warning(f"Warm-up could not load the gazetteer: {e}")
+    elapsed = time.perf_counter() - started
+    logger.info(f"Warm-up imported heavy modules and loaded the gazetteer in {elapsed * 1000:.0f}ms")
+    return elapsed
+
+
+def warm_up_in_background() -> threading.Thread:
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,264 @@
+"""
+Background cache warming for popular searches.
+
+The price and nearby-stores endpoints record each search in TRAFFIC, a small
+table of exponentially decaying hit counts. Every WARMING_INTERVAL seconds
+the scheduler takes the most popular eBay queries and Places searches (query
+plus ~100m location cell plus distance band) and refreshes those cache entries
+that are missing or expire within WARMING_REFRESH_AHEAD seconds. Popular
+searches are then served warm, including by the first users after a quiet
+period.
+
+Warming only runs:
+  - inside the WARMING_WINDOWS local-time windows ("02:00-06:00,13:00-14:00";
+    empty means at any time);
+  - while the server is quiet (no more than WARMING_MAX_IN_FLIGHT requests in
+    flight), and one refresh at a time;
+  - within WARMING_CALL_BUDGET upstream calls per hour, counted in the shared
+    store so the budget covers all workers;
+  - for upstreams whose circuit breaker is closed.
+
+With several workers, each cycle is run by whichever worker takes the cycle
+lease, using the traffic that worker has seen. Places searches are only warmed
+with the server's GOOGLE_PLACES_API_KEY; keys sent by clients are never kept.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from backend.categories import normalize_query
+from backend.circuit_breaker import BREAKERS, OPEN
+from backend.concurrency import CLIENT_ID, LIMITERS, run_blocking
+from backend.location_service import DEFAULT_MAX_RESULTS, places_cache_key, refresh_places_cache
+from backend.metrics import WARMING_REFRESHES
+from backend.scraper import EBAY_RESULT_PAGES, ebay_cache_key, refresh_ebay_cache
+from backend.shared_state import get_store
+
+logger = logging.getLogger(__name__)
+
+CACHE_WARMING = os.getenv("CACHE_WARMING", "1") != "0"
+WARMING_INTERVAL = float(os.getenv("WARMING_INTERVAL", "60"))
+WARMING_WINDOWS = os.getenv("WARMING_WINDOWS", "")
+WARMING_CALL_BUDGET = int(os.getenv("WARMING_CALL_BUDGET", "120"))  # upstream calls per hour
+WARMING_REFRESH_AHEAD = float(os.getenv("WARMING_REFRESH_AHEAD", "60"))
+WARMING_MAX_IN_FLIGHT = int(os.getenv("WARMING_MAX_IN_FLIGHT", "2"))
+WARMING_TOP_QUERIES = int(os.getenv("WARMING_TOP_QUERIES", "20"))
+WARMING_TOP_LOCATIONS = int(os.getenv("WARMING_TOP_LOCATIONS", "10"))
+# A search's popularity halves every this many seconds without new hits
+TRAFFIC_HALF_LIFE = float(os.getenv("WARMING_HALF_LIFE", str(6 * 3600)))
+MAX_TRACKED = 2000
+
+
+def places_refresh_cost(max_results: int) -> int:
+    """Upper bound of upstream calls for one Places refresh: each nearbysearch page plus a details call per store."""
+    return -(-max_results // 20) + max_results
+
+
+class TrafficRecorder:
+    """
+    Decaying popularity counts for recent searches. Only used from the event loop.
+
+    Each key maps to [score, updated_at, params]; scores are decayed lazily
+    when touched or ranked, and the table is pruned to `max_tracked` keys.
+    """
+
+    def __init__(self, half_life: float = TRAFFIC_HALF_LIFE, max_tracked: int = MAX_TRACKED):
+        self.half_life = half_life
+        self.max_tracked = max_tracked
+        self._entries: Dict[Tuple, list] = {}
+
+    def _decayed(self, entry: list, now: float) -> float:
+        return entry[0] * 0.5 ** ((now - entry[1]) / self.half_life)
+
+    def record(self, key: Tuple, params: Dict, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        entry = self._entries.get(key)
+        score = self._decayed(entry, now) if entry else 0.0
+        self._entries[key] = [score + 1, now, params]
+        if len(self._entries) > self.max_tracked * 1.25:
+            self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        ranked = sorted(self._entries.items(), key=lambda item: self._decayed(item[1], now), reverse=True)
+        self._entries = dict(ranked[:self.max_tracked])
+
+    def record_price(self, query: str) -> None:
+        self.record(("price", normalize_query(query)), {"query": query})
+
+    def record_nearby(self, lat: float, lon: float, query: str, min_distance: float, max_distance: float,
+                      max_results: int = DEFAULT_MAX_RESULTS) -> None:
+        lat, lon = round(lat, 3), round(lon, 3)
+        self.record(
+            ("nearby", lat, lon, normalize_query(query), min_distance, max_distance, max_results),
+            {"lat": lat, "lon": lon, "query": query, "min_distance": min_distance, "max_distance": max_distance,
+             "max_results": max_results},
+        )
+
+    def top(self, kind: str, n: int, now: Optional[float] = None) -> List[Tuple[Dict, float]]:
+        """The n most popular searches of one kind, as (params, score), most popular first."""
+        now = time.time() if now is None else now
+        scored = [
+            (entry[2], self._decayed(entry, now))
+            for key, entry in list(self._entries.items()) if key[0] == kind
+        ]
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:n]
+
+
+TRAFFIC = TrafficRecorder()
+
+
+def parse_windows(spec: str) -> List[Tuple[int, int]]:
+    """ "02:00-06:00,22:30-23:59" -> [(120, 360), (1350, 1439)] (minutes after midnight)."""
+    windows = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, end = (piece.strip() for piece in part.split("-"))
+        windows.append(tuple(int(h) * 60 + int(m) for h, m in (start.split(":"), end.split(":"))))
+    return windows
+
+
+def in_windows(windows: List[Tuple[int, int]], now: datetime) -> bool:
+    """Whether `now` falls in any window; a window may wrap past midnight. No windows means always."""
+    if not windows:
+        return True
+    minute = now.hour * 60 + now.minute
+    for start, end in windows:
+        if start <= end and start <= minute < end:
+            return True
+        if start > end and (minute >= start or minute < end):
+            return True
+    return False
+
+
+class WarmTask(NamedTuple):
+    kind: str
+    cache_key: str
+    upstream: str
+    executor: str
+    cost: int
+    score: float
+    refresh: Callable[[], bool]
+
+
+class WarmingScheduler:
+    """Periodically refreshes the most popular cache entries before they expire."""
+
+    def __init__(
+        self,
+        recorder: TrafficRecorder,
+        interval: float = WARMING_INTERVAL,
+        windows: str = WARMING_WINDOWS,
+        call_budget: int = WARMING_CALL_BUDGET,
+        refresh_ahead: float = WARMING_REFRESH_AHEAD,
+        max_in_flight: int = WARMING_MAX_IN_FLIGHT,
+        places_api_key: Optional[str] = None
+    ):
+        self.recorder = recorder
+        self.interval = interval
+        self.windows = parse_windows(windows)
+        self.call_budget = call_budget
+        self.refresh_ahead = refresh_ahead
+        self.max_in_flight = max_in_flight
+        self.places_api_key = places_api_key
+        self.last_cycle: Dict[str, int] = {}
+
+    def plan(self) -> List[WarmTask]:
+        """Popular entries that are missing or about to expire, most popular first."""
+        store = get_store()
+        tasks = []
+        for params, score in self.recorder.top("price", WARMING_TOP_QUERIES):
+            query = params["query"]
+            tasks.append(WarmTask(
+                "price", ebay_cache_key(query), "ebay", "scrape", EBAY_RESULT_PAGES, score,
+                lambda query=query: refresh_ebay_cache(query),
+            ))
+
+        api_key = self.places_api_key or os.getenv("GOOGLE_PLACES_API_KEY")
+        if api_key:
+            for params, score in self.recorder.top("nearby", WARMING_TOP_LOCATIONS):
+                key = places_cache_key(params["lat"], params["lon"], params["query"],
+                                       params["min_distance"], params["max_distance"], params["max_results"])
+                tasks.append(WarmTask(
+                    "nearby", key, "places", "places", places_refresh_cost(params["max_results"]), score,
+                    lambda p=params: refresh_places_cache(
+                        p["lat"], p["lon"], p["query"], api_key,
+                        p["min_distance"], p["max_distance"], p["max_results"]
+                    ),
+                ))
+
+        due = []
+        for task in tasks:
+            remaining = store.ttl(task.cache_key)
+            if remaining is None or remaining <= self.refresh_ahead:
+                due.append(task)
+        due.sort(key=lambda task: task.score, reverse=True)
+        return due
+
+    def _busy(self) -> bool:
+        return sum(limiter.in_flight for limiter in LIMITERS.values()) > self.max_in_flight
+
+    def _claim_budget(self, cost: int) -> bool:
+        """
+        Charge `cost` calls to this hour's budget, shared by all workers via the store.
+
+        The charge is one atomic increment, so workers whose cycles overlap
+        (a long cycle can outlive its lease) cannot both spend the same calls.
+        """
+        key = f"warming:budget:{int(time.time() // 3600)}"
+        return get_store().incr(key, cost, ttl=3600, limit=self.call_budget) is not None
+
+    async def run_cycle(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Refresh due entries, one at a time, until the budget, the window or the quiet spell runs out.
+
+        Returns:
+            Counts of refreshed, failed and skipped entries for this cycle
+        """
+        stats = {"due": 0, "refreshed": 0, "failed": 0, "skipped": 0}
+        if not in_windows(self.windows, now or datetime.now()):
+            return stats
+        # Only one worker warms per cycle; the lease lapses before the next one
+        if not get_store().add("warming:cycle", os.getpid(), ttl=max(self.interval * 0.9, 1)):
+            return stats
+
+        tasks = self.plan()
+        stats["due"] = len(tasks)
+        for task in tasks:
+            if self._busy():
+                break
+            if BREAKERS[task.upstream].state == OPEN:
+                continue
+            if not self._claim_budget(task.cost):
+                break
+            try:
+                ok = await run_blocking(task.executor, task.refresh)
+            except Exception as e:
+                logger.warning(f"Warming {task.cache_key} failed: {e}")
+                ok = False
+            outcome = "refreshed" if ok else "failed"
+            stats[outcome] += 1
+            WARMING_REFRESHES.inc(kind=task.kind, outcome=outcome)
+
+        stats["skipped"] = stats["due"] - stats["refreshed"] - stats["failed"]
+        self.last_cycle = stats
+        if stats["refreshed"] or stats["failed"]:
+            logger.info(f"Cache warming: {stats}")
+        return stats
+
+    async def run_forever(self) -> None:
+        CLIENT_ID.set("warming")  # queues for threads like any other client
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_cycle()
+            except Exception as e:
+                logger.error(f"Cache warming cycle failed: {e}")
+
+
+WARMER = WarmingScheduler(TRAFFIC)
@@ -3,8 +3,15 @@
  * Handles API communication and UI updates.
  */
 let currentMode = 'general';
-let chatHistory = [];
+let chatHistory = []; // Only used by the HTTP fallback; the WebSocket session keeps history server-side
 const API_BASE = 'http://localhost:8000/api';
+const CHAT_SOCKET_URL = API_BASE.replace(/^http/, 'ws').replace(/\/api$/, '/ws/chat');
+const FALLBACK_HISTORY_TURNS = 6;
+
+// General chat reuses one WebSocket; the server keeps the conversation
+let chatSocket = null;
+let chatSessionId = sessionStorage.getItem('chat_session_id');
+let pendingReply = null;
 
 // Location tracking
 let userLocation = null;
@@ -172,6 +179,60 @@ function updateDistanceDisplay() {
 }
 
 
+function connectChatSocket() {
+    return new Promise((resolve, reject) => {
+        if (chatSocket && chatSocket.readyState === WebSocket.OPEN) return resolve(chatSocket);
+
+        const url = chatSessionId ? `${CHAT_SOCKET_URL}?session_id=${encodeURIComponent(chatSessionId)}` : CHAT_SOCKET_URL;
+        const socket = new WebSocket(url);
+
+        socket.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            if (data.type === 'session') {
+                chatSessionId = data.session_id;
+                sessionStorage.setItem('chat_session_id', chatSessionId);
+                chatSocket = socket;
+                resolve(socket);
+            } else if (pendingReply) {
+                const reply = pendingReply;
+                pendingReply = null;
+                if (data.type === 'response') reply.resolve(data.response);
+                else reply.resolve(`⚠️ ${data.detail}`);
+            }
+        };
+        socket.onerror = () => reject(new Error('Chat socket unavailable'));
+        socket.onclose = () => {
+            if (chatSocket === socket) chatSocket = null;
+            if (pendingReply) {
+                pendingReply.reject(new Error('Chat socket closed'));
+                pendingReply = null;
+            }
+        };
+    });
+}
+
+async function sendGeneralMessage(message, apiKey) {
+    try {
+        const socket = await connectChatSocket();
+        return await new Promise((resolve, reject) => {
+            pendingReply = { resolve, reject };
+            socket.send(JSON.stringify({ message: message, api_key: apiKey || null }));
+        });
+    } catch (e) {
+        // No WebSocket (proxy, old server): fall back to one POST per message
+        const response = await fetch(`${API_BASE}/chat/general`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                message: message,
+                api_key: apiKey || null, // Pass null if empty so backend decides
+                history: chatHistory.slice(-FALLBACK_HISTORY_TURNS)
+            })
+        });
+        return (await response.json()).response;
+    }
+}
+
 async function sendMessage() {
     const input = document.getElementById('chatInput');
     const message = input.value.trim();
@@ -191,16 +252,10 @@ async function sendMessage() {
         let response;
         const headers = { 'Content-Type': 'application/json' };
 
+        let data;
+
         if (currentMode === 'general') {
-            response = await fetch(`${API_BASE}/chat/general`, {
-                method: 'POST',
-                headers: headers,
-                body: JSON.stringify({
-                    message: message,
-                    api_key: apiKey || null, // Pass null if empty so backend decides
-                    history: chatHistory
-                })
-            });
+            data = { response: await sendGeneralMessage(message, apiKey) };
         } else if (currentMode === 'price') {
             response = await fetch(`${API_BASE}/chat/price`, {
                 method: 'POST',
@@ -238,7 +293,7 @@ async function sendMessage() {
             });
         }
 
-        const data = await response.json();
+        if (!data) data = await response.json();
 
         // Remove loading
         const loadingEl = document.getElementById(loadingId);
@@ -248,6 +303,7 @@ async function sendMessage() {
             addMessage('bot', data.response);
             chatHistory.push({ role: 'user', content: message });
             chatHistory.push({ role: 'model', content: data.response });
+            chatHistory = chatHistory.slice(-FALLBACK_HISTORY_TURNS);
         } else if (currentMode === 'price') {
             // Price Comparison Format
             addMessage('bot', data.response);
@@ -453,7 +509,7 @@ function showManualLocationInput() {
     addMessage('bot', `<div class="manual-location-form">
         <h4>Enter Your Location</h4>
         <div class="input-group">
-            <input type="text" id="manualLocationInput" placeholder="City, Zip, or Address..." onkeypress="handleLocationKey(event)">
+            <input type="text" id="manualLocationInput" placeholder="City, e.g. Portland, ME" onkeypress="handleLocationKey(event)">
             <button onclick="searchManualLocation()">Search</button>
         </div>
     </div>`, true);
@@ -470,14 +526,14 @@ async function searchManualLocation() {
     addMessage('bot', '<div class="spinner"></div> Finding location...', true);
 
     try {
-        const response = await fetch(`https://nominatim.openstreetmap.org/search?format=json&q=${encodeURIComponent(query)}`);
-        const data = await response.json();
+        const response = await fetch(`${API_BASE}/geocode?q=${encodeURIComponent(query)}&limit=1`);
+        const data = (await response.json()).results;
 
         if (data && data.length > 0) {
             const loc = data[0];
             userLocation = {
-                latitude: parseFloat(loc.lat),
-                longitude: parseFloat(loc.lon),
+                latitude: loc.latitude,
+                longitude: loc.longitude,
                 accuracy: 0,
                 displayName: loc.display_name
             };
@@ -529,11 +585,11 @@ function showLocationControls(addressOverride = null) {
 
     if (!addressOverride && !userLocation.displayName) {
         // Fetch address if not provided (Auto-detect case)
-        fetch(`https://nominatim.openstreetmap.org/reverse?format=json&lat=${userLocation.latitude}&lon=${userLocation.longitude}`)
-            .then(r => r.json())
+        fetch(`${API_BASE}/reverse-geocode?lat=${userLocation.latitude}&lon=${userLocation.longitude}`)
+            .then(r => r.ok ? r.json() : Promise.reject(new Error('No nearby place')))
             .then(d => {
-                const addr = d.display_name.split(',').slice(0, 3).join(',');
-                userLocation.displayName = d.display_name; // Store full name
+                const addr = `Near ${d.result.display_name}`;
+                userLocation.displayName = addr; // Store full name
                 const addrEl = document.getElementById('locAddress');
                 if (addrEl) addrEl.innerText = addr;
             })
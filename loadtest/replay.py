@@ -0,0 +1,266 @@
+"""
+Deterministic replay of captured production traffic.
+
+Reads a capture log written with CAPTURE_PATH (see backend/capture.py),
+starts the app pointed at a local server that answers every upstream call
+from the recording, and re-sends the captured requests at their original
+pace (or faster, or as fast as possible). Then it prints per-endpoint
+latency for the replay next to what was recorded, so builds can be profiled
+and compared against real traffic shapes with no network access.
+
+Upstream responses are matched by path and query parameters (eBay, Places)
+or by model (Gemini), and served in recorded order, repeating the last one
+once a key's responses run out. Each response is delayed by its recorded
+latency unless --no-upstream-latency is given. A recorded 304 carries no
+body, so a key is answered from its 200 responses instead, with a 304 only
+when the app already holds that version.
+
+Usage:
+    python -m loadtest.replay capture.jsonl
+    python -m loadtest.replay capture.jsonl.1 capture.jsonl --speed 10 --report replay.json
+    python -m loadtest.replay capture.jsonl --speed 0 --concurrency 32 --no-upstream-latency
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlparse
+
+import httpx
+
+from loadtest.run import ScenarioResult, free_port, start_app, wait_healthy
+from loadtest.stubs import StubServer, _Handler
+
+SECRET_PARAMS = {"key", "api_key"}
+
+
+def load_capture(paths: List[str]) -> List[Dict]:
+    """Captured requests from one or more (possibly rotated) logs, oldest first."""
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    records.sort(key=lambda record: record["ts"])
+    return records
+
+
+def http_key(path: str, params: Dict) -> Tuple:
+    return (path, tuple(sorted((k, str(v)) for k, v in params.items() if k not in SECRET_PARAMS)))
+
+
+def recorded_key(call: Dict) -> Tuple:
+    """Match key for a captured upstream call."""
+    if call["upstream"] == "gemini":
+        return ("gemini", call["model"])
+    url = urlparse(call["url"])
+    return http_key(url.path, {**dict(parse_qsl(url.query)), **call.get("params", {})})
+
+
+class Recording:
+    """Recorded upstream responses by match key, handed out in order."""
+
+    def __init__(self, records: List[Dict]):
+        self.responses: Dict[Tuple, List[Dict]] = {}
+        for record in records:
+            for call in record.get("upstream", []):
+                if call["status"] == 304:
+                    continue  # no body to serve; the key's 200s stand in for it
+                self.responses.setdefault(recorded_key(call), []).append(call)
+        self._cursors: Dict[Tuple, int] = {}
+        self._lock = threading.Lock()
+        self.misses = 0
+
+    def next(self, key: Tuple) -> Optional[Dict]:
+        with self._lock:
+            responses = self.responses.get(key)
+            if not responses:
+                self.misses += 1
+                return None
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            return responses[min(cursor, len(responses) - 1)]
+
+
+class _ReplayHandler(_Handler):
+    server: "ReplayServer"
+
+    def _delay(self, call: Dict) -> None:
+        if self.server.upstream_latency:
+            time.sleep(call.get("elapsed_ms", 0) / 1000)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.server.count(url.path)
+        call = self.server.recording.next(http_key(url.path, dict(parse_qsl(url.query))))
+        if call is None:
+            self._send_json(404, {"error": "not in recording"})
+            return
+
+        self._delay(call)
+        body = call.get("body", "").encode("utf-8")
+        etag = call.get("headers", {}).get("ETag")
+        if etag and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(call["status"])
+        for name, value in call.get("headers", {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.count("gemini")
+        model = url.path.rsplit("/", 1)[-1].split(":")[0]
+        call = self.server.recording.next(("gemini", model))
+        if call is None:
+            self._send_json(404, {"error": {"code": 404, "message": f"{model} not found in recording"}})
+            return
+
+        self._delay(call)
+        if call["status"] != 200:
+            self._send_json(call["status"], {"error": {"code": call["status"], "message": call.get("error", "")}})
+            return
+        self._send_json(200, {
+            "candidates": [{"content": {"parts": [{"text": call.get("text", "")}], "role": "model"},
+                            "finishReason": "STOP"}],
+        })
+
+
+class ReplayServer(StubServer):
+    """Stands in for eBay, Places and Gemini, answering from a Recording."""
+
+    def __init__(self, recording: Recording, upstream_latency: bool = True, host: str = "127.0.0.1", port: int = 0):
+        super().__init__(host=host, port=port, handler=_ReplayHandler)
+        self.recording = recording
+        self.upstream_latency = upstream_latency
+
+
+async def replay(base_url: str, records: List[Dict], speed: float = 1.0, concurrency: int = 64,
+                 timeout: float = 120.0) -> Dict[str, ScenarioResult]:
+    """
+    Re-send captured requests, keeping their relative timing.
+
+    Args:
+        base_url: The app under test
+        records: Captured requests, oldest first
+        speed: Time compression (2 = twice as fast); 0 sends as fast as `concurrency` allows
+        concurrency: Most requests in flight at once
+        timeout: Per-request timeout in seconds
+
+    Returns:
+        Replay latencies and statuses per endpoint path
+    """
+    results: Dict[str, ScenarioResult] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    first_ts = records[0]["ts"] if records else 0.0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def send(record: Dict) -> None:
+            result = results.setdefault(record["path"], ScenarioResult(record["path"]))
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.request(
+                        record["method"], record["path"],
+                        params=record.get("query_string") or None,
+                        json=record.get("body"),
+                    )
+                    await response.aread()
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = 0
+                result.latencies.append(time.perf_counter() - started)
+                result.statuses[status] = result.statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        tasks = []
+        for record in records:
+            if speed > 0:
+                due = (record["ts"] - first_ts) / speed
+                delay = due - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(send(record)))
+        await asyncio.gather(*tasks)
+        wall_time = time.perf_counter() - started
+
+    for result in results.values():
+        result.wall_time = wall_time
+    return results
+
+
+def recorded_summary(records: List[Dict]) -> Dict[str, Dict]:
+    """What the captured requests looked like in production, per endpoint path."""
+    results: Dict[str, ScenarioResult] = {}
+    for record in records:
+        result = results.setdefault(record["path"], ScenarioResult(record["path"]))
+        result.latencies.append(record["duration_ms"] / 1000)
+        result.statuses[record["status"]] = result.statuses.get(record["status"], 0) + 1
+    return {path: result.summary() for path, result in results.items()}
+
+
+def run_replay(paths: List[str], speed: float = 1.0, concurrency: int = 64, upstream_latency: bool = True,
+               app_env: Optional[Dict[str, str]] = None) -> Dict:
+    """Replay capture logs against a fresh app; returns recorded and replayed summaries per path."""
+    records = load_capture(paths)
+    recording = Recording(records)
+    server = ReplayServer(recording, upstream_latency=upstream_latency).start()
+    port = free_port()
+    # Warming and capture would add traffic the recording never saw
+    env = {**server.upstream_env(), "CACHE_WARMING": "0", "CAPTURE_PATH": "", **(app_env or {})}
+    app = start_app(port, env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_healthy(base_url)
+        results = asyncio.run(replay(base_url, records, speed, concurrency))
+    finally:
+        app.terminate()
+        app.wait(timeout=10)
+        server.stop()
+
+    return {
+        "requests": len(records),
+        "upstream_misses": recording.misses,
+        "recorded": recorded_summary(records),
+        "replayed": {path: result.summary() for path, result in results.items()},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay captured traffic against the app, offline.")
+    parser.add_argument("capture", nargs="+", help="capture log(s), e.g. capture.jsonl.1 capture.jsonl")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="1 = original pace, 10 = ten times faster, 0 = as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--no-upstream-latency", action="store_true",
+                        help="answer upstream calls immediately instead of after their recorded latency")
+    parser.add_argument("--report", help="write the summaries as JSON to this file")
+    args = parser.parse_args(argv)
+
+    report = run_replay(args.capture, args.speed, args.concurrency, not args.no_upstream_latency)
+
+    print(f"{report['requests']} requests replayed, {report['upstream_misses']} upstream calls not in the recording")
+    print(f"{'endpoint':<28}{'requests':>9}{'rec p50':>10}{'p50':>9}{'rec p95':>10}{'p95':>9}  statuses")
+    for path, replayed in report["replayed"].items():
+        recorded = report["recorded"].get(path, {})
+        print(f"{path:<28}{replayed['requests']:>9}{recorded.get('p50_ms', 0):>10}{replayed['p50_ms']:>9}"
+              f"{recorded.get('p95_ms', 0):>10}{replayed['p95_ms']:>9}  {replayed['statuses']}")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+Offline end-to-end load test.
+
+Starts the upstream stubs, launches the app under uvicorn pointed at them,
+drives the chat endpoints at a target concurrency and reports throughput and
+latency percentiles. Results are checked against budgets.json and the run
+exits non-zero if any budget is exceeded, so performance regressions fail CI.
+
+Usage:
+    python -m loadtest.run --requests 200 --concurrency 16
+    python -m loadtest.run --scenario price --stub-config slow_gemini.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from loadtest.stubs import StubConfig, StubServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "budgets.json")
+
+QUERIES = ["laptop", "iphone 15", "sony headphones", "4k tv", "running shoes", "python book", "camera", "snack box"]
+LOCATIONS = [(40.7128, -74.0060), (37.7749, -122.4194), (12.9716, 77.5946), (51.5074, -0.1278)]
+
+
+def price_payload(i: int) -> Dict:
+    return {"query": QUERIES[i % len(QUERIES)], "country_code": "IN" if i % 3 == 0 else "US"}
+
+
+def nearby_payload(i: int) -> Dict:
+    lat, lon = LOCATIONS[i % len(LOCATIONS)]
+    return {"query": QUERIES[i % len(QUERIES)], "latitude": lat, "longitude": lon, "max_distance": 15}
+
+
+def general_payload(i: int) -> Dict:
+    return {"message": f"Which {QUERIES[i % len(QUERIES)]} should I buy?",
+            "history": [{"role": "user", "content": "hi"}, {"role": "bot", "content": "Hello!"}]}
+
+
+SCENARIOS: Dict[str, Tuple[str, Callable[[int], Dict]]] = {
+    "price": ("/api/chat/price", price_payload),
+    "nearby": ("/api/chat/nearby-stores", nearby_payload),
+    "general": ("/api/chat/general", general_payload),
+}
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    statuses: Dict[int, int] = field(default_factory=dict)
+    wall_time: float = 0.0
+
+    @property
+    def requests(self) -> int:
+        return sum(self.statuses.values())
+
+    @property
+    def errors(self) -> int:
+        return sum(count for status, count in self.statuses.items() if status >= 400 or status == 0)
+
+    def percentile(self, p: float) -> float:
+        """Nearest-rank percentile of the latencies, in milliseconds."""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+        return ordered[index] * 1000
+
+    def summary(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "throughput_rps": round(self.requests / self.wall_time, 2) if self.wall_time else 0.0,
+            "p50_ms": round(self.percentile(50), 1),
+            "p95_ms": round(self.percentile(95), 1),
+            "p99_ms": round(self.percentile(99), 1),
+            "error_rate": round(self.errors / self.requests, 4) if self.requests else 0.0,
+            "statuses": {str(k): v for k, v in sorted(self.statuses.items())},
+        }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# The load generator is a single client standing in for many users, so
+# per-client quotas are off unless a run's app_env turns them back on
+UNLIMITED_QUOTAS = {"QUOTA_SCRAPE_PER_MINUTE": "0", "QUOTA_PLACES_PER_MINUTE": "0", "QUOTA_LLM_PER_MINUTE": "0"}
+
+
+def start_app(port: int, env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env={**os.environ, **UNLIMITED_QUOTAS, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_healthy(base_url: str, timeout: float = 30.0) -> float:
+    """Poll /health until it answers; returns the seconds it took."""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1.0).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError(f"App at {base_url} did not become healthy within {timeout}s")
+
+
+async def drive(base_url: str, name: str, total: int, concurrency: int, timeout: float = 60.0) -> ScenarioResult:
+    """Send `total` requests for one scenario with at most `concurrency` in flight."""
+    path, make_payload = SCENARIOS[name]
+    result = ScenarioResult(name)
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker() -> None:
+            for i in counter:
+                started = time.perf_counter()
+                try:
+                    status = (await client.post(path, json=make_payload(i))).status_code
+                except httpx.HTTPError:
+                    status = 0
+                result.latencies.append(time.perf_counter() - started)
+                result.statuses[status] = result.statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        result.wall_time = time.perf_counter() - started
+    return result
+
+
+def check_budgets(summaries: Dict[str, Dict], budgets: Dict[str, Dict]) -> List[str]:
+    """Compare scenario summaries against budgets; returns human-readable violations."""
+    violations = []
+    for name, summary in summaries.items():
+        budget = budgets.get(name, {})
+        for key in ("p50_ms", "p95_ms", "p99_ms", "error_rate"):
+            if key in budget and summary[key] > budget[key]:
+                violations.append(f"{name}: {key} {summary[key]} exceeds budget {budget[key]}")
+        if "min_throughput_rps" in budget and summary["throughput_rps"] < budget["min_throughput_rps"]:
+            violations.append(
+                f"{name}: throughput {summary['throughput_rps']} rps below budget {budget['min_throughput_rps']}")
+    return violations
+
+
+def run_load(
+    scenarios: List[str],
+    requests: int,
+    concurrency: int,
+    stub_config: Optional[StubConfig] = None,
+    budgets: Optional[Dict[str, Dict]] = None,
+    app_env: Optional[Dict[str, str]] = None
+) -> Tuple[Dict[str, Dict], List[str]]:
+    """Run the whole harness; returns (summaries per scenario, budget violations)."""
+    stub = StubServer(stub_config).start()
+    port = free_port()
+    app = start_app(port, {**stub.upstream_env(), **(app_env or {})})
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_healthy(base_url)
+        summaries = {}
+        for name in scenarios:
+            summaries[name] = asyncio.run(drive(base_url, name, requests, concurrency)).summary()
+        return summaries, check_budgets(summaries, budgets or {})
+    finally:
+        app.terminate()
+        app.wait(timeout=10)
+        stub.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline load test against stub upstreams.")
+    parser.add_argument("--scenario", choices=[*SCENARIOS, "all"], default="all")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--budgets", default=DEFAULT_BUDGETS, help="JSON file of per-scenario budgets")
+    parser.add_argument("--stub-config", help="JSON file with upstream latency/error settings")
+    parser.add_argument("--report", help="write the summaries as JSON to this file")
+    args = parser.parse_args(argv)
+
+    scenarios = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    stub_config = None
+    if args.stub_config:
+        with open(args.stub_config) as f:
+            stub_config = StubConfig.from_dict(json.load(f))
+    budgets = {}
+    if args.budgets and os.path.exists(args.budgets):
+        with open(args.budgets) as f:
+            budgets = json.load(f)
+
+    summaries, violations = run_load(scenarios, args.requests, args.concurrency, stub_config, budgets)
+
+    print(f"{'scenario':<10}{'reqs':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}")
+    for name, s in summaries.items():
+        print(f"{name:<10}{s['requests']:>7}{s['throughput_rps']:>9}{s['p50_ms']:>10}"
+              f"{s['p95_ms']:>10}{s['p99_ms']:>10}{s['error_rate']:>9.2%}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(summaries, f, indent=2)
+
+    for violation in violations:
+        print(f"BUDGET EXCEEDED - {violation}")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
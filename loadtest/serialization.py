@@ -0,0 +1,95 @@
+"""
+Serialization microbenchmark for the chat endpoints' response bodies.
+
+Compares, for price and store lists of 100 and 1000 items, the time to turn
+the handler's return value into response bytes via:
+  - default:   plain dict -> jsonable_encoder -> json (what the endpoints did)
+  - validated: response_model validation + serialization -> json
+  - fast:      FastJSONResponse (orjson, no re-validation; what they do now)
+
+Usage:
+    python -m loadtest.serialization --repeat 50
+"""
+import argparse
+import sys
+import timeit
+from typing import Callable, Dict, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from backend.location_service import generate_mock_store_batch
+from backend.ranking import rank_stores
+from backend.records import ProductRecord
+from backend.responses import FastJSONResponse, NearbyStoresResponse, PriceComparisonResponse, orjson
+
+SIZES = (100, 1000)
+
+
+def price_payload(count: int) -> Dict:
+    data = [
+        ProductRecord(
+            source="Amazon US", title=f"Laptop model {i} with a reasonably long listing title",
+            price=f"${500 + i:.2f}", shipping="Free (Est.)", link=f"https://www.amazon.com/s?k=laptop&i={i}",
+            approx_price=None if i % 2 else f"${500 + i:.2f}", price_val_usd=500.0 + i, is_estimate=bool(i % 2),
+        ).to_dict()
+        for i in range(count)
+    ]
+    return {"response": "Here are the price comparisons I found:", "data": data}
+
+
+def stores_payload(count: int) -> Dict:
+    stores = rank_stores(generate_mock_store_batch(40.7128, -74.0060, "laptop", 0, 25, count, seed=1).to_dicts())
+    return {"response": "Top picks nearby.", "data": stores, "total_stores": len(stores), "search_radius": "0-25km"}
+
+
+def encode_default(payload: Dict) -> bytes:
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def encoder_validated(model) -> Callable[[Dict], bytes]:
+    def encode(payload: Dict) -> bytes:
+        return JSONResponse(jsonable_encoder(model.model_validate(payload).model_dump(exclude_none=True))).body
+    return encode
+
+
+def encode_fast(payload: Dict) -> bytes:
+    return FastJSONResponse(payload).body
+
+
+def run_benchmark(repeat: int = 50, sizes=SIZES) -> List[Dict]:
+    """Best-of-`repeat` milliseconds per encode, for each payload kind, size and encoder."""
+    rows = []
+    for kind, build, model in (("price", price_payload, PriceComparisonResponse),
+                               ("stores", stores_payload, NearbyStoresResponse)):
+        for size in sizes:
+            payload = build(size)
+            timings = {}
+            for name, encode in (("default", encode_default), ("validated", encoder_validated(model)),
+                                 ("fast", encode_fast)):
+                timings[name] = min(timeit.repeat(lambda: encode(payload), number=1, repeat=repeat)) * 1000
+            rows.append({
+                "payload": kind,
+                "items": size,
+                **{f"{name}_ms": round(ms, 3) for name, ms in timings.items()},
+                "speedup": round(timings["default"] / timings["fast"], 1) if timings["fast"] else 0.0,
+            })
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark response serialization.")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    if orjson is None:
+        print("orjson is not installed; the fast path falls back to the json module")
+    print(f"{'payload':<9}{'items':>7}{'default ms':>12}{'validated ms':>14}{'fast ms':>10}{'speedup':>9}")
+    for row in run_benchmark(args.repeat):
+        print(f"{row['payload']:<9}{row['items']:>7}{row['default_ms']:>12}{row['validated_ms']:>14}"
+              f"{row['fast_ms']:>10}{row['speedup']:>8}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Cold-start benchmark.
+
+Measures, over several fresh interpreters:
+  - import_ms:        time to `import backend.main`
+  - first_healthy_ms: time from spawning uvicorn to the first 200 from /health
+  - heavy_modules:    heavy SDKs that were loaded by the import (should be none)
+
+The medians are checked against the "startup" entry in budgets.json, so a new
+eager import of a heavy SDK fails CI the same way a latency regression does.
+
+Usage:
+    python -m loadtest.startup --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from loadtest.run import DEFAULT_BUDGETS, ROOT, free_port, start_app, wait_healthy
+
+_IMPORT_PROBE = (
+    "import json, sys, time\n"
+    "started = time.perf_counter()\n"
+    "import backend.main\n"
+    "elapsed = time.perf_counter() - started\n"
+    "from backend.startup import HEAVY_MODULES\n"
+    "print(json.dumps({'seconds': elapsed, 'heavy': [m for m in HEAVY_MODULES if m in sys.modules]}))\n"
+)
+
+
+def measure_import() -> Dict:
+    """Import backend.main in a fresh interpreter; returns seconds and heavy modules loaded."""
+    output = subprocess.run(
+        [sys.executable, "-c", _IMPORT_PROBE],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_first_healthy(env: Optional[Dict[str, str]] = None) -> float:
+    """Seconds from spawning the server process to its first healthy response."""
+    port = free_port()
+    started = time.perf_counter()
+    app = start_app(port, env or {})
+    try:
+        wait_healthy(f"http://127.0.0.1:{port}")
+        return time.perf_counter() - started
+    finally:
+        app.terminate()
+        app.wait(timeout=10)
+
+
+def run_startup(runs: int = 5, budget: Optional[Dict] = None) -> Tuple[Dict, List[str]]:
+    """Run the benchmark; returns (summary, budget violations)."""
+    imports = [measure_import() for _ in range(runs)]
+    healthy = [measure_first_healthy() for _ in range(runs)]
+    heavy = sorted({m for result in imports for m in result["heavy"]})
+
+    summary = {
+        "runs": runs,
+        "import_ms": round(statistics.median(r["seconds"] for r in imports) * 1000, 1),
+        "first_healthy_ms": round(statistics.median(healthy) * 1000, 1),
+        "heavy_modules": heavy,
+    }
+
+    violations = []
+    budget = budget or {}
+    for key in ("import_ms", "first_healthy_ms"):
+        if key in budget and summary[key] > budget[key]:
+            violations.append(f"startup: {key} {summary[key]} exceeds budget {budget[key]}")
+    if heavy:
+        violations.append(f"startup: heavy modules imported eagerly: {', '.join(heavy)}")
+    return summary, violations
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure import time and time to first healthy response.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budgets", default=DEFAULT_BUDGETS, help="JSON file with a 'startup' entry")
+    args = parser.parse_args(argv)
+
+    budget = {}
+    if args.budgets and os.path.exists(args.budgets):
+        with open(args.budgets) as f:
+            budget = json.load(f).get("startup", {})
+
+    summary, violations = run_startup(args.runs, budget)
+    print(f"import backend.main: {summary['import_ms']} ms (median of {summary['runs']})")
+    print(f"spawn to healthy:    {summary['first_healthy_ms']} ms (median of {summary['runs']})")
+    for violation in violations:
+        print(f"BUDGET EXCEEDED - {violation}")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
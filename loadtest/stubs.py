@@ -0,0 +1,244 @@
+"""
+Local stand-ins for the upstream services, for offline load tests.
+
+One threaded HTTP server answers, on different paths:
+  - eBay search pages          GET  /sch/i.html?_nkw=...
+  - Places nearbysearch        GET  /maps/api/place/nearbysearch/json
+  - Places details             GET  /maps/api/place/details/json
+  - Gemini generate_content    POST /v1beta/models/<model>:generateContent
+
+eBay pages and place details carry ETags and answer If-None-Match with 304,
+like the real services do for unchanged content.
+
+Each upstream has its own latency (base + uniform jitter) and error rate, so
+slow or failing dependencies can be simulated independently.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+@dataclass
+class UpstreamProfile:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 500
+
+    def delay(self) -> None:
+        seconds = (self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+@dataclass
+class StubConfig:
+    ebay: UpstreamProfile = field(default_factory=lambda: UpstreamProfile(latency_ms=150, jitter_ms=100))
+    places: UpstreamProfile = field(default_factory=lambda: UpstreamProfile(latency_ms=60, jitter_ms=40))
+    gemini: UpstreamProfile = field(default_factory=lambda: UpstreamProfile(latency_ms=400, jitter_ms=300,
+                                                                            error_status=429))
+    listings_per_page: int = 40
+    places_per_page: int = 20
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "StubConfig":
+        config = cls()
+        for name in ("ebay", "places", "gemini"):
+            for key, value in data.get(name, {}).items():
+                setattr(getattr(config, name), key, value)
+        config.listings_per_page = data.get("listings_per_page", config.listings_per_page)
+        config.places_per_page = data.get("places_per_page", config.places_per_page)
+        return config
+
+
+def _seed(text: str) -> int:
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def ebay_search_page(query: str, count: int, page: int = 1) -> str:
+    """A search results page in eBay's s-item markup, deterministic per query."""
+    rng = random.Random(_seed(f"{query}:{page}"))
+    base = rng.uniform(20, 900)
+    items = []
+    for i in range(count):
+        price = base * rng.uniform(0.7, 1.4)
+        shipping = rng.choice(["Free shipping", f"+${rng.uniform(3, 25):.2f} shipping", "Free delivery"])
+        items.append(
+            '<li class="s-item">'
+            f'<a class="s-item__link" href="https://www.ebay.com/itm/{_seed(query) % 10**9}{page:02d}{i:03d}">'
+            f'<div class="s-item__title"><span>{query.title()} - listing {page}-{i}</span></div></a>'
+            f'<span class="s-item__price">${price:,.2f}</span>'
+            f'<span class="s-item__shipping">{shipping}</span>'
+            '</li>'
+        )
+    return (
+        "<html><head><title>eBay</title></head><body>"
+        '<ul class="srp-results">' + "".join(items) + "</ul>"
+        + "<footer>" + "x" * 2000 + "</footer></body></html>"
+    )
+
+
+def places_nearby(lat: float, lon: float, count: int, keyword: str, page_token: Optional[str]) -> Dict:
+    rng = random.Random(_seed(f"{lat:.3f},{lon:.3f},{keyword},{page_token}"))
+    results = []
+    for i in range(count):
+        place_id = f"stub-{_seed(f'{lat},{lon},{keyword},{page_token},{i}')}"
+        results.append({
+            "place_id": place_id,
+            "name": f"Stub Store {i}",
+            "vicinity": f"{rng.randint(1, 999)} Stub Street",
+            "geometry": {"location": {"lat": lat + rng.uniform(-0.1, 0.1), "lng": lon + rng.uniform(-0.1, 0.1)}},
+            "rating": round(rng.uniform(3, 5), 1),
+            "user_ratings_total": rng.randint(5, 5000),
+            "opening_hours": {"open_now": rng.random() > 0.3},
+        })
+    data = {"status": "OK", "results": results}
+    if page_token is None:
+        data["next_page_token"] = "stub-page-2"
+    return data
+
+
+def gemini_response(prompt: str) -> Dict:
+    text = f"Stub recommendation for a {len(prompt)}-character prompt."
+    return {
+        "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}],
+        "usageMetadata": {
+            "promptTokenCount": len(prompt) // 4,
+            "candidatesTokenCount": len(text) // 4,
+            "totalTokenCount": (len(prompt) + len(text)) // 4,
+        },
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "StubServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_cacheable(self, body: bytes, content_type: str) -> None:
+        """200 with a strong ETag, or an empty 304 if the client already has this body."""
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data: Dict) -> None:
+        self._send(status, json.dumps(data).encode("utf-8"), "application/json")
+
+    def _fail_if_injected(self, profile: UpstreamProfile) -> bool:
+        profile.delay()
+        if profile.should_fail():
+            self._send_json(profile.error_status, {"error": {"code": profile.error_status, "message": "injected"}})
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        config = self.server.config
+        self.server.count(url.path)
+
+        if url.path == "/sch/i.html":
+            if self._fail_if_injected(config.ebay):
+                return
+            page = int(params.get("_pgn", "1"))
+            html = ebay_search_page(params.get("_nkw", "").replace("+", " "), config.listings_per_page, page)
+            self._send_cacheable(html.encode("utf-8"), "text/html; charset=utf-8")
+        elif url.path == "/maps/api/place/nearbysearch/json":
+            if self._fail_if_injected(config.places):
+                return
+            lat, lon = (float(x) for x in params.get("location", "0,0").split(","))
+            self._send_json(200, places_nearby(lat, lon, config.places_per_page,
+                                               params.get("keyword", ""), params.get("pagetoken")))
+        elif url.path == "/maps/api/place/details/json":
+            if self._fail_if_injected(config.places):
+                return
+            details = {"status": "OK", "result": {
+                "formatted_phone_number": "+1 555-0100", "website": "https://stub.example"}}
+            self._send_cacheable(json.dumps(details).encode("utf-8"), "application/json")
+        else:
+            self._send_json(404, {"error": "unknown stub path"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.count("gemini")
+
+        if url.path.startswith("/v1beta/models/") and url.path.endswith(":generateContent"):
+            if self._fail_if_injected(self.server.config.gemini):
+                return
+            try:
+                prompt = json.loads(body)["contents"][0]["parts"][0]["text"]
+            except (ValueError, KeyError, IndexError):
+                prompt = ""
+            self._send_json(200, gemini_response(prompt))
+        else:
+            self._send_json(404, {"error": "unknown stub path"})
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0,
+                 handler=_Handler):
+        super().__init__((host, port), handler)
+        self.config = config or StubConfig()
+        self.calls: Dict[str, int] = {}
+        self._calls_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def count(self, path: str) -> None:
+        with self._calls_lock:
+            self.calls[path] = self.calls.get(path, 0) + 1
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def upstream_env(self) -> Dict[str, str]:
+        """Environment variables that point the app at this stub."""
+        return {
+            "EBAY_BASE_URL": self.base_url,
+            "PLACES_BASE_URL": f"{self.base_url}/maps/api/place",
+            "GEMINI_BASE_URL": self.base_url,
+            "GEMINI_API_KEY": "stub-gemini-key",
+            "GOOGLE_PLACES_API_KEY": "stub-places-key",
+            "NOMINATIM_URL": "",  # the stub has no geocoder; keep lookups on the local gazetteer
+        }
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="upstream-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
@@ -11,3 +11,8 @@ def test_read_health():
 def test_static_files():
     response = client.get("/")
     assert response.status_code == 200
+
+def test_nearby_stores_rejects_non_positive_limit():
+    response = client.post("/api/chat/nearby-stores",
+                           json={"query": "laptop", "latitude": 40.7, "longitude": -74.0, "limit": 0})
+    assert response.status_code == 422
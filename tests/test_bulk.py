@@ -0,0 +1,83 @@
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import bulk, main
+from backend.main import app
+
+client = TestClient(app)
+
+
+def _lines(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_bulk_price_streams_one_line_per_item(monkeypatch):
+    monkeypatch.setattr(bulk, "custom_scraper", lambda query, country_code="US": [{"title": query, "price": "$1"}])
+    items = [{"query": f"sku {i}", "id": str(i)} for i in range(5)] + [{"query": "tv", "country_code": "IN"}]
+
+    response = client.post("/api/bulk/price", json={"items": items, "concurrency": 3})
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = _lines(response)
+    results, done = lines[:-1], lines[-1]
+    assert sorted(line["index"] for line in results) == list(range(6))
+    assert all(line["status"] == "ok" and "summary" not in line for line in results)
+    assert {line["id"] for line in results} == {"0", "1", "2", "3", "4", None}
+    assert done == {**done, "done": True, "total": 6, "ok": 6}
+
+
+def test_bulk_price_reports_items_past_the_deadline(monkeypatch):
+    def slow_scraper(query, country_code="US"):
+        time.sleep(0.3)
+        return [{"title": query}]
+
+    monkeypatch.setattr(bulk, "custom_scraper", slow_scraper)
+
+    response = client.post("/api/bulk/price", json={
+        "items": [{"query": f"sku {i}"} for i in range(4)], "concurrency": 1, "deadline_seconds": 0.5})
+
+    done = _lines(response)[-1]
+    assert done["ok"] >= 1
+    assert done["deadline_exceeded"] >= 1
+    assert done["ok"] + done["deadline_exceeded"] == 4
+
+
+def test_bulk_price_rejects_empty_batches():
+    assert client.post("/api/bulk/price", json={"items": []}).status_code == 400
+
+
+def test_bulk_price_rejects_unbounded_deadlines():
+    for deadline in (1e9, 0, -5):
+        response = client.post("/api/bulk/price", json={"items": [{"query": "tv"}], "deadline_seconds": deadline})
+        assert response.status_code == 422
+
+
+def test_bulk_slot_is_released_when_the_client_goes_away(monkeypatch):
+    monkeypatch.setattr(bulk, "custom_scraper", lambda query, country_code="US": [{"title": query}])
+    limiter = main.LIMITERS["bulk"]
+    before = limiter.in_flight
+    body = json.dumps({"items": [{"query": "tv"}]}).encode()
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+             "scheme": "http", "path": "/api/bulk/price", "raw_path": b"/api/bulk/price", "root_path": "",
+             "query_string": b"", "headers": [(b"content-type", b"application/json")],
+             "client": ("127.0.0.1", 5000), "server": ("testserver", 80)}
+
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Event().wait()  # no disconnect message; the failed send is all we see
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            raise OSError("client disconnected")
+
+    with pytest.raises(OSError):
+        asyncio.run(main.app(scope, receive, send))
+
+    assert limiter.in_flight == before
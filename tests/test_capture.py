@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend import capture
+from backend.capture import CaptureLog, CaptureMiddleware, record_gemini, record_http, sanitize
+from backend.metrics import MetricsMiddleware, stage_timer
+from loadtest.replay import Recording, http_key
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {"ETag": '"v1"', "Content-Type": "text/html", "Set-Cookie": "session=1"}
+    text = "<html>listings</html>"
+
+
+def test_sanitize_drops_keys_at_any_depth():
+    body = {"query": "laptop", "api_key": "a", "nested": [{"google_api_key": "b", "keep": 1}]}
+
+    assert sanitize(body) == {"query": "laptop", "nested": [{"keep": 1}]}
+
+
+def test_middleware_logs_request_with_upstream_calls(tmp_path):
+    app = FastAPI()
+
+    @app.post("/api/chat/price")
+    def price(payload: dict):
+        with stage_timer("ebay_fetch"):
+            record_http("ebay", "https://www.ebay.com/sch/i.html", {"_nkw": "laptop", "key": "k"}, FakeResponse(), 0.12)
+        record_gemini("gemini-2.0-flash", 200, 0.3, text="Buy the cheaper one")
+        return {"ok": True}
+
+    @app.get("/health")
+    def health():
+        return {"status": "healthy"}
+
+    log = CaptureLog(str(tmp_path / "capture.jsonl"))
+    app.add_middleware(CaptureMiddleware, log=log)
+    app.add_middleware(MetricsMiddleware)
+    client = TestClient(app)
+
+    assert client.post("/api/chat/price?api_key=x&q=1", json={"query": "laptop", "api_key": "secret"}).status_code == 200
+    client.get("/health")
+    log.close()
+
+    lines = (tmp_path / "capture.jsonl").read_text().splitlines()
+    assert len(lines) == 1  # only /api/ requests are captured
+    record = json.loads(lines[0])
+    assert "secret" not in lines[0] and "api_key" not in lines[0]
+    assert record["query_string"] == "q=1"
+    assert record["body"] == {"query": "laptop"}
+    assert record["status"] == 200
+    assert record["stages"][0][0] == "ebay_fetch"
+    ebay, gemini = record["upstream"]
+    assert ebay["params"] == {"_nkw": "laptop"}
+    assert ebay["headers"] == {"ETag": '"v1"', "Content-Type": "text/html"}
+    assert ebay["body"] == "<html>listings</html>"
+    assert gemini["text"] == "Buy the cheaper one"
+
+
+def test_records_are_serialized_off_the_calling_thread(tmp_path, monkeypatch):
+    threads = []
+    dumps = json.dumps
+
+    def tracking_dumps(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return dumps(*args, **kwargs)
+
+    monkeypatch.setattr(capture.json, "dumps", tracking_dumps)
+    log = CaptureLog(str(tmp_path / "capture.jsonl"))
+    log.write({"path": "/api/chat/price", "upstream": [{"body": "é" * 100_000}]})
+    log.close()
+
+    assert threads and threading.current_thread() not in threads
+    record = json.loads((tmp_path / "capture.jsonl").read_text(encoding="utf-8"))
+    assert record["upstream"][0]["body"] == "é" * 100_000
+
+
+def test_recording_serves_responses_in_order_then_repeats_last():
+    calls = [{"upstream": "ebay", "url": "https://www.ebay.com/sch/i.html", "params": {"_nkw": "laptop"},
+              "status": status, "body": body} for status, body in ((200, "first"), (304, ""), (200, "second"))]
+    recording = Recording([{"ts": time.time(), "upstream": calls}])
+    key = http_key("/sch/i.html", {"_nkw": "laptop", "key": "stub"})
+
+    assert [recording.next(key)["body"] for _ in range(3)] == ["first", "second", "second"]
+    assert recording.next(http_key("/sch/i.html", {"_nkw": "phone"})) is None
+    assert recording.misses == 1
@@ -0,0 +1,18 @@
+from backend.categories import classify_query
+from backend.location_service import determine_store_types
+
+
+def test_classify_query_prefers_longest_keyword():
+    assert classify_query("Sony WH-1000XM5 Headphones") == ("electronics", "headphones")
+    assert classify_query("MacBook Air") == ("electronics", "laptop")
+
+
+def test_classify_query_is_memoized_per_normalized_query():
+    assert classify_query("  Gaming   COMPUTER ") is classify_query("gaming computer")
+
+
+def test_store_types_and_price_ranges_share_one_classification():
+    assert determine_store_types("fashion jacket") == ["clothing_store", "shoe_store", "store"]
+    assert determine_store_types("computer mouse")[0] == "electronics_store"
+    assert classify_query("paperback book").price_range == (10, 50)
+    assert classify_query("garden hose").category == "general"
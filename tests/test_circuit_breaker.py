@@ -0,0 +1,112 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import circuit_breaker
+from backend.ai_agent import AIModel
+from backend.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+from backend.main import app
+
+
+def _fail():
+    raise ConnectionError("upstream down")
+
+
+def _trip(breaker):
+    for _ in range(breaker.min_calls):
+        with pytest.raises(ConnectionError):
+            breaker.call(_fail)
+
+
+def test_opens_at_failure_threshold_and_fails_fast():
+    breaker = CircuitBreaker("test", min_calls=4, failure_threshold=0.5, open_seconds=60)
+    breaker.call(lambda: "ok")
+    breaker.call(lambda: "ok")
+    with pytest.raises(ConnectionError):
+        breaker.call(_fail)
+    assert breaker.state == CLOSED  # 1 failure in 3 calls: below min_calls
+
+    with pytest.raises(ConnectionError):
+        breaker.call(_fail)
+    assert breaker.state == OPEN  # 2 of 4 failed
+
+    calls = []
+    started = time.perf_counter()
+    with pytest.raises(CircuitOpen) as excinfo:
+        breaker.call(calls.append, "sent")
+    assert calls == []
+    assert time.perf_counter() - started < 0.01
+    assert 0 < excinfo.value.retry_after <= 60
+
+
+def test_result_check_and_slow_calls_count_as_failures():
+    breaker = CircuitBreaker("test", min_calls=2, failure_threshold=1.0, slow_call_seconds=0.01)
+    breaker.call(lambda: 503, is_failure=lambda status: status >= 500)
+    breaker.call(time.sleep, 0.02)
+    assert breaker.state == OPEN
+
+
+def test_half_open_probe_closes_or_reopens():
+    breaker = CircuitBreaker("test", min_calls=2, open_seconds=0.05)
+    _trip(breaker)
+    time.sleep(0.06)
+
+    breaker.allow()  # the probe
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.allow()  # only one probe at a time
+    breaker.record(False, 0.001)
+    assert breaker.state == OPEN
+
+    time.sleep(0.06)
+    assert breaker.call(lambda: "back") == "back"
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["failure_rate"] == 0.0
+
+
+def test_snapshot_reports_recent_latency():
+    breaker = CircuitBreaker("test")
+    for seconds in (0.01, 0.02, 0.03, 0.04):
+        breaker.allow()
+        breaker.record(True, seconds)
+    snapshot = breaker.snapshot()
+    assert snapshot["state"] == CLOSED
+    assert snapshot["calls"] == 4
+    assert snapshot["p50_ms"] == 20.0
+    assert snapshot["p95_ms"] == 40.0
+
+
+def test_deep_health_reports_open_upstream(monkeypatch):
+    places = CircuitBreaker("places", min_calls=1, open_seconds=60)
+    monkeypatch.setitem(circuit_breaker.BREAKERS, "places", places)
+    client = TestClient(app)
+
+    assert client.get("/health").json() == {"status": "healthy"}
+    assert client.get("/health?deep=true").json()["status"] == "healthy"
+
+    with pytest.raises(ConnectionError):
+        places.call(_fail)
+    body = client.get("/health?deep=true").json()
+    assert body["status"] == "degraded"
+    assert body["upstreams"]["places"]["state"] == OPEN
+    assert body["upstreams"]["ebay"]["state"] == CLOSED
+
+
+def test_gemini_success_is_recorded_once_even_if_bookkeeping_fails(monkeypatch):
+    agent = AIModel()
+    agent.client = SimpleNamespace(models=SimpleNamespace(
+        generate_content=lambda model, contents: SimpleNamespace(text="ok", usage_metadata=None)))
+    agent.breaker = CircuitBreaker("gemini-test")
+
+    def broken_usage(model_name, response):
+        raise RuntimeError("metrics backend hiccup")
+
+    monkeypatch.setattr(agent, "_record_usage", broken_usage)
+    with pytest.raises(RuntimeError):
+        agent.generate_response("hi")
+
+    snapshot = agent.breaker.snapshot()
+    assert snapshot["calls"] == 1
+    assert snapshot["failure_rate"] == 0
@@ -0,0 +1,151 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.concurrency import AdmissionLimiter, FairDispatcher, ServiceOverloaded, drain
+
+
+def test_full_queue_is_shed_immediately():
+    async def scenario():
+        limiter = AdmissionLimiter("test", max_in_flight=1, max_queue=0, queue_timeout=5)
+        await limiter.acquire()
+        with pytest.raises(ServiceOverloaded):
+            await limiter.acquire()
+
+    asyncio.run(scenario())
+
+
+def test_queued_request_times_out_then_next_gets_released_slot():
+    async def scenario():
+        limiter = AdmissionLimiter("test", max_in_flight=1, max_queue=1, queue_timeout=0.05)
+        await limiter.acquire()
+        with pytest.raises(ServiceOverloaded):
+            await limiter.acquire()
+        assert limiter.queued == 0
+
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        limiter.release()
+        await waiter
+        assert limiter.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_saturated_endpoint_returns_503_with_retry_after(monkeypatch):
+    monkeypatch.setitem(main.LIMITERS, "price", AdmissionLimiter("price", 0, 0, 3))
+    client = TestClient(main.app)
+
+    response = client.post("/api/chat/price", json={"query": "laptop"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+    assert client.get("/health").status_code == 200
+
+
+def test_waiters_are_served_round_robin_across_clients():
+    async def scenario():
+        limiter = AdmissionLimiter("test", max_in_flight=1, max_queue=10, queue_timeout=5)
+        await limiter.acquire()
+        order = []
+
+        async def request(client, n):
+            await limiter.acquire(client)
+            order.append(f"{client}{n}")
+            limiter.release()
+
+        tasks = [asyncio.ensure_future(request("bulk", n)) for n in range(3)]
+        tasks.append(asyncio.ensure_future(request("chat", 0)))
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    # The chat request waits one turn, not behind the whole bulk backlog
+    assert asyncio.run(scenario()) == ["bulk0", "chat0", "bulk1", "bulk2"]
+
+
+def test_one_client_cannot_fill_the_whole_queue():
+    async def scenario():
+        limiter = AdmissionLimiter("test", max_in_flight=1, max_queue=4, queue_timeout=5, max_queue_per_client=1)
+        await limiter.acquire()
+        first = asyncio.ensure_future(limiter.acquire("bulk"))
+        await asyncio.sleep(0)
+        with pytest.raises(ServiceOverloaded):
+            await limiter.acquire("bulk")
+        other = asyncio.ensure_future(limiter.acquire("chat"))
+        await asyncio.sleep(0)
+        assert limiter.queued == 2
+        for _ in range(3):
+            limiter.release()
+        await asyncio.gather(first, other)
+
+    asyncio.run(scenario())
+
+
+def test_blocking_calls_share_threads_round_robin():
+    started = []
+    gate = threading.Event()
+
+    def job(name):
+        started.append(name)
+        gate.wait(5)
+
+    async def scenario():
+        dispatcher = FairDispatcher(ThreadPoolExecutor(max_workers=1))
+        calls = [dispatcher.run(functools.partial(job, name), client)
+                 for name, client in (("bulk0", "bulk"), ("bulk1", "bulk"), ("bulk2", "bulk"), ("chat0", "chat"))]
+        tasks = [asyncio.ensure_future(call) for call in calls]
+        await asyncio.sleep(0.05)
+        gate.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert started == ["bulk0", "bulk1", "chat0", "bulk2"]
+
+
+def test_drain_waits_for_calls_whose_request_was_cancelled():
+    async def scenario():
+        dispatcher = FairDispatcher(ThreadPoolExecutor(max_workers=1))
+        call = asyncio.ensure_future(dispatcher.run(functools.partial(time.sleep, 0.3), "client"))
+        await asyncio.sleep(0.05)
+        call.cancel()  # e.g. the client disconnected; the thread keeps sleeping
+        started = time.perf_counter()
+        stranded = await drain(5)
+        return stranded, time.perf_counter() - started
+
+    stranded, waited = asyncio.run(scenario())
+
+    assert stranded == 0
+    assert waited >= 0.2
+
+
+def test_cancelled_call_keeps_its_thread_until_the_job_finishes():
+    finished = threading.Event()
+
+    def slow():
+        time.sleep(0.3)
+        finished.set()
+
+    async def scenario():
+        dispatcher = FairDispatcher(ThreadPoolExecutor(max_workers=1))
+        call = asyncio.ensure_future(dispatcher.run(slow, "a"))
+        await asyncio.sleep(0.05)
+        nxt = asyncio.ensure_future(dispatcher.run(finished.is_set, "b"))
+        await asyncio.sleep(0.01)
+        call.cancel()
+        await asyncio.sleep(0.05)
+        still_queued = len(dispatcher._waiters)
+        return still_queued, await nxt, dispatcher.running
+
+    still_queued, saw_finished, running_after = asyncio.run(scenario())
+
+    assert still_queued == 1  # the thread was not handed on while the first job still ran
+    assert saw_finished  # the next call only got the thread once the first job was done
+    assert running_after == 0
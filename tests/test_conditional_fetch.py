@@ -0,0 +1,67 @@
+from backend import conditional_fetch
+from backend.conditional_fetch import fetch_parsed
+from backend.metrics import CONDITIONAL_FETCHES
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.text = content.decode("utf-8")
+        self.headers = headers or {}
+
+
+def _serve(monkeypatch, responses):
+    """Patch requests.get to return `responses` in turn, recording request headers."""
+    sent = []
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        sent.append(headers or {})
+        return responses[len(sent) - 1]
+
+    monkeypatch.setattr("requests.get", fake_get)
+    return sent
+
+
+def _parser(calls):
+    def parse(response):
+        calls.append(response.text)
+        return [response.text.upper()]
+    return parse
+
+
+def test_not_modified_reuses_previous_result(monkeypatch):
+    sent = _serve(monkeypatch, [FakeResponse(200, b"page", {"ETag": '"v1"'}), FakeResponse(304)])
+    calls = []
+    before = CONDITIONAL_FETCHES.value(upstream="test", outcome="not_modified")
+
+    first = fetch_parsed("http://upstream/etag", _parser(calls), upstream="test", params={"q": "tv", "key": "s1"})
+    second = fetch_parsed("http://upstream/etag", _parser(calls), upstream="test", params={"q": "tv", "key": "s2"})
+
+    assert first == second == ["PAGE"]
+    assert calls == ["page"]
+    assert sent[1]["If-None-Match"] == '"v1"'
+    assert CONDITIONAL_FETCHES.value(upstream="test", outcome="not_modified") == before + 1
+
+
+def test_identical_body_skips_parsing_and_changed_body_is_reparsed(monkeypatch):
+    _serve(monkeypatch, [FakeResponse(200, b"same"), FakeResponse(200, b"same"), FakeResponse(200, b"new")])
+    calls = []
+
+    results = [fetch_parsed("http://upstream/no-etag", _parser(calls), upstream="test") for _ in range(3)]
+
+    assert results == [["SAME"], ["SAME"], ["NEW"]]
+    assert calls == ["same", "new"]
+
+
+def test_error_responses_are_not_remembered(monkeypatch):
+    sent = _serve(monkeypatch, [FakeResponse(503, b"busy", {"ETag": '"e"'}), FakeResponse(200, b"ok")])
+
+    fetch_parsed("http://upstream/flaky", _parser([]), upstream="test")
+    fetch_parsed("http://upstream/flaky", _parser([]), upstream="test")
+
+    assert "If-None-Match" not in sent[1]
+
+
+def test_state_key_ignores_credentials():
+    assert conditional_fetch.state_key("u", {"q": 1, "key": "a"}) == conditional_fetch.state_key("u", {"q": 1, "key": "b"})
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+
+import httpx
+from fastapi.testclient import TestClient
+
+from backend import geocoding
+from backend.geocoding import Gazetteer, get_gazetteer, normalize_name
+from backend.main import app
+from backend.shared_state import MemoryStore
+
+client = TestClient(app)
+
+
+def test_normalize_name_folds_accents_and_punctuation():
+    assert normalize_name("  São Paulo!") == "sao paulo"
+
+
+def test_search_ranks_exact_matches_then_population_and_honours_qualifiers():
+    gazetteer = get_gazetteer()
+
+    assert [p.display_name for p in gazetteer.search("portland")] == ["Portland, OR, US", "Portland, ME, US"]
+    assert [p.display_name for p in gazetteer.search("Portland, ME")] == ["Portland, ME, US"]
+    assert gazetteer.search("bombay")[0].name == "Mumbai"
+    assert gazetteer.search("new york, ny, usa")[0].name == "New York City"
+
+
+def test_nearest_searches_neighbouring_grid_cells():
+    gazetteer = Gazetteer()
+    gazetteer.add("West", 10.0, 9.99)
+    gazetteer.add("East", 10.0, 11.5)
+    gazetteer.finalize()
+
+    place, km = gazetteer.nearest(10.0, 10.01)  # "West" is in the neighbouring cell
+
+    assert place.name == "West"
+    assert km < 3
+    assert gazetteer.nearest(-40.0, -40.0) is None
+
+
+def test_short_prefixes_rank_the_whole_range_by_population():
+    gazetteer = Gazetteer()
+    for i in range(6000):
+        gazetteer.add(f"Aa Village {i:04d}", 10.0, 10.0, population=100)
+    gazetteer.add("Austin", 30.27, -97.74, "US", "TX", 960000)
+    gazetteer.add("A", 0.0, 0.0, population=1)
+    gazetteer.finalize()
+
+    assert [p.name for p in gazetteer.search("a", limit=2)] == ["A", "Austin"]
+    assert gazetteer.search("a, tx")[0].name == "Austin"
+
+
+def test_nearest_wraps_across_the_antimeridian():
+    gazetteer = Gazetteer()
+    gazetteer.add("Suva", -18.14, 179.9)
+    gazetteer.finalize()
+
+    place, km = gazetteer.nearest(-18.14, -179.9)
+
+    assert place.name == "Suva"
+    assert km < 25
+
+
+class FakeNominatim:
+    status_code = 200
+    headers = {}
+    text = ""
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+def test_falls_back_to_nominatim_when_the_gazetteer_has_no_match(monkeypatch):
+    store = MemoryStore()
+    monkeypatch.setattr(geocoding, "get_store", lambda: store)
+    calls = []
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        calls.append((url.rsplit("/", 1)[-1], headers["User-Agent"]))
+        if url.endswith("/search"):
+            return FakeNominatim([{"lat": "44.48", "lon": "-73.21", "name": "Burlington",
+                                   "display_name": "Burlington, Chittenden County, Vermont, United States",
+                                   "address": {"state": "Vermont", "country_code": "us"}}])
+        return FakeNominatim({"lat": "0.5", "lon": "-150.0", "name": "", "display_name": "Pacific Ocean"})
+
+    monkeypatch.setattr("requests.get", fake_get)
+
+    forward = client.get("/api/geocode", params={"q": "burlington, vt"}).json()["results"]
+    client.get("/api/geocode", params={"q": "burlington, vt"})  # answered from the cache
+    reverse = client.get("/api/reverse-geocode", params={"lat": 0, "lon": -150}).json()
+    known = client.get("/api/geocode", params={"q": "bengaluru"}).json()["results"]
+
+    assert forward[0]["display_name"] == "Burlington, Vermont, US"
+    assert reverse["result"]["name"] == "Pacific Ocean" and 50 < reverse["distance_km"] < 60
+    assert known[0]["display_name"] == "Bengaluru, IN"
+    assert [path for path, _ in calls] == ["search", "reverse"]
+    assert all(agent == geocoding.NOMINATIM_USER_AGENT for _, agent in calls)
+
+
+def test_geocode_endpoints(monkeypatch):
+    monkeypatch.setattr(geocoding, "NOMINATIM_URL", "")
+    forward = client.get("/api/geocode", params={"q": "bengaluru"}).json()["results"]
+    reverse = client.get("/api/reverse-geocode", params={"lat": 40.73, "lon": -73.99})
+
+    assert forward[0]["display_name"] == "Bengaluru, IN"
+    assert reverse.json()["result"]["name"] == "New York City"
+    assert client.get("/api/reverse-geocode", params={"lat": 0, "lon": -150}).status_code == 404
+
+
+def test_gazetteer_load_does_not_block_the_event_loop(monkeypatch):
+    monkeypatch.setattr(geocoding, "_gazetteer", None)
+    locked = threading.Event()
+
+    def slow_load():  # another thread holds the lock for a while, as a big dump load would
+        with geocoding._gazetteer_lock:
+            locked.set()
+            time.sleep(1)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            started = time.perf_counter()
+            lookup = asyncio.ensure_future(http.get("/api/geocode", params={"q": "bengaluru"}))
+            await asyncio.sleep(0.01)  # let the lookup reach the gazetteer
+            health = await http.get("/health")
+            return health, time.perf_counter() - started, await lookup
+
+    loader = threading.Thread(target=slow_load)
+    loader.start()
+    locked.wait()
+    health, health_seconds, lookup = asyncio.run(scenario())
+    loader.join()
+
+    assert health.status_code == 200 and health_seconds < 0.5
+    assert lookup.json()["results"][0]["display_name"] == "Bengaluru, IN"
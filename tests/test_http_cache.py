@@ -0,0 +1,41 @@
+import re
+
+from fastapi.testclient import TestClient
+
+from backend.main import app
+
+client = TestClient(app)
+
+
+def test_index_links_content_hashed_assets():
+    response = client.get("/")
+    versioned = re.search(r'src="script\.js\?v=([0-9a-f]+)"', response.text)
+
+    assert versioned
+    asset = client.get(f"/script.js?v={versioned.group(1)}")
+    assert asset.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert client.get("/script.js").headers["cache-control"] == "no-cache"
+
+
+def test_static_assets_are_gzipped_with_strong_etag():
+    response = client.get("/style.css", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert re.fullmatch(r'"[0-9a-f]+-gzip"', response.headers["etag"])
+    assert "Accept-Encoding" in response.headers["vary"]
+
+
+def test_if_none_match_returns_304():
+    etag = client.get("/style.css", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+
+    response = client.get("/style.css", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_small_responses_are_not_compressed():
+    response = client.get("/health", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.json() == {"status": "healthy"}
@@ -0,0 +1,48 @@
+import httpx
+
+from loadtest.replay import run_replay
+from loadtest.run import check_budgets, free_port, run_load, start_app, wait_healthy
+from loadtest.stubs import StubConfig, StubServer, UpstreamProfile
+
+
+def test_check_budgets_reports_regressions():
+    summaries = {"price": {"p50_ms": 100, "p95_ms": 900, "p99_ms": 1000, "error_rate": 0.0, "throughput_rps": 3}}
+    budgets = {"price": {"p95_ms": 500, "min_throughput_rps": 5}}
+
+    violations = check_budgets(summaries, budgets)
+
+    assert len(violations) == 2
+    assert violations[0].startswith("price: p95_ms")
+
+
+def test_offline_load_run_against_stubs():
+    fast = StubConfig(ebay=UpstreamProfile(), places=UpstreamProfile(), gemini=UpstreamProfile())
+
+    summaries, violations = run_load(["price", "general"], requests=6, concurrency=3, stub_config=fast,
+                                     budgets={"price": {"error_rate": 0}, "general": {"error_rate": 0}})
+
+    assert violations == []
+    assert summaries["price"]["statuses"] == {"200": 6}
+
+
+def test_captured_traffic_replays_without_upstreams(tmp_path):
+    fast = StubConfig(ebay=UpstreamProfile(), places=UpstreamProfile(), gemini=UpstreamProfile())
+    capture_path = str(tmp_path / "capture.jsonl")
+    stub = StubServer(fast).start()
+    port = free_port()
+    app = start_app(port, {**stub.upstream_env(), "CACHE_WARMING": "0", "CAPTURE_PATH": capture_path})
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_healthy(base_url)
+        for query in ("laptop", "phone"):
+            assert httpx.post(f"{base_url}/api/chat/price", json={"query": query}, timeout=30).status_code == 200
+    finally:
+        app.terminate()
+        app.wait(timeout=10)  # the lifespan flushes the capture log
+        stub.stop()
+
+    report = run_replay([capture_path], speed=0, upstream_latency=False)
+
+    assert report["requests"] == 2
+    assert report["upstream_misses"] == 0
+    assert report["replayed"]["/api/chat/price"]["statuses"] == {"200": 2}
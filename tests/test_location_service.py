@@ -0,0 +1,117 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from backend import location_service, main
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.content = json.dumps(payload).encode("utf-8")
+
+    def json(self):
+        return self.payload
+
+
+def make_place(i, lat, lon):
+    return {
+        "place_id": f"p{i}",
+        "name": f"Store {i}",
+        "geometry": {"location": {"lat": lat, "lng": lon}},
+    }
+
+
+def test_paginated_search_stops_once_enough_stores(monkeypatch):
+    pages = {
+        None: {"status": "OK", "next_page_token": "t1",
+               "results": [make_place(i, 40.0 + i * 0.01, -74.0) for i in range(3)]},
+        "t1": {"status": "OK", "next_page_token": "t2",
+               "results": [make_place(i, 40.0 + i * 0.01, -74.0) for i in range(3, 6)]},
+        "t2": {"status": "OK", "results": [make_place(9, 40.0, -74.0)]},
+    }
+    search_calls, detail_calls = [], []
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        if "details" in url:
+            detail_calls.append(params["place_id"])
+            return FakeResponse({"status": "OK", "result": {}})
+        search_calls.append(params.get("pagetoken"))
+        return FakeResponse(pages[params.get("pagetoken")])
+
+    monkeypatch.setattr("requests.get", fake_get)
+    monkeypatch.setattr(location_service, "PAGE_TOKEN_DELAY", 0)
+
+    stores = location_service.perform_places_search(40.0, -74.0, 25000, "key", max_results=4)
+
+    assert [s["place_id"] for s in stores] == ["p0", "p1", "p2", "p3"]
+    assert search_calls == [None, "t1"]  # third page never requested
+    assert detail_calls == ["p0", "p1", "p2", "p3"]
+
+
+def test_paginated_search_skips_details_outside_distance_band(monkeypatch):
+    page = {"status": "OK", "results": [
+        make_place(0, 40.0, -74.0),   # ~0 km
+        make_place(1, 40.05, -74.0),  # ~5.5 km
+    ]}
+    detail_calls = []
+
+    def fake_get(url, params=None, headers=None, timeout=None):
+        if "details" in url:
+            detail_calls.append(params["place_id"])
+            return FakeResponse({"status": "OK", "result": {}})
+        return FakeResponse(page)
+
+    monkeypatch.setattr("requests.get", fake_get)
+
+    stores = location_service.perform_places_search(
+        40.0, -74.0, 25000, "key", min_distance=2, max_distance=10
+    )
+
+    assert [s["place_id"] for s in stores] == ["p1"]
+    assert detail_calls == ["p1"]
+
+
+def test_mock_store_batch_is_reproducible_with_seed():
+    first = location_service.generate_mock_store_batch(37.77, -122.41, "laptop", 0, 25, count=50, seed=7)
+    second = location_service.generate_mock_store_batch(37.77, -122.41, "laptop", 0, 25, count=50, seed=7)
+
+    assert first.to_dicts() == second.to_dicts()
+    assert all(0 <= store.distance <= 25 for store in first)
+    assert first[0].name.endswith("(Demo)")
+
+
+def test_mock_store_batch_scales_to_100k_stores():
+    batch = location_service.generate_mock_store_batch(37.77, -122.41, "phone", 5, 10, count=100_000, seed=1)
+
+    assert len(batch) == 100_000
+    store = batch[99_999]
+    assert 5 <= location_service.calculate_distance(37.77, -122.41, store.latitude, store.longitude) <= 10.01
+
+
+def test_generate_mock_stores_keeps_dict_shape():
+    stores = location_service.generate_mock_stores(37.77, -122.41, "book", 0, 25, seed=3)
+
+    assert 5 <= len(stores) <= 12
+    assert "place_id" not in stores[0]
+    assert stores[0]["is_real_data"] is False
+    assert stores[0]["open_now"] in (True, False, None)
+
+
+def test_nearby_endpoint_pages_only_as_far_as_the_requested_limit(monkeypatch):
+    wanted = []
+
+    def fake_find(**kwargs):
+        wanted.append(kwargs["max_results"])
+        return []
+
+    monkeypatch.setattr(main, "find_nearby_stores", fake_find)
+    client = TestClient(main.app)
+    for limit in (3, 40, 500, None):
+        client.post("/api/chat/nearby-stores",
+                    json={"query": "tv", "latitude": 40.0, "longitude": -74.0, "limit": limit})
+
+    assert wanted == [3, 40, 60, 15]
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.ai_agent import AIModel
+from backend.main import app
+from backend.metrics import GEMINI_TOKENS, Histogram, stage_timer, STAGE_ERRORS
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("demo_seconds", "Demo.", ["stage"], buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    histogram.observe(3, stage="a")
+
+    lines = histogram.render()
+
+    assert 'demo_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 'demo_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{stage="a"} 3' in lines
+
+
+def test_stage_timer_counts_errors():
+    before = STAGE_ERRORS.value(stage="unit_test")
+    with pytest.raises(ValueError):
+        with stage_timer("unit_test"):
+            raise ValueError("boom")
+    assert STAGE_ERRORS.value(stage="unit_test") == before + 1
+
+
+def test_gemini_tokens_are_counted():
+    usage = SimpleNamespace(prompt_token_count=12, candidates_token_count=30)
+    fake_client = SimpleNamespace(models=SimpleNamespace(
+        generate_content=lambda model, contents: SimpleNamespace(text="ok", usage_metadata=usage)))
+    agent = AIModel()
+    agent.client = fake_client
+    before = GEMINI_TOKENS.value(model=agent.models[0], kind="completion")
+
+    assert agent.generate_response("hi") == "ok"
+    assert GEMINI_TOKENS.value(model=agent.models[0], kind="completion") == before + 30
+
+
+def test_metrics_endpoint_exposes_request_latency():
+    client = TestClient(app)
+    client.get("/health")
+
+    body = client.get("/metrics").text
+
+    assert "# TYPE pricebot_request_duration_seconds histogram" in body
+    assert 'pricebot_requests_total{endpoint="/health",status="200"}' in body
+
+
+def test_unknown_api_paths_share_one_label():
+    client = TestClient(app)
+    for n in range(3):
+        assert client.get(f"/api/scan-{n}").status_code == 404
+    client.post("/api/chat/price", json={})  # a real route keeps its template
+
+    body = client.get("/metrics").text
+
+    assert "scan-" not in body
+    assert 'pricebot_requests_total{endpoint="unmatched",status="404"}' in body
+    assert 'pricebot_requests_total{endpoint="/api/chat/price",status="422"}' in body
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from backend import profiling
+from backend.concurrency import run_blocking
+from backend.main import app
+
+client = TestClient(app)
+
+
+def test_api_responses_carry_server_timing():
+    response = client.post("/api/chat/nearby-stores", json={"query": "tv", "latitude": 40.0, "longitude": -74.0})
+
+    assert "total;dur=" in response.headers["server-timing"]
+
+
+def test_profiling_requires_admin_token(monkeypatch):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secret")
+
+    assert client.get("/admin/profile?seconds=0", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/admin/profile?seconds=0", headers={"X-Admin-Token": "s\u00e9cret".encode("latin-1")}).status_code == 403
+
+    response = client.get("/admin/profile?seconds=0.05", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert "attachment" in response.headers["content-disposition"]
+
+
+def test_single_request_profile_is_downloadable(monkeypatch):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secret")
+    admin = {"X-Admin-Token": "secret"}
+
+    response = client.get("/health", headers={**admin, "X-Profile": "1"})
+    profile_id = response.headers["x-profile-id"]
+
+    profile = client.get(f"/admin/profiles/{profile_id}", headers=admin)
+    assert profile.status_code == 200
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in profile.text.splitlines())
+
+
+def test_request_profile_skips_unrelated_threads():
+    def busy(stop, seconds=None):
+        deadline = time.perf_counter() + (seconds or 60)
+        while not stop.is_set() and time.perf_counter() < deadline:
+            pass
+
+    def request_work():
+        busy(threading.Event(), 0.2)
+
+    async def scenario():
+        stop = threading.Event()
+        bystander = threading.Thread(target=busy, args=(stop,), name="bystander")
+        bystander.start()
+        threads = set()
+        token = profiling._profiled_threads.set(threads)
+        profiler = profiling.SamplingProfiler(threads=threads, task=asyncio.current_task()).start()
+        try:
+            await run_blocking("scrape", request_work)
+        finally:
+            profiling._profiled_threads.reset(token)
+            profiler.stop()
+            stop.set()
+            bystander.join()
+        return profiler.folded()
+
+    folded = asyncio.run(scenario())
+
+    assert "request_work" in folded
+    assert "bystander" not in folded
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.concurrency import CLIENT_ID
+from backend.quotas import ClientQuotas, TokenBucket, identify, payer
+
+
+class FakeConnection:
+    def __init__(self, host, headers=None):
+        self.client = type("Address", (), {"host": host})()
+        self.headers = headers or {}
+
+
+def test_bucket_refills_at_rate_up_to_burst():
+    bucket = TokenBucket(rate=100, burst=2)
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert 0 < bucket.take() <= 0.01
+
+    time.sleep(0.05)  # refills 5 tokens' worth, but holds at most 2
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert bucket.take() > 0
+
+
+def test_quotas_are_per_client_and_per_class():
+    quotas = ClientQuotas({"llm": (60, 1)})
+
+    assert quotas.allow("ip:a", "llm")
+    assert not quotas.allow("ip:a", "llm")
+    assert quotas.allow("ip:b", "llm")  # another client is unaffected
+    assert quotas.allow("ip:a", "scrape")  # unlimited class
+
+
+def test_wait_paces_until_deadline():
+    quotas = ClientQuotas({"scrape": (600, 1)})  # one token per 0.1s
+
+    async def scenario():
+        assert await quotas.wait("ip:a", "scrape", time.monotonic() + 1)
+        started = time.monotonic()
+        assert await quotas.wait("ip:a", "scrape", time.monotonic() + 1)
+        assert time.monotonic() - started >= 0.05
+        assert not await quotas.wait("ip:a", "scrape", time.monotonic() + 0.01)
+
+    asyncio.run(scenario())
+
+
+def test_identify_by_ip_and_key_digest_only_when_the_key_pays():
+    client = identify(FakeConnection("10.0.0.1"))
+    assert client == "ip:10.0.0.1"
+    assert CLIENT_ID.get() == client
+
+    own = payer(client, "secret-key")
+    assert own.startswith("key:") and "secret" not in own
+    assert payer(identify(FakeConnection("10.0.0.2")), "secret-key") == own
+    assert payer(client) == client
+
+
+def test_rotating_junk_keys_do_not_bypass_the_scrape_quota(monkeypatch):
+    monkeypatch.setattr(main, "QUOTAS", ClientQuotas({"scrape": (60, 2)}))
+    monkeypatch.setattr(main, "custom_scraper", lambda query, country_code="US": [])
+    client = TestClient(main.app)
+
+    statuses = [client.post("/api/chat/price", json={"query": "tv", "api_key": f"junk-{n}"}).status_code
+                for n in range(4)]
+
+    assert statuses == [200, 200, 429, 429]
+
+
+def test_client_over_quota_gets_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(main, "QUOTAS", ClientQuotas({"llm": (60, 0)}))
+    client = TestClient(main.app)
+
+    response = client.post("/api/chat/general", json={"message": "hi"})
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,32 @@
+from backend.location_service import generate_mock_store_batch
+from backend.ranking import RankingWeights, rank_batch, rank_stores
+
+
+def make_store(name, distance, rating=4.0, total_ratings=100, open_now=True, stock_level="In Stock"):
+    return {"name": name, "distance": distance, "rating": rating, "total_ratings": total_ratings,
+            "open_now": open_now, "stock_level": stock_level}
+
+
+def test_rank_stores_balances_distance_against_quality():
+    stores = [
+        make_store("near but poor", 1.0, rating=2.0, total_ratings=3, open_now=False, stock_level="Call to Verify"),
+        make_store("bit further, great", 3.0, rating=4.9, total_ratings=4000),
+    ]
+
+    ranked = rank_stores(stores, max_distance=25)
+
+    assert [s["name"] for s in ranked] == ["bit further, great", "near but poor"]
+    assert ranked[0]["score"] > ranked[1]["score"]
+
+
+def test_distance_only_weights_reproduce_distance_order():
+    stores = [make_store(str(d), d) for d in (7.0, 2.0, 5.0)]
+    weights = RankingWeights.from_dict({"distance": 1, "rating": 0, "total_ratings": 0, "open_now": 0, "stock": 0})
+
+    assert [s["name"] for s in rank_stores(stores, weights=weights)] == ["2.0", "5.0", "7.0"]
+
+
+def test_top_k_matches_full_ranking_prefix():
+    batch = generate_mock_store_batch(40.0, -74.0, "tv", 0, 25, count=2000, seed=11)
+
+    assert rank_batch(batch, k=10) == rank_batch(batch)[:10]
@@ -0,0 +1,22 @@
+import time
+
+from backend.records import StoreBatch, StoreRecord
+
+
+def _store(name, stock_level="In Stock"):
+    return StoreRecord(name=name, address="1 Main St", distance=1.0, latitude=0.0, longitude=0.0, rating=4.0,
+                       total_ratings=10, open_now=None, phone="", website="", has_product=True,
+                       stock_level=stock_level, price="$1", is_real_data=False)
+
+
+def test_batch_holds_more_distinct_names_than_a_short_code_allows():
+    batch = StoreBatch(names=["Seeded Chain"])
+    started = time.perf_counter()
+    for i in range(70000):
+        batch.append(_store(f"Store {i}"))
+    batch.append(_store("Seeded Chain", "Low Stock"))
+
+    assert time.perf_counter() - started < 5  # linear, not a scan per append
+    assert len(batch.names) == 70001
+    assert batch[69999].name == "Store 69999"
+    assert batch[70000].name == "Seeded Chain" and batch[70000].stock_level == "Low Stock"
@@ -0,0 +1,25 @@
+import json
+
+from backend.responses import FastJSONResponse, PriceComparisonResponse
+from loadtest.serialization import price_payload, run_benchmark, stores_payload
+
+
+def test_fast_response_matches_standard_json():
+    for payload in (price_payload(20), stores_payload(20)):
+        assert json.loads(FastJSONResponse(payload).body) == payload
+
+
+def test_price_payload_conforms_to_response_model():
+    payload = price_payload(5)
+
+    assert PriceComparisonResponse.model_validate(payload).model_dump(exclude_none=True) == payload
+
+
+def test_fast_response_handles_types_orjson_rejects():
+    assert json.loads(FastJSONResponse({"tags": {"a"}}).body) == {"tags": ["a"]}
+
+
+def test_serialization_benchmark_runs():
+    rows = run_benchmark(repeat=1, sizes=(10,))
+
+    assert [(row["payload"], row["items"]) for row in rows] == [("price", 10), ("stores", 10)]
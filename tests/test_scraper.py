@@ -0,0 +1,107 @@
+import random
+
+from backend import scraper
+from backend.scraper import CheapestListings, is_relevant, parse_ebay_results, parse_shipping, query_terms
+from loadtest.stubs import StubServer, ebay_search_page
+
+
+def test_cheapest_listings_keeps_k_lowest_landed_cost():
+    costs = list(range(1000))
+    random.Random(3).shuffle(costs)
+    cheapest = CheapestListings(5)
+
+    cheapest.extend({"landed_cost": float(cost), "title": str(cost)} for cost in costs)
+
+    assert [item["landed_cost"] for item in cheapest.items()] == [0, 1, 2, 3, 4]
+
+
+def test_parse_shipping():
+    assert parse_shipping("Free shipping") == 0.0
+    assert parse_shipping("+$12.50 shipping") == 12.5
+    assert parse_shipping("Calculated") is None
+
+
+def test_parse_ebay_results_filters_irrelevant_titles_and_ranks_by_landed_cost():
+    html = ebay_search_page("sony headphones", 40)
+
+    relevant = parse_ebay_results(html, limit=5, terms=["sony", "headphones"])
+    unrelated = parse_ebay_results(html, limit=5, terms=["laptop"])
+
+    costs = [item["landed_cost"] for item in relevant]
+    assert len(relevant) == 5 and costs == sorted(costs)
+    assert unrelated == []
+
+
+def test_scrape_ebay_merges_pages_fetched_concurrently(monkeypatch):
+    stub = StubServer().start()
+    monkeypatch.setattr(scraper, "EBAY_BASE_URL", stub.base_url)
+    try:
+        deep = scraper.scrape_ebay("4k tv", pages=3, limit=6)
+        shallow = scraper.scrape_ebay("4k tv", pages=1, limit=6)
+    finally:
+        stub.stop()
+
+    assert len(deep) == 6
+    assert {item["title"].split(" - listing ")[1][0] for item in deep} <= {"1", "2", "3"}
+    assert deep[0]["landed_cost"] <= shallow[0]["landed_cost"]
+    assert stub.calls["/sch/i.html"] == 4
+
+
+def test_revalidated_page_is_not_cut_to_a_previous_callers_limit(monkeypatch):
+    stub = StubServer().start()
+    monkeypatch.setattr(scraper, "EBAY_BASE_URL", stub.base_url)
+    try:
+        few = scraper.scrape_ebay("oled tv", pages=1, limit=8)
+        more = scraper.scrape_ebay("oled tv", pages=1, limit=20)
+    finally:
+        stub.stop()
+
+    assert len(few) == 8
+    assert len(more) == 20
+
+
+def test_relevance_tolerates_stopwords_units_and_plurals():
+    assert is_relevant("Apple EarPods Headphone with Lightning Connector, iPhone",
+                       query_terms("headphones for iphone"))
+    assert is_relevant('Samsung 55" Class Crystal UHD 4K Smart TV', query_terms("Samsung 4K TV 55 inch"))
+    assert not is_relevant("Logitech Wireless Mouse M185", query_terms("Samsung 4K TV 55 inch"))
+
+
+def test_relevance_can_require_only_a_fraction_of_terms():
+    terms = query_terms("sony wh-1000xm5 noise cancelling headphones")
+    title = "Sony WH1000XM5 Wireless Noise Canceling Headphones - Black"
+
+    assert not is_relevant(title, terms, min_match=1.0)  # spelled "Canceling" in the title
+    assert is_relevant(title, terms, min_match=0.5)
+
+
+def test_default_filter_drops_listings_matching_under_half_the_terms():
+    html = "".join(
+        f'<li class="s-item"><a class="s-item__link" href="https://www.ebay.com/itm/{price}">'
+        f'<div class="s-item__title"><span>{title}</span></div></a>'
+        f'<span class="s-item__price">${price}</span><span class="s-item__shipping">Free shipping</span></li>'
+        for title, price in [("HDMI Cable 6ft", 5), ('Samsung 55" Class Crystal UHD 4K Smart TV', 399),
+                             ("Remote for Samsung TV", 9)]
+    )
+
+    titles = [item["title"] for item in parse_ebay_results(html, limit=5, terms=query_terms("samsung 4k tv 55 inch"))]
+
+    assert scraper.EBAY_RELEVANCE_MIN_MATCH == 0.5
+    assert "HDMI Cable 6ft" not in titles
+    assert 'Samsung 55" Class Crystal UHD 4K Smart TV' in titles
+
+
+def test_relevance_setting_is_part_of_the_remembered_parse(monkeypatch):
+    stub = StubServer().start()
+    monkeypatch.setattr(scraper, "EBAY_BASE_URL", stub.base_url)
+    seen = []
+    real_fetch = scraper.fetch_parsed
+    monkeypatch.setattr(scraper, "fetch_parsed", lambda *a, **kw: seen.append(kw["variant"]) or real_fetch(*a, **kw))
+    try:
+        scraper.scrape_ebay("drone", pages=1, limit=5)
+        monkeypatch.setattr(scraper, "EBAY_RELEVANCE_MIN_MATCH", 0)
+        scraper.scrape_ebay("drone", pages=1, limit=5)
+    finally:
+        stub.stop()
+
+    assert seen[0] != seen[1]
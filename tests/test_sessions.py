@@ -0,0 +1,58 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from backend import sessions
+from backend.main import app
+from backend.sessions import ChatSession, SessionStore
+
+
+def test_old_turns_are_folded_into_a_bounded_summary():
+    session = ChatSession("s")
+    for i in range(100):
+        session.add_turn("user", f"Question number {i} about laptops. More detail follows here.")
+        session.add_turn("model", f"Answer {i}. With an explanation.")
+
+    assert len(session.turns) == sessions.RECENT_TURNS
+    assert len(session.summary) <= sessions.SUMMARY_MAX_CHARS
+    assert "More detail" not in session.summary
+    assert session.context().startswith("Earlier in this conversation: ")
+    assert session.context().endswith("model: Answer 99. With an explanation.")
+
+
+def test_store_evicts_least_recently_used_and_idle_sessions():
+    store = SessionStore(max_sessions=2, idle_ttl=0.05)
+    first = store.get_or_create()
+    second = store.get_or_create()
+    assert store.get_or_create(first.session_id) is first
+
+    store.get_or_create()  # evicts `second`, the least recently used
+    assert store.get_or_create(second.session_id) is not second
+
+    time.sleep(0.1)
+    assert store.get_or_create(first.session_id) is not first
+    assert len(store) == 1
+
+
+def test_websocket_chat_keeps_history_on_the_server(monkeypatch):
+    contexts = []
+
+    def fake_generate(self, prompt, context=None):
+        contexts.append(context)
+        return f"echo: {prompt}"
+
+    monkeypatch.setattr("backend.ai_agent.AIModel.generate_response", fake_generate)
+
+    with TestClient(app).websocket_connect("/ws/chat") as ws:
+        session_id = ws.receive_json()["session_id"]
+        ws.send_json({"message": "hello"})
+        assert ws.receive_json() == {"type": "response", "response": "echo: hello"}
+        ws.send_text("not json")
+        assert ws.receive_json()["type"] == "error"
+
+    with TestClient(app).websocket_connect(f"/ws/chat?session_id={session_id}") as ws:
+        assert ws.receive_json()["session_id"] == session_id
+        ws.send_json({"message": "and again"})
+        ws.receive_json()
+
+    assert contexts == ["", "user: hello\nmodel: echo: hello"]
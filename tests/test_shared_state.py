@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from backend.concurrency import DEADLINE
+from backend.shared_state import MemoryStore, SQLiteStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStore()
+    return SQLiteStore(str(tmp_path / "state.db"))
+
+
+def test_values_expire_after_ttl(store):
+    store.set("k", {"a": [1, 2]}, ttl=0.05)
+
+    assert store.get("k") == {"a": [1, 2]}
+    time.sleep(0.1)
+    assert store.get("k") is None
+
+
+def test_ttl_reports_remaining_lifetime(store):
+    store.set("k", 1, ttl=0.05)
+
+    assert 0 < store.ttl("k") <= 0.05
+    assert store.ttl("missing") is None
+    time.sleep(0.1)
+    assert store.ttl("k") is None
+
+
+def test_add_only_sets_absent_keys(store):
+    assert store.add("lease", 1, ttl=10) is True
+    assert store.add("lease", 2, ttl=10) is False
+    assert store.get("lease") == 1
+
+
+def test_incr_never_lets_concurrent_callers_pass_the_limit(store):
+    granted = []
+
+    def claim():
+        for _ in range(20):
+            if store.incr("budget", 3, ttl=60, limit=100) is not None:
+                granted.append(3)
+
+    threads = [threading.Thread(target=claim) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(granted) == store.get("budget") == 99
+    assert store.incr("budget", 2, ttl=60, limit=100) is None
+    assert store.incr("budget", 1, ttl=60, limit=100) == 100
+
+
+def test_incr_keeps_the_counters_first_expiry(store):
+    assert store.incr("budget", 1, ttl=0.1) == 1
+    time.sleep(0.06)
+    assert store.incr("budget", 1, ttl=60) == 2
+    time.sleep(0.06)
+    assert store.get("budget") is None
+
+
+def test_get_or_compute_runs_concurrent_misses_once(store):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return ["listing"]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.get_or_compute("ebay:tv", 60, compute)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [["listing"]] * 5
+    assert len(calls) == 1
+
+
+def test_empty_results_are_not_cached(store):
+    assert store.get_or_compute("ebay:none", 60, lambda: []) == []
+    assert store.get_or_compute("ebay:none", 60, lambda: ["found"]) == ["found"]
+
+
+def test_sqlite_state_is_shared_between_connections(tmp_path):
+    path = str(tmp_path / "state.db")
+    SQLiteStore(path).set("gemini_cooldown:x", 1.0, ttl=60)
+
+    assert SQLiteStore(path).get("gemini_cooldown:x") == 1.0
+
+
+def test_sqlite_store_setup_does_not_leak_connections(tmp_path, monkeypatch):
+    opened = []
+    real_connect = SQLiteStore._connect
+
+    def tracking_connect(self):
+        conn = real_connect(self)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(SQLiteStore, "_connect", tracking_connect)
+    SQLiteStore(str(tmp_path / "state.db"))
+
+    with pytest.raises(sqlite3.ProgrammingError):  # closed
+        opened[0].execute("SELECT 1")
+
+
+def test_waiter_gives_up_at_callers_deadline(store):
+    store.add("lease:slow", 1, ttl=10)  # another caller is computing
+    token = DEADLINE.set(time.monotonic() + 0.1)
+    started = time.monotonic()
+    try:
+        with pytest.raises(TimeoutError):
+            store.get_or_compute("slow", 60, lambda: "late")
+    finally:
+        DEADLINE.reset(token)
+
+    assert time.monotonic() - started < 1
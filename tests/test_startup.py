@@ -0,0 +1,18 @@
+from backend.server import RestartPolicy
+from loadtest.startup import measure_import
+
+
+def test_importing_the_app_does_not_load_heavy_sdks():
+    result = measure_import()
+
+    assert result["heavy"] == []
+
+
+def test_workers_dying_at_startup_back_off_then_give_up():
+    policy = RestartPolicy(fast_seconds=10, base_delay=0.5, max_delay=2, max_fast_deaths=4)
+
+    assert [policy.delay(1) for _ in range(4)] == [0.5, 1.0, 2, None]
+
+    policy.fast_deaths = 2
+    assert policy.delay(60) == 0.0  # a worker that ran a while resets the streak
+    assert policy.delay(1) == 0.5
@@ -0,0 +1,95 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from backend import circuit_breaker, warming
+from backend.circuit_breaker import CircuitBreaker
+from backend.scraper import ebay_cache_key
+from backend.shared_state import MemoryStore
+from backend.warming import TrafficRecorder, WarmingScheduler, in_windows, parse_windows
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = MemoryStore()
+    monkeypatch.setattr(warming, "get_store", lambda: store)
+    monkeypatch.setattr("backend.scraper.get_store", lambda: store)
+    return store
+
+
+@pytest.fixture
+def scrapes(monkeypatch):
+    calls = []
+
+    def fake_scrape(query, pages=None, limit=None):
+        calls.append(query)
+        return [{"title": query, "price": "$10.00"}]
+
+    monkeypatch.setattr("backend.scraper.scrape_ebay", fake_scrape)
+    return calls
+
+
+def test_recorder_ranks_by_decayed_popularity():
+    recorder = TrafficRecorder(half_life=60)
+    for _ in range(4):
+        recorder.record(("price", "old"), {"query": "old"}, now=0)
+    recorder.record(("price", "new"), {"query": "new"}, now=180)
+    recorder.record(("price", "new"), {"query": "new"}, now=180)
+
+    top = recorder.top("price", 5, now=180)
+    assert [params["query"] for params, _ in top] == ["new", "old"]  # 4 hits, 3 half-lives ago = 0.5
+    assert top[1][1] == pytest.approx(0.5)
+
+
+def test_recorder_groups_nearby_searches_by_cell():
+    recorder = TrafficRecorder()
+    recorder.record_nearby(40.71281, -74.00601, "Laptop", 0, 25)
+    recorder.record_nearby(40.71279, -74.00598, "laptop ", 0, 25)
+    (params, score), = recorder.top("nearby", 5)
+    assert score == pytest.approx(2, rel=1e-3)
+    assert (params["lat"], params["lon"]) == (40.713, -74.006)
+
+
+def test_windows_wrap_past_midnight():
+    windows = parse_windows("22:00-02:00, 13:00-14:00")
+    assert windows == [(1320, 120), (780, 840)]
+    assert in_windows(windows, datetime(2024, 1, 1, 23, 30))
+    assert in_windows(windows, datetime(2024, 1, 1, 1, 59))
+    assert in_windows(windows, datetime(2024, 1, 1, 13, 0))
+    assert not in_windows(windows, datetime(2024, 1, 1, 9, 0))
+    assert in_windows([], datetime(2024, 1, 1, 9, 0))
+
+
+def test_cycle_refreshes_missing_and_expiring_entries_within_budget(store, scrapes):
+    recorder = TrafficRecorder()
+    for query, hits in (("tv", 3), ("laptop", 2), ("phone", 1)):
+        for _ in range(hits):
+            recorder.record_price(query)
+    store.set(ebay_cache_key("laptop"), [{"title": "cached"}], ttl=3600)  # fresh: not due
+    scheduler = WarmingScheduler(recorder, interval=60, windows="", call_budget=1, refresh_ahead=60)
+
+    stats = asyncio.run(scheduler.run_cycle())
+
+    assert stats == {"due": 2, "refreshed": 1, "failed": 0, "skipped": 1}
+    assert scrapes == ["tv"]  # most popular first; the budget ran out before "phone"
+    assert store.get(ebay_cache_key("tv")) == [{"title": "tv", "price": "$10.00"}]
+
+    # The cycle lease stops another worker (or an early rerun) from warming again
+    assert asyncio.run(scheduler.run_cycle())["due"] == 0
+
+
+def test_cycle_skips_outside_window_and_open_upstreams(store, scrapes, monkeypatch):
+    recorder = TrafficRecorder()
+    recorder.record_price("tv")
+
+    closed_hours = WarmingScheduler(recorder, windows="02:00-03:00")
+    assert asyncio.run(closed_hours.run_cycle(now=datetime(2024, 1, 1, 12, 0)))["due"] == 0
+
+    ebay = CircuitBreaker("ebay", min_calls=1, open_seconds=60)
+    ebay.allow()
+    ebay.record(False, 0.1)
+    monkeypatch.setitem(circuit_breaker.BREAKERS, "ebay", ebay)
+    stats = asyncio.run(WarmingScheduler(recorder, windows="").run_cycle())
+    assert stats["skipped"] == 1
+    assert scrapes == []